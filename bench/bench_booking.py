@@ -0,0 +1,65 @@
+"""Bookings per second through /quote/book with and without group commit
+
+    python -m bench.bench_booking --threads 16 --bookings 2000 [--database-url postgresql://...]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('SECRET_KEY', 'bench')
+
+from src.app import app, db
+
+
+def run(threads, bookings, group_commit):
+    app.config['GROUP_COMMIT_ENABLED'] = group_commit
+    per_thread = bookings // threads
+    errors = []
+
+    def worker(index):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        for i in range(per_thread):
+            resp = client.post('/quote/book', json={'origin': 'SHA', 'destination': f'P{index}-{i}',
+                                                    'container_type': '40HQ'})
+            if resp.status_code != 200:
+                errors.append(resp.status_code)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='訂艙寫入吞吐量基準測試')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--bookings', type=int, default=2000)
+    parser.add_argument('--window-ms', type=float, default=5)
+    parser.add_argument('--database-url', help='默認使用臨時SQLite文件')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='shipping_quote_bench_') as workdir:
+        app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        app.config['GROUP_COMMIT_WINDOW_MS'] = args.window_ms
+        with app.app_context():
+            db.create_all()
+            for group_commit in (False, True):
+                rate, errors = run(args.threads, args.bookings, group_commit)
+                label = 'group commit' if group_commit else 'per-request commit'
+                print(f'{label:>20}: {rate:8.1f} bookings/s' + (f'  errors={len(errors)}' if errors else ''))
+            # 刪除臨時目錄前釋放數據庫連接
+            db.engine.dispose()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
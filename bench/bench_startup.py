@@ -0,0 +1,157 @@
+"""Import time and per-worker memory of the web app
+
+    python -m bench.bench_startup [--repeat 5] [--workers 4]
+
+Import time and RSS are measured in fresh interpreters, once for the app alone and
+once with pandas and reportlab loaded as the import and PDF endpoints do on first
+use. When gunicorn is installed, it is also started with and without preload, and
+the RSS and PSS (proportional set size, shared pages split between processes) of
+each worker are read from /proc.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+HEAVY_MODULES = ('pandas', 'reportlab', 'pyarrow', 'openpyxl')
+
+IMPORT_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import src.app
+elapsed = time.perf_counter() - started
+if {heavy}:
+    import src.importers, src.analytics
+    from reportlab.pdfgen import canvas
+with open('/proc/self/status') as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+print(json.dumps({{'seconds': elapsed, 'rss_kb': rss,
+                  'heavy': [name for name in {modules!r} if name in sys.modules]}}))
+'''
+
+
+def _env(**extra):
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR, **extra)
+    env.setdefault('SECRET_KEY', 'bench')
+    return env
+
+
+def measure_import(heavy, repeat):
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', IMPORT_PROBE.format(heavy=heavy, modules=HEAVY_MODULES)],
+                                cwd=ROOT_DIR, env=_env(), check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'seconds': statistics.median(run['seconds'] for run in runs),
+        'rss_mb': statistics.median(run['rss_kb'] for run in runs) / 1024,
+        'heavy': runs[-1]['heavy'],
+    }
+
+
+def _memory_kb(pid):
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in ('Rss', 'Pss'):
+                    values[name] = int(rest.split()[0])
+    except FileNotFoundError:
+        pass
+    return values
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # 進程名可能含空格，父進程號在最後一個右括號之後的第二個字段
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def measure_gunicorn(workers, preload, timeout=60):
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}', 'src.app:app'],
+        cwd=ROOT_DIR, env=_env(GUNICORN_PRELOAD='1' if preload else '0'),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=1).read()
+                break
+            except (urllib.error.URLError, ConnectionError):
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.05)
+        # 等待所有工作進程完成啟動
+        while len(_children(process.pid)) < workers and time.monotonic() < deadline:
+            time.sleep(0.05)
+        ready = time.perf_counter() - started
+        time.sleep(1)
+        memory = [_memory_kb(pid) for pid in _children(process.pid)]
+        master = _memory_kb(process.pid)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {
+        'ready_seconds': ready,
+        'master_rss_mb': master.get('Rss', 0) / 1024,
+        'worker_rss_mb': statistics.mean(m.get('Rss', 0) for m in memory) / 1024 if memory else 0,
+        'worker_pss_mb': statistics.mean(m.get('Pss', 0) for m in memory) / 1024 if memory else 0,
+        'workers': len(memory),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='應用啟動時間及工作進程內存基準測試')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    print(f'{"import":<28}{"seconds":>10}{"RSS MB":>10}  heavy modules loaded')
+    for label, heavy in (('app', False), ('app + import/PDF libraries', True)):
+        result = measure_import(heavy, args.repeat)
+        print(f'{label:<28}{result["seconds"]:>10.3f}{result["rss_mb"]:>10.1f}  {", ".join(result["heavy"]) or "-"}')
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print('未安裝gunicorn，跳過工作進程內存測試')
+        return 0
+    print(f'\n{"gunicorn":<28}{"ready s":>10}{"master MB":>11}{"worker RSS":>12}{"worker PSS":>12}')
+    for preload in (False, True):
+        result = measure_gunicorn(args.workers, preload)
+        label = f'{result["workers"]} workers' + (', preload' if preload else '')
+        print(f'{label:<28}{result["ready_seconds"]:>10.2f}{result["master_rss_mb"]:>11.1f}'
+              f'{result["worker_rss_mb"]:>12.1f}{result["worker_pss_mb"]:>12.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""Latency percentiles and throughput per scenario on a seeded synthetic tariff
+
+    python -m bench.bench_suite [--database-url postgresql://... --allow-drop] [--ports 200 --routes 2000 ...]
+                                [--only get_rate,admin_rates] [--save-baseline bench/baseline.json]
+                                [--baseline bench/baseline.json --tolerance 0.2]
+
+Requests go through the Flask test client, so the numbers cover the view, caches and
+database but not the network or WSGI server. With --baseline, scenarios whose p50 or
+p90 got slower by more than the tolerance are reported and the exit status is 1.
+
+The suite drops and recreates every table in the target database. It runs against a
+temporary SQLite file by default; a --database-url is refused unless --allow-drop is
+also given.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+os.environ.setdefault('SECRET_KEY', 'bench')
+
+from src.app import app, db
+from src.quote_log import quote_log
+from bench.datagen import Scale, generate, write_rate_file, write_schedule_file, port_code
+
+PERCENTILES = (50, 90, 99)
+# 與基準比較的百分位數
+COMPARED = ('p50_ms', 'p90_ms')
+
+
+class Scenario:
+    """One benchmarked operation; prepare() runs once, then call(i) per timed iteration"""
+
+    iterations = 200
+    warmup = 20
+    # 每次迭代處理的行數，用於報告行吞吐量
+    rows = None
+
+    def __init__(self, client, dataset, rng, workdir):
+        self.client = client
+        self.dataset = dataset
+        self.rng = rng
+        self.workdir = workdir
+
+    def prepare(self):
+        pass
+
+    def call(self, i):
+        raise NotImplementedError
+
+    def lane(self):
+        return self.dataset.lanes[self.rng.integers(len(self.dataset.lanes))]
+
+    def _check(self, resp, status=200):
+        if resp.status_code != status:
+            raise RuntimeError(f'{type(self).__name__}: HTTP {resp.status_code}')
+        return resp
+
+
+class GetRate(Scenario):
+    def call(self, i):
+        origin, destination, container_type = self.lane()
+        self._check(self.client.post('/quote/get_rate', data={
+            'origin_port': origin, 'destination_port': destination, 'container_type': container_type}))
+
+
+class GetRateConverted(Scenario):
+    def call(self, i):
+        origin, destination, container_type = self.lane()
+        self._check(self.client.get('/quote/rate', query_string={
+            'origin_port': origin, 'destination_port': destination, 'container_type': container_type,
+            'currency': 'EUR'}))
+
+
+class GetRatesBatch(Scenario):
+    iterations = 50
+    warmup = 5
+    rows = 500
+
+    def call(self, i):
+        lanes = [list(self.lane()) for _ in range(self.rows)]
+        self._check(self.client.post('/quote/get_rates', json={'items': lanes}))
+
+
+class AiQuery(Scenario):
+    def call(self, i):
+        origin, destination, container_type = self.lane()
+        query = (f'請提供從{port_code(origin - 1)}到{port_code(destination - 1)}的'
+                 f'{self.dataset.container_codes[container_type - 1]}運費')
+        self._check(self.client.post('/quote/process_ai_query', data={'query': query}))
+
+
+class BookingPdf(Scenario):
+    """Cold renders: every iteration asks for a booking that has not been rendered yet"""
+
+    warmup = 0
+
+    def prepare(self):
+        self.iterations = min(self.iterations, len(self.dataset.booking_ids))
+
+    def call(self, i):
+        self._check(self.client.get(f'/quote/{self.dataset.booking_ids[i]}/pdf'))
+
+
+class AdminRates(Scenario):
+    def call(self, i):
+        origin = self.lane()[0] if i % 2 else ''
+        self._check(self.client.get('/admin/api/rates', query_string={'origin_port': origin}))
+
+
+class AdminSchedules(Scenario):
+    def call(self, i):
+        origin = self.lane()[0] if i % 2 else ''
+        self._check(self.client.get('/admin/api/schedules', query_string={'origin_port': origin}))
+
+
+class _Import(Scenario):
+    iterations = 3
+    warmup = 1
+    rows = 20000
+    url = None
+
+    def write_file(self, path, i):
+        raise NotImplementedError
+
+    def call(self, i):
+        path = os.path.join(self.workdir, f'{type(self).__name__}_{i}.csv')
+        self.write_file(path, i)
+        with open(path, 'rb') as f:
+            resp = self._check(self.client.post(self.url, data={'file': (f, 'sheet.csv')},
+                                                headers={'Accept': 'application/json'}), 202)
+        job = self.client.get(resp.get_json()['status_url']).get_json()['job']
+        if job.get('status') != 'completed':
+            raise RuntimeError(f'{type(self).__name__}: import {job.get("status")}')
+
+
+class ImportRates(_Import):
+    url = '/admin/import/rates'
+
+    def write_file(self, path, i):
+        write_rate_file(path, self.dataset, self.rows, seed=self.dataset.seed + i)
+
+
+class ImportSchedules(_Import):
+    url = '/admin/import/schedules'
+
+    def write_file(self, path, i):
+        write_schedule_file(path, self.dataset, self.rows, seed=self.dataset.seed + i)
+
+
+SCENARIOS = {
+    'get_rate': GetRate,
+    'get_rate_converted': GetRateConverted,
+    'get_rates_batch': GetRatesBatch,
+    'process_ai_query': AiQuery,
+    'booking_pdf': BookingPdf,
+    'admin_rates': AdminRates,
+    'admin_schedules': AdminSchedules,
+    'import_rates': ImportRates,
+    'import_schedules': ImportSchedules,
+}
+
+
+def measure(scenario):
+    scenario.prepare()
+    for i in range(scenario.warmup):
+        scenario.call(i)
+    timings = np.empty(scenario.iterations)
+    started = time.perf_counter()
+    for i in range(scenario.iterations):
+        start = time.perf_counter()
+        scenario.call(i)
+        timings[i] = time.perf_counter() - start
+    elapsed = time.perf_counter() - started
+
+    result = {f'p{p}_ms': round(float(np.percentile(timings, p)) * 1000, 3) for p in PERCENTILES}
+    result['mean_ms'] = round(float(timings.mean()) * 1000, 3)
+    result['ops_per_s'] = round(scenario.iterations / elapsed, 1)
+    if scenario.rows:
+        result['rows_per_s'] = round(scenario.rows * scenario.iterations / elapsed, 1)
+    result['iterations'] = scenario.iterations
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Regressions as (scenario, metric, baseline, current) beyond the tolerance"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        for metric in COMPARED:
+            if before.get(metric) and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append((name, metric, before[metric], result[metric]))
+    return regressions
+
+
+def report(results, baseline=None):
+    header = f'{"scenario":<20}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"ops/s":>10}{"rows/s":>12}'
+    if baseline:
+        header += f'{"p50 vs base":>14}'
+    print(header)
+    for name, result in results.items():
+        line = (f'{name:<20}{result["p50_ms"]:>10.2f}{result["p90_ms"]:>10.2f}{result["p99_ms"]:>10.2f}'
+                f'{result["ops_per_s"]:>10.1f}{result.get("rows_per_s", ""):>12}')
+        before = (baseline or {}).get('results', {}).get(name)
+        if before and before.get('p50_ms'):
+            line += f'{(result["p50_ms"] / before["p50_ms"] - 1) * 100:>+13.1f}%'
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='報價系統性能基準測試')
+    parser.add_argument('--database-url', help='默認使用臨時SQLite文件；可指向本地Postgres，須同時指定 --allow-drop')
+    parser.add_argument('--allow-drop', action='store_true', help='允許清空並重建 --database-url 指向的數據庫')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ports', type=int, default=Scale().ports)
+    parser.add_argument('--routes', type=int, default=Scale().routes)
+    parser.add_argument('--rates-per-lane', type=int, default=Scale().rates_per_lane)
+    parser.add_argument('--sailings-per-route', type=int, default=Scale().sailings_per_route)
+    parser.add_argument('--surcharges', type=int, default=Scale().surcharges)
+    parser.add_argument('--bookings', type=int, default=Scale().bookings)
+    parser.add_argument('--import-rows', type=int, default=_Import.rows, help='導入場景每個文件的行數')
+    parser.add_argument('--only', help='逗號分隔的場景名稱：' + ','.join(SCENARIOS))
+    parser.add_argument('--iterations', type=int, help='覆蓋每個場景的迭代次數')
+    parser.add_argument('--baseline', help='與此JSON基準比較')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允許的變慢比例，默認0.2')
+    parser.add_argument('--save-baseline', help='將結果保存為JSON基準')
+    args = parser.parse_args(argv)
+
+    names = args.only.split(',') if args.only else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error('未知的場景：' + ','.join(unknown))
+    if args.database_url and not args.allow_drop:
+        parser.error('基準測試會刪除並重建 --database-url 中的所有資料表，確認可清空後加上 --allow-drop')
+
+    workdir = tempfile.mkdtemp(prefix='shipping_quote_bench_')
+    database_url = args.database_url or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    app.config.update({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'IMPORT_JOB_EXECUTOR': 'inline',
+        'PDF_RENDER_EXECUTOR': 'inline',
+        'PDF_CACHE_DIR': os.path.join(workdir, 'pdfs'),
+        'DATA_VERSION_FILE': os.path.join(workdir, 'data_version'),
+        'RATE_SNAPSHOT_FILE': os.path.join(workdir, 'rates.snapshot'),
+    })
+    scale = Scale(args.ports, args.routes, args.rates_per_lane, args.sailings_per_route, args.surcharges,
+                  args.bookings)
+
+    try:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            started = time.perf_counter()
+            dataset = generate(db.engine, scale, seed=args.seed)
+            print(f'生成數據：{len(dataset.lanes)} 條運費航線，{time.perf_counter() - started:.1f} 秒')
+
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['username'] = 'bench'
+                sess['role'] = 'admin'
+
+            results = {}
+            for name in names:
+                scenario = SCENARIOS[name](client, dataset, np.random.default_rng(args.seed), workdir)
+                if args.iterations:
+                    scenario.iterations = args.iterations
+                if isinstance(scenario, _Import):
+                    scenario.rows = args.import_rows
+                results[name] = measure(scenario)
+    finally:
+        # 寫完緩衝的報價日誌並釋放數據庫連接後刪除工作目錄，避免每次運行在臨時目錄留下數據庫和 PDF
+        quote_log.flush()
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({'database': database_url.split(':', 1)[0], 'scale': scale._asdict(), 'seed': args.seed,
+                       'import_rows': args.import_rows,
+                       'results': results}, f, indent=2, ensure_ascii=False)
+
+    if baseline:
+        if baseline.get('scale') != scale._asdict():
+            print('注意：基準的數據規模與本次不同')
+        regressions = compare(results, baseline, args.tolerance)
+        for name, metric, before, after in regressions:
+            print(f'變慢：{name} {metric} {before:.2f} -> {after:.2f} ms')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
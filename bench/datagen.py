@@ -0,0 +1,153 @@
+"""Seeded synthetic tariff data for benchmarks
+
+    generate(engine, Scale(ports=200, routes=2000, ...), seed=0)
+
+The same seed and scale always produce the same rows, so runs against SQLite and
+Postgres (or before and after a change) price the same lanes. Rows are inserted in
+order into freshly created tables, so their ids are 1..n and are not written explicitly.
+"""
+from collections import namedtuple
+from datetime import date, timedelta
+import csv
+import numpy as np
+from src.models import (User, Port, ContainerType, Route, BaseRate, Surcharge, RateSurcharge, ExchangeRate,
+                        VesselSchedule, Booking)
+
+Scale = namedtuple('Scale', 'ports routes rates_per_lane sailings_per_route surcharges bookings')
+Scale.__new__.__defaults__ = (200, 2000, 4, 10, 5, 500)
+
+# 生成的數據集：lanes 為有運費的 (起運港ID, 目的港ID, 櫃型ID)，codes 為港口代碼
+Dataset = namedtuple('Dataset', 'scale seed lanes port_codes container_codes booking_ids')
+
+CONTAINER_TYPES = [('20GP', '20呎標準貨櫃', '20'), ('40GP', '40呎標準貨櫃', '40'),
+                   ('40HQ', '40呎高櫃', '40HQ'), ('45HQ', '45呎高櫃', '45HQ')]
+CURRENCIES = ['USD', 'EUR', 'CNY', 'TWD']
+FX_TO_USD = {'USD': 1.0, 'EUR': 1.08, 'CNY': 0.14, 'TWD': 0.031}
+REGIONS = ['Asia', 'Europe', 'America', 'Oceania', 'Africa']
+
+INSERT_CHUNK_SIZE = 5000
+
+
+def port_code(index):
+    return f'X{index:04d}'
+
+
+def _insert(conn, model, rows):
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        conn.execute(model.__table__.insert(), rows[start:start + INSERT_CHUNK_SIZE])
+
+
+def generate(engine, scale=Scale(), seed=0, today=None):
+    """Insert a synthetic tariff of the given scale into an empty schema and describe it"""
+    rng = np.random.default_rng(seed)
+    today = today or date.today()
+    max_routes = scale.ports * (scale.ports - 1)
+    route_count = min(scale.routes, max_routes)
+
+    # 不重複的港口對：在所有有序港口對中抽樣
+    pairs = rng.choice(max_routes, size=route_count, replace=False)
+    origins = pairs // (scale.ports - 1)
+    destinations = pairs % (scale.ports - 1)
+    destinations = destinations + (destinations >= origins)
+    transit_times = rng.integers(5, 45, size=route_count)
+
+    with engine.begin() as conn:
+        _insert(conn, User, [{'username': 'bench', 'email': 'bench@example.com', 'password': '-',
+                              'role': 'admin'}])
+        _insert(conn, Port, [{'code': port_code(i), 'name': f'Port{i:04d}', 'country': 'XX',
+                              'region': REGIONS[i % len(REGIONS)]} for i in range(scale.ports)])
+        _insert(conn, ContainerType, [{'code': code, 'name': name, 'size': size, 'description': ''}
+                                      for code, name, size in CONTAINER_TYPES])
+        _insert(conn, Route, [{'origin_port_id': int(o) + 1, 'destination_port_id': int(d) + 1,
+                               'transit_time': int(t)}
+                              for o, d, t in zip(origins, destinations, transit_times)])
+
+        # 每條航線每種櫃型 K 個生效日期，最後一個在今天之前，保證每條航線都有當前運費
+        rates = []
+        lanes = []
+        for route_index in range(route_count):
+            base = float(rng.integers(300, 4000))
+            for ct_index in range(len(CONTAINER_TYPES)):
+                lanes.append((int(origins[route_index]) + 1, int(destinations[route_index]) + 1, ct_index + 1))
+                for k in range(scale.rates_per_lane):
+                    rates.append({
+                        'route_id': route_index + 1,
+                        'container_type_id': ct_index + 1,
+                        'price': round(base * (1 + 0.3 * ct_index) * rng.uniform(0.8, 1.2), 2),
+                        'currency': CURRENCIES[route_index % len(CURRENCIES)],
+                        'effective_date': today - timedelta(days=30 * (scale.rates_per_lane - k)),
+                        'expiry_date': None,
+                    })
+        _insert(conn, BaseRate, rates)
+
+        _insert(conn, Surcharge, [{'code': f'S{i:02d}', 'name': f'附加費{i}'}
+                                  for i in range(scale.surcharges)])
+        rate_surcharges = []
+        if scale.surcharges:
+            for rate_id in range(1, len(rates) + 1):
+                for surcharge_id in rng.choice(scale.surcharges, size=min(2, scale.surcharges), replace=False):
+                    percentage = bool(rng.random() < 0.3)
+                    rate_surcharges.append({
+                        'rate_id': rate_id,
+                        'surcharge_id': int(surcharge_id) + 1,
+                        'amount': None if percentage else float(rng.integers(20, 300)),
+                        'percentage': float(rng.integers(1, 10)) if percentage else None,
+                        'currency': None if percentage else 'USD',
+                    })
+        _insert(conn, RateSurcharge, rate_surcharges)
+        _insert(conn, ExchangeRate, [{'currency': currency, 'rate': rate, 'effective_date': today - timedelta(days=365)}
+                                     for currency, rate in FX_TO_USD.items()])
+
+        sailings = []
+        for route_index in range(route_count):
+            first = today + timedelta(days=int(rng.integers(0, 7)))
+            for s in range(scale.sailings_per_route):
+                departure = first + timedelta(days=7 * s)
+                sailings.append({
+                    'route_id': route_index + 1,
+                    'vessel_name': f'VESSEL {route_index % 97}',
+                    'voyage': f'{route_index:05d}{s:03d}',
+                    'departure_date': departure,
+                    'arrival_date': departure + timedelta(days=int(transit_times[route_index])),
+                })
+        _insert(conn, VesselSchedule, sailings)
+
+        booked = rng.integers(0, len(lanes), size=scale.bookings) if lanes else []
+        _insert(conn, Booking, [{'user_id': 1, 'origin_port': port_code(lanes[lane][0] - 1),
+                                 'destination_port': port_code(lanes[lane][1] - 1),
+                                 'container_type': CONTAINER_TYPES[lanes[lane][2] - 1][0]}
+                                for lane in booked])
+
+    return Dataset(scale, seed, lanes, [port_code(i) for i in range(scale.ports)],
+                   [code for code, _, _ in CONTAINER_TYPES], list(range(1, scale.bookings + 1)))
+
+
+def write_rate_file(path, dataset, rows, seed=0, effective_date=None):
+    """CSV rate sheet for existing lanes in the import format"""
+    rng = np.random.default_rng(seed)
+    effective_date = (effective_date or date.today()).strftime('%Y-%m-%d')
+    lanes = rng.integers(0, len(dataset.lanes), size=rows)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['起運港代碼', '目的港代碼', '櫃型代碼', '基本運費', '貨幣', '航程時間', '生效日期'])
+        for lane in lanes:
+            origin, destination, container_type = dataset.lanes[lane]
+            writer.writerow([port_code(origin - 1), port_code(destination - 1),
+                             dataset.container_codes[container_type - 1], int(rng.integers(300, 5000)), 'USD',
+                             int(rng.integers(5, 45)), effective_date])
+
+
+def write_schedule_file(path, dataset, rows, seed=0):
+    """CSV schedule sheet for existing routes in the import format"""
+    rng = np.random.default_rng(seed)
+    lanes = rng.integers(0, len(dataset.lanes), size=rows)
+    start = date.today()
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['起運港代碼', '目的港代碼', '船名', '航次', '開航日期', '到達日期'])
+        for i, lane in enumerate(lanes):
+            origin, destination, _ = dataset.lanes[lane]
+            departure = start + timedelta(days=int(rng.integers(0, 180)))
+            writer.writerow([port_code(origin - 1), port_code(destination - 1), f'IMPORT {i % 50}', f'I{i:06d}',
+                             departure.strftime('%Y-%m-%d'),
+                             (departure + timedelta(days=int(rng.integers(5, 45)))).strftime('%Y-%m-%d')])
@@ -59,6 +59,13 @@ with app.app_context():
         print('管理員帳號已存在，跳過初始化步驟。')
 "
 
+# 為既有數據庫補建索引和唯一約束
+echo "升級數據庫結構..."
+python -m src.migrations upgrade
+
+# 發布運費快照，工作進程啟動後共享同一份運費數據
+python -m src.rate_snapshot
+
 # 啟動應用
 echo "啟動海運AI自動報價系統..."
-gunicorn --bind 0.0.0.0:${PORT:-5000} src.app:app
+exec gunicorn -c gunicorn.conf.py src.app:app
@@ -0,0 +1,32 @@
+"""Gunicorn settings: gunicorn -c gunicorn.conf.py src.app:app"""
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+# 在主進程載入應用後再fork，工作進程以寫時複製共享已載入的模塊
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# 可選：預先在主進程載入導入和PDF用到的重型庫，工作進程共享而不各自載入
+if preload_app and os.environ.get('GUNICORN_PRELOAD_HEAVY', '0') == '1':
+    import pandas  # noqa: F401
+    import reportlab.pdfgen.canvas  # noqa: F401
+
+
+def pre_fork(server, worker):
+    # 主進程已有的對象不再參與垃圾回收，避免工作進程回收時寫入這些頁面而失去共享
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # 主進程中可能已建立的數據庫連接不能在多個進程間共用
+    from src.app import app, db
+    from src.db_routing import replicas
+
+    with app.app_context():
+        db.engine.dispose()
+    replicas.dispose()
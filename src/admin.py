@@ -1,17 +1,27 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from .models import User, Port, ContainerType, Route, BaseRate, Surcharge, VesselSchedule
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, abort
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import contains_eager, joinedload
+from .models import User, Port, ContainerType, Route, BaseRate, Surcharge, VesselSchedule, ImportJob, ExchangeRate
 from .app import db, bcrypt
-from .auth import login_required, admin_required, operator_required
-import pandas as pd
-from datetime import datetime
+from .db_routing import read_only
+from .auth import login_required, admin_required, operator_required, current_user_id
+from .jobs import SUPPORTED_EXTENSIONS, submit_import, cancel_job, job_status
+from .fx import parse_currency
+from datetime import datetime, timedelta
+import math
 import os
 import tempfile
 
 admin = Blueprint('admin', __name__)
 
+# 管理列表每頁行數
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
 @admin.route('/dashboard')
 @login_required
 @admin_required
+@read_only
 def dashboard():
     return render_template('admin/dashboard.html')
 
@@ -25,233 +35,72 @@ def import_data():
 @login_required
 @admin_required
 def import_rates():
-    if 'file' not in request.files:
-        flash('沒有選擇文件', 'danger')
-        return redirect(url_for('admin.import_data'))
-
-    file = request.files['file']
-    if file.filename == '':
-        flash('沒有選擇文件', 'danger')
-        return redirect(url_for('admin.import_data'))
-
-    if not file.filename.endswith(('.xlsx', '.xls')):
-        flash('文件格式不正確，請上傳Excel文件', 'danger')
-        return redirect(url_for('admin.import_data'))
-
-    # 保存上傳的文件到臨時文件
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-    file.save(temp_file.name)
-
-    try:
-        # 讀取Excel文件
-        df = pd.read_excel(temp_file.name, engine='openpyxl')
-
-        # 檢查必要的列是否存在
-        required_columns = ['起運港代碼', '目的港代碼', '櫃型代碼', '基本運費', '貨幣', '航程時間', '生效日期']
-        for col in required_columns:
-            if col not in df.columns:
-                flash(f'Excel文件缺少必要的列：{col}', 'danger')
-                return redirect(url_for('admin.import_data'))
-
-        # 處理每一行數據
-        success_count = 0
-        error_count = 0
-
-        for index, row in df.iterrows():
-            try:
-                # 獲取或創建起運港
-                origin_port = Port.query.filter_by(code=row['起運港代碼']).first()
-                if not origin_port:
-                    flash(f'找不到起運港代碼：{row["起運港代碼"]}', 'warning')
-                    error_count += 1
-                    continue
-
-                # 獲取或創建目的港
-                destination_port = Port.query.filter_by(code=row['目的港代碼']).first()
-                if not destination_port:
-                    flash(f'找不到目的港代碼：{row["目的港代碼"]}', 'warning')
-                    error_count += 1
-                    continue
-
-                # 獲取或創建櫃型
-                container_type = ContainerType.query.filter_by(code=row['櫃型代碼']).first()
-                if not container_type:
-                    flash(f'找不到櫃型代碼：{row["櫃型代碼"]}', 'warning')
-                    error_count += 1
-                    continue
-
-                # 獲取或創建航線
-                route = Route.query.filter_by(
-                    origin_port_id=origin_port.id,
-                    destination_port_id=destination_port.id
-                ).first()
-
-                if not route:
-                    route = Route(
-                        origin_port_id=origin_port.id,
-                        destination_port_id=destination_port.id,
-                        transit_time=int(row['航程時間']),
-                        description=f'從{origin_port.name}到{destination_port.name}'
-                    )
-                    db.session.add(route)
-                    db.session.flush()  # 獲取新創建的route.id
-
-                # 處理日期
-                effective_date = pd.to_datetime(row['生效日期']).date()
-                expiry_date = None
-                if '失效日期' in df.columns and not pd.isna(row['失效日期']):
-                    expiry_date = pd.to_datetime(row['失效日期']).date()
-
-                # 創建或更新運費
-                base_rate = BaseRate.query.filter_by(
-                    route_id=route.id,
-                    container_type_id=container_type.id,
-                    effective_date=effective_date
-                ).first()
-
-                if base_rate:
-                    base_rate.price = float(row['基本運費'])
-                    base_rate.currency = row['貨幣']
-                    base_rate.expiry_date = expiry_date
-                else:
-                    base_rate = BaseRate(
-                        route_id=route.id,
-                        container_type_id=container_type.id,
-                        price=float(row['基本運費']),
-                        currency=row['貨幣'],
-                        effective_date=effective_date,
-                        expiry_date=expiry_date
-                    )
-                    db.session.add(base_rate)
-
-                success_count += 1
-
-            except Exception as e:
-                print(f"Error processing row {index}: {e}")
-                error_count += 1
-
-        db.session.commit()
-        flash(f'成功導入{success_count}條運費數據，失敗{error_count}條', 'success' if error_count == 0 else 'warning')
-
-    except Exception as e:
-        db.session.rollback()
-        flash(f'導入運費數據時出錯：{str(e)}', 'danger')
-
-    finally:
-        # 刪除臨時文件
-        os.unlink(temp_file.name)
-
-    return redirect(url_for('admin.import_data'))
+    return _submit_import('rates')
 
 @admin.route('/import/schedules', methods=['POST'])
 @login_required
 @admin_required
 def import_schedules():
+    return _submit_import('schedules')
+
+def _submit_import(kind):
     if 'file' not in request.files:
-        flash('沒有選擇文件', 'danger')
-        return redirect(url_for('admin.import_data'))
+        return _import_error('沒有選擇文件')
 
     file = request.files['file']
     if file.filename == '':
-        flash('沒有選擇文件', 'danger')
-        return redirect(url_for('admin.import_data'))
+        return _import_error('沒有選擇文件')
 
-    if not file.filename.endswith(('.xlsx', '.xls')):
-        flash('文件格式不正確，請上傳Excel文件', 'danger')
-        return redirect(url_for('admin.import_data'))
+    extension = os.path.splitext(file.filename)[1].lower()
+    if extension not in SUPPORTED_EXTENSIONS:
+        return _import_error('文件格式不正確，請上傳Excel、CSV或Parquet文件')
 
-    # 保存上傳的文件到臨時文件
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
+    # 保存上傳的文件到臨時文件，由後台任務處理完後刪除
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=extension)
     file.save(temp_file.name)
+    temp_file.close()
+
+    # 導入在後台進程池中分塊執行，請求立即返回任務編號
+    job_id = submit_import(kind, temp_file.name, file.filename, current_user_id())
+
+    if _wants_json():
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': url_for('admin.import_job_status', job_id=job_id)
+        }), 202
+    flash(f'已提交導入任務（編號{job_id}），可在任務狀態中查看進度', 'success')
+    return redirect(url_for('admin.import_data'))
 
-    try:
-        # 讀取Excel文件
-        df = pd.read_excel(temp_file.name, engine='openpyxl')
-
-        # 檢查必要的列是否存在
-        required_columns = ['起運港代碼', '目的港代碼', '船名', '航次', '開航日期', '到達日期']
-        for col in required_columns:
-            if col not in df.columns:
-                flash(f'Excel文件缺少必要的列：{col}', 'danger')
-                return redirect(url_for('admin.import_data'))
-
-        # 處理每一行數據
-        success_count = 0
-        error_count = 0
-
-        for index, row in df.iterrows():
-            try:
-                # 獲取起運港和目的港
-                origin_port = Port.query.filter_by(code=row['起運港代碼']).first()
-                if not origin_port:
-                    flash(f'找不到起運港代碼：{row["起運港代碼"]}', 'warning')
-                    error_count += 1
-                    continue
-
-                destination_port = Port.query.filter_by(code=row['目的港代碼']).first()
-                if not destination_port:
-                    flash(f'找不到目的港代碼：{row["目的港代碼"]}', 'warning')
-                    error_count += 1
-                    continue
-
-                # 獲取或創建航線
-                route = Route.query.filter_by(
-                    origin_port_id=origin_port.id,
-                    destination_port_id=destination_port.id
-                ).first()
-
-                if not route:
-                    flash(f'找不到從{row["起運港代碼"]}到{row["目的港代碼"]}的航線', 'warning')
-                    error_count += 1
-                    continue
-
-                # 處理日期
-                departure_date = pd.to_datetime(row['開航日期']).date()
-                arrival_date = pd.to_datetime(row['到達日期']).date()
-
-                # 創建或更新船期
-                vessel_schedule = VesselSchedule.query.filter_by(
-                    route_id=route.id,
-                    vessel_name=row['船名'],
-                    voyage=row['航次'],
-                    departure_date=departure_date
-                ).first()
-
-                if vessel_schedule:
-                    vessel_schedule.arrival_date = arrival_date
-                else:
-                    vessel_schedule = VesselSchedule(
-                        route_id=route.id,
-                        vessel_name=row['船名'],
-                        voyage=row['航次'],
-                        departure_date=departure_date,
-                        arrival_date=arrival_date
-                    )
-                    db.session.add(vessel_schedule)
-
-                success_count += 1
-
-            except Exception as e:
-                print(f"Error processing row {index}: {e}")
-                error_count += 1
-
-        db.session.commit()
-        flash(f'成功導入{success_count}條船期數據，失敗{error_count}條', 'success' if error_count == 0 else 'warning')
-
-    except Exception as e:
-        db.session.rollback()
-        flash(f'導入船期數據時出錯：{str(e)}', 'danger')
-
-    finally:
-        # 刪除臨時文件
-        os.unlink(temp_file.name)
+def _wants_json():
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
 
+def _import_error(message):
+    if _wants_json():
+        return jsonify({'success': False, 'message': message}), 400
+    flash(message, 'danger')
     return redirect(url_for('admin.import_data'))
 
+@admin.route('/import/jobs/<int:job_id>')
+@login_required
+@admin_required
+def import_job_status(job_id):
+    job = ImportJob.query.get_or_404(job_id)
+    return jsonify({'success': True, 'job': job_status(job)})
+
+@admin.route('/import/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+@admin_required
+def cancel_import_job(job_id):
+    job = ImportJob.query.get_or_404(job_id)
+    cancel_job(job)
+    return jsonify({'success': True, 'job': job_status(job)})
+
 # 添加管理港口的路由
 @admin.route('/ports')
 @login_required
 @admin_required
+@read_only
 def manage_ports():
     ports = Port.query.order_by(Port.code).all()
     return render_template('admin/ports.html', ports=ports)
@@ -260,6 +109,7 @@ def manage_ports():
 @admin.route('/container_types')
 @login_required
 @admin_required
+@read_only
 def manage_container_types():
     container_types = ContainerType.query.order_by(ContainerType.code).all()
     return render_template('admin/container_types.html', container_types=container_types)
@@ -268,14 +118,231 @@ def manage_container_types():
 @admin.route('/rates')
 @login_required
 @admin_required
+@read_only
 def manage_rates():
-    rates = BaseRate.query.order_by(BaseRate.effective_date.desc()).all()
-    return render_template('admin/rates.html', rates=rates)
+    rates, next_cursor = _rate_page(request.args)
+    return render_template('admin/rates.html', rates=rates, next_cursor=next_cursor, filters=request.args)
 
 # 添加管理船期的路由
 @admin.route('/schedules')
 @login_required
 @admin_required
+@read_only
 def manage_schedules():
-    schedules = VesselSchedule.query.order_by(VesselSchedule.departure_date.desc()).all()
-    return render_template('admin/schedules.html', schedules=schedules)
+    schedules, next_cursor = _schedule_page(request.args)
+    return render_template('admin/schedules.html', schedules=schedules, next_cursor=next_cursor,
+                           filters=request.args)
+
+@admin.route('/api/rates')
+@login_required
+@admin_required
+@read_only
+def api_rates():
+    rates, next_cursor = _rate_page(request.args)
+    return jsonify({
+        'success': True,
+        'rates': [{
+            'id': rate.id,
+            'origin_port': rate.route.origin_port.code,
+            'destination_port': rate.route.destination_port.code,
+            'container_type': rate.container_type.code,
+            'price': rate.price,
+            'currency': rate.currency,
+            'transit_time': rate.route.transit_time,
+            'effective_date': rate.effective_date.strftime('%Y-%m-%d'),
+            'expiry_date': rate.expiry_date.strftime('%Y-%m-%d') if rate.expiry_date else None
+        } for rate in rates],
+        'next_cursor': next_cursor
+    })
+
+@admin.route('/api/schedules')
+@login_required
+@admin_required
+@read_only
+def api_schedules():
+    schedules, next_cursor = _schedule_page(request.args)
+    return jsonify({
+        'success': True,
+        'schedules': [{
+            'id': schedule.id,
+            'origin_port': schedule.route.origin_port.code,
+            'destination_port': schedule.route.destination_port.code,
+            'vessel_name': schedule.vessel_name,
+            'voyage': schedule.voyage,
+            'departure_date': schedule.departure_date.strftime('%Y-%m-%d'),
+            'arrival_date': schedule.arrival_date.strftime('%Y-%m-%d')
+        } for schedule in schedules],
+        'next_cursor': next_cursor
+    })
+
+@admin.route('/api/exchange_rates')
+@login_required
+@admin_required
+@read_only
+def api_exchange_rates():
+    query = ExchangeRate.query
+    if request.args.get('currency'):
+        query = query.filter(ExchangeRate.currency == request.args['currency'].upper())
+    rates = query.order_by(ExchangeRate.currency, ExchangeRate.effective_date.desc()).all()
+    return jsonify({
+        'success': True,
+        'exchange_rates': [_exchange_rate_data(rate) for rate in rates]
+    })
+
+@admin.route('/api/exchange_rates', methods=['POST'])
+@login_required
+@admin_required
+def save_exchange_rates():
+    """Upsert exchange rates keyed by (currency, effective_date)"""
+    items = (request.get_json(silent=True) or {}).get('exchange_rates')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': '缺少必要信息'}), 400
+
+    parsed = {}
+    for item in items:
+        try:
+            currency = parse_currency(item.get('currency'))
+            rate = float(item['rate'])
+            effective_date = datetime.strptime(item['effective_date'], '%Y-%m-%d').date()
+        except (AttributeError, KeyError, TypeError, ValueError):
+            currency = None
+        # float() 接受 "nan" 和 "inf"，保存後該貨幣的所有換算都會得到 NaN
+        if not currency or not math.isfinite(rate) or rate <= 0:
+            return jsonify({'success': False, 'message': f'匯率項目格式不正確：{item}'}), 400
+        parsed[(currency, effective_date)] = rate
+
+    existing = {(rate.currency, rate.effective_date): rate for rate in ExchangeRate.query.filter(
+        ExchangeRate.currency.in_({currency for currency, _ in parsed})
+    )}
+    for (currency, effective_date), rate in parsed.items():
+        if (currency, effective_date) in existing:
+            existing[(currency, effective_date)].rate = rate
+        else:
+            db.session.add(ExchangeRate(currency=currency, rate=rate, effective_date=effective_date))
+    db.session.commit()
+    return jsonify({'success': True, 'count': len(parsed)})
+
+def _exchange_rate_data(rate):
+    return {
+        'currency': rate.currency,
+        'rate': rate.rate,
+        'effective_date': rate.effective_date.strftime('%Y-%m-%d')
+    }
+
+@admin.route('/api/analytics/lanes')
+@login_required
+@admin_required
+@read_only
+def api_lane_analytics():
+    """Weekly top lanes read from the lane_daily_stats rollups"""
+    # 匯總依賴pandas，只在首次使用時載入，不增加每個工作進程的啟動時間和內存
+    from .analytics import weekly_lane_report
+
+    date_to = _date_arg(request.args, 'date_to') or datetime.utcnow().date()
+    date_from = _date_arg(request.args, 'date_from') or date_to - timedelta(days=27)
+    limit = _limit_arg(request.args, 10)
+    return jsonify({
+        'success': True,
+        'lanes': weekly_lane_report(date_from, date_to, limit)
+    })
+
+@admin.route('/analytics/refresh', methods=['POST'])
+@login_required
+@admin_required
+def refresh_analytics():
+    from .analytics import refresh_rollups, RollupConflict
+
+    try:
+        processed = refresh_rollups()
+    except RollupConflict:
+        return jsonify({'success': False, 'message': '其他匯總任務正在執行，請稍後再試'}), 409
+    return jsonify({'success': True, 'processed': processed})
+
+def _rate_page(args):
+    """One keyset page of rates ordered by (effective_date, id) descending, relationships loaded in the same query"""
+    query = BaseRate.query.join(BaseRate.route).options(
+        contains_eager(BaseRate.route).joinedload(Route.origin_port),
+        contains_eager(BaseRate.route).joinedload(Route.destination_port),
+        joinedload(BaseRate.container_type)
+    )
+    query = _lane_filter(query, args)
+    container_type_id = _int_arg(args, 'container_type')
+    if container_type_id is not None:
+        query = query.filter(BaseRate.container_type_id == container_type_id)
+    return _keyset_page(query, args, BaseRate.effective_date, BaseRate.id)
+
+def _schedule_page(args):
+    """One keyset page of schedules ordered by (departure_date, id) descending"""
+    query = VesselSchedule.query.join(VesselSchedule.route).options(
+        contains_eager(VesselSchedule.route).joinedload(Route.origin_port),
+        contains_eager(VesselSchedule.route).joinedload(Route.destination_port)
+    )
+    query = _lane_filter(query, args)
+    return _keyset_page(query, args, VesselSchedule.departure_date, VesselSchedule.id)
+
+def _lane_filter(query, args):
+    origin_port_id = _int_arg(args, 'origin_port')
+    if origin_port_id is not None:
+        query = query.filter(Route.origin_port_id == origin_port_id)
+    destination_port_id = _int_arg(args, 'destination_port')
+    if destination_port_id is not None:
+        query = query.filter(Route.destination_port_id == destination_port_id)
+    return query
+
+def _keyset_page(query, args, date_column, id_column):
+    date_from = _date_arg(args, 'date_from')
+    if date_from:
+        query = query.filter(date_column >= date_from)
+    date_to = _date_arg(args, 'date_to')
+    if date_to:
+        query = query.filter(date_column <= date_to)
+
+    # 游標為上一頁最後一行的 "日期_ID"，按 (日期, ID) 降序繼續
+    cursor = args.get('cursor')
+    if cursor:
+        try:
+            cursor_date, cursor_id = cursor.split('_')
+            cursor_date = datetime.strptime(cursor_date, '%Y-%m-%d').date()
+            cursor_id = int(cursor_id)
+        except ValueError:
+            abort(400)
+        query = query.filter(or_(
+            date_column < cursor_date,
+            and_(date_column == cursor_date, id_column < cursor_id)
+        ))
+
+    limit = _limit_arg(args, PAGE_SIZE)
+    rows = query.order_by(date_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = f'{getattr(last, date_column.key).strftime("%Y-%m-%d")}_{getattr(last, id_column.key)}'
+    return rows, next_cursor
+
+def _int_arg(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        abort(400)
+
+def _limit_arg(args, default):
+    limit = _int_arg(args, 'limit')
+    if limit is None:
+        return default
+    # 負數的 LIMIT 在 SQLite 中表示不限行數
+    if limit < 1:
+        abort(400)
+    return min(limit, MAX_PAGE_SIZE)
+
+def _date_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        abort(400)
@@ -0,0 +1,202 @@
+from flask import current_app
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from .app import app, db
+from .models import QuoteQuery, Booking, LaneDailyStat, RollupState, Port, ContainerType
+from .port_matcher import port_matcher
+from .fx import fx_table
+
+LANE_KEY = ['day', 'origin_port_id', 'destination_port_id', 'container_type_id']
+STAT_COLUMNS = ['quote_count', 'priced_count', 'price_sum', 'booking_count']
+
+# 合併匯總時每次按鍵查詢既有行的數量
+MERGE_CHUNK_SIZE = 200
+
+
+class RollupConflict(Exception):
+    """Another process advanced the same high-water mark first"""
+
+
+def refresh_rollups(batch_size=None):
+    """Fold quote_queries and bookings rows above their high-water marks into lane_daily_stats"""
+    batch_size = batch_size or current_app.config['ANALYTICS_BATCH_SIZE']
+    processed = {}
+    for name, loader in (('quote_queries', _quote_deltas), ('bookings', _booking_deltas)):
+        processed[name] = 0
+        while True:
+            rows = _refresh_source(name, loader, batch_size)
+            processed[name] += rows
+            if rows < batch_size:
+                break
+    return processed
+
+
+def _refresh_source(name, loader, batch_size):
+    state = db.session.get(RollupState, name)
+    last_id = state.last_id if state else 0
+    # 只處理已提交一段時間的行，減少ID較小但提交較晚的行被高水位跳過
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['ANALYTICS_LAG_SECONDS'])
+    deltas, max_id, rows = loader(last_id, batch_size, cutoff)
+    if not rows:
+        return 0
+    try:
+        # 先推進高水位：條件更新失敗說明其他進程已處理這批數據
+        if state is None:
+            db.session.add(RollupState(name=name, last_id=max_id, updated_at=datetime.utcnow()))
+            try:
+                db.session.flush()
+            except IntegrityError:
+                # 其他進程同時建立了同一高水位行
+                raise RollupConflict(name)
+        elif not RollupState.query.filter_by(name=name, last_id=last_id).update(
+                {'last_id': max_id, 'updated_at': datetime.utcnow()}):
+            raise RollupConflict(name)
+        _merge(deltas)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return rows
+
+
+def _fetch(columns, id_column, last_id, batch_size, date_column, cutoff):
+    rows = db.session.query(*columns).filter(id_column > last_id).order_by(id_column).limit(batch_size).all()
+    frame = pd.DataFrame(rows, columns=[column.key for column in columns])
+    if frame.empty:
+        return frame
+    newer = (frame[date_column] > cutoff).to_numpy()
+    if newer.any():
+        frame = frame.iloc[:newer.argmax()]
+    return frame
+
+
+def _quote_deltas(last_id, batch_size, cutoff):
+    frame = _fetch([QuoteQuery.id, QuoteQuery.query_date, QuoteQuery.origin_port_id, QuoteQuery.destination_port_id,
+                    QuoteQuery.container_type_id, QuoteQuery.result_rate, QuoteQuery.result_currency],
+                   QuoteQuery.id, last_id, batch_size, 'query_date', cutoff)
+    if frame.empty:
+        return None, last_id, 0
+
+    frame['day'] = frame['query_date'].dt.date
+    base_currency = current_app.config['FX_BASE_CURRENCY']
+    amounts = frame['result_rate'].astype(float).to_numpy()
+    currencies = frame['result_currency'].fillna(base_currency).to_numpy()
+    # 報價按當日匯率換算為基準貨幣，每個日期一次向量化換算
+    prices = np.full(len(frame), np.nan)
+    for day, positions in frame.groupby('day').indices.items():
+        prices[positions] = fx_table.convert(amounts[positions], currencies[positions], base_currency, day)
+    frame['priced'] = ~np.isnan(prices)
+    frame['price'] = np.nan_to_num(prices)
+
+    deltas = frame.groupby(LANE_KEY).agg(
+        quote_count=('id', 'size'), priced_count=('priced', 'sum'), price_sum=('price', 'sum')
+    ).reset_index()
+    deltas['booking_count'] = 0
+    return deltas, int(frame['id'].iloc[-1]), len(frame)
+
+
+def _booking_deltas(last_id, batch_size, cutoff):
+    frame = _fetch([Booking.id, Booking.booking_date, Booking.origin_port, Booking.destination_port,
+                    Booking.container_type], Booking.id, last_id, batch_size, 'booking_date', cutoff)
+    if frame.empty:
+        return None, last_id, 0
+
+    # 訂艙以名稱或代碼保存港口和櫃型，無法識別的不計入匯總但仍推進高水位
+    lanes = pd.DataFrame({
+        'id': frame['id'],
+        'day': frame['booking_date'].dt.date,
+        'origin_port_id': [_ref_id(port_matcher.find_port(value)) for value in frame['origin_port']],
+        'destination_port_id': [_ref_id(port_matcher.find_port(value)) for value in frame['destination_port']],
+        'container_type_id': [_ref_id(port_matcher.find_container_type(value)) for value in frame['container_type']],
+    }).dropna()
+    deltas = lanes.groupby(LANE_KEY).agg(booking_count=('id', 'size')).reset_index()
+    for column in ('quote_count', 'priced_count', 'price_sum'):
+        deltas[column] = 0
+    return deltas, int(frame['id'].iloc[-1]), len(frame)
+
+
+def _ref_id(ref):
+    return ref.id if ref else None
+
+
+def _merge(deltas):
+    records = [(
+        (row[0], int(row[1]), int(row[2]), int(row[3])),
+        {'quote_count': int(row[4]), 'priced_count': int(row[5]), 'price_sum': float(row[6]),
+         'booking_count': int(row[7])}
+    ) for row in deltas[LANE_KEY + STAT_COLUMNS].itertuples(index=False)]
+
+    keys = [key for key, _ in records]
+    existing = {}
+    key_columns = [getattr(LaneDailyStat, column) for column in LANE_KEY]
+    for start in range(0, len(keys), MERGE_CHUNK_SIZE):
+        chunk = keys[start:start + MERGE_CHUNK_SIZE]
+        for row in db.session.query(LaneDailyStat.id, *key_columns,
+                                    *[getattr(LaneDailyStat, column) for column in STAT_COLUMNS]
+                                    ).filter(tuple_(*key_columns).in_(chunk)):
+            existing[tuple(row[1:5])] = row
+
+    updates = []
+    inserts = []
+    for key, stats in records:
+        row = existing.get(key)
+        if row is None:
+            inserts.append(dict(zip(LANE_KEY, key), **stats))
+        else:
+            updates.append(dict({column: getattr(row, column) + stats[column] for column in STAT_COLUMNS}, id=row.id))
+    if updates:
+        db.session.bulk_update_mappings(LaneDailyStat, updates)
+    if inserts:
+        db.session.bulk_insert_mappings(LaneDailyStat, inserts)
+
+
+def weekly_lane_report(date_from, date_to, limit=10):
+    """Top lanes per week by quote volume, with conversion rate and average quoted price, from the rollups only"""
+    rows = db.session.query(
+        *[getattr(LaneDailyStat, column) for column in LANE_KEY + STAT_COLUMNS]
+    ).filter(LaneDailyStat.day >= date_from, LaneDailyStat.day <= date_to).all()
+    if not rows:
+        return []
+
+    frame = pd.DataFrame(rows, columns=LANE_KEY + STAT_COLUMNS)
+    days = pd.to_datetime(frame['day'])
+    frame['week'] = (days - pd.to_timedelta(days.dt.weekday, unit='D')).dt.date
+    weekly = frame.groupby(['week', 'origin_port_id', 'destination_port_id', 'container_type_id'])[STAT_COLUMNS].sum()
+    weekly = weekly.reset_index().sort_values(['week', 'quote_count'], ascending=[False, False])
+    weekly = weekly.groupby('week', sort=False).head(limit)
+
+    port_ids = set(weekly['origin_port_id']) | set(weekly['destination_port_id'])
+    ports = dict(db.session.query(Port.id, Port.code).filter(Port.id.in_([int(i) for i in port_ids])))
+    container_types = dict(db.session.query(ContainerType.id, ContainerType.code))
+    base_currency = current_app.config['FX_BASE_CURRENCY']
+    return [{
+        'week': row.week.strftime('%Y-%m-%d'),
+        'origin_port': ports.get(row.origin_port_id),
+        'destination_port': ports.get(row.destination_port_id),
+        'container_type': container_types.get(row.container_type_id),
+        'quote_count': int(row.quote_count),
+        'booking_count': int(row.booking_count),
+        'conversion_rate': round(row.booking_count / row.quote_count, 4) if row.quote_count else None,
+        'average_price': round(row.price_sum / row.priced_count, 2) if row.priced_count else None,
+        'currency': base_currency,
+    } for row in weekly.itertuples(index=False)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='航線需求匯總工具')
+    parser.add_argument('command', choices=['refresh'])
+    parser.parse_args(argv)
+
+    with app.app_context():
+        processed = refresh_rollups()
+        print('已匯總：' + '、'.join(f'{name} {rows} 行' for name, rows in processed.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,12 @@
 import os
+import tempfile
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import orm
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from datetime import timedelta
+from .db_routing import RoutingSession, engine_options
 
 # 創建Flask應用
 app = Flask(__name__)
@@ -12,11 +15,78 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///shipping_quote.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# 只讀副本的數據庫URL（逗號分隔），未配置時所有讀寫都走主庫
+app.config['SQLALCHEMY_REPLICA_URIS'] = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+# 只讀副本連接失敗後，在此秒數內改用主庫
+app.config['DB_REPLICA_RETRY_SECONDS'] = int(os.environ.get('DB_REPLICA_RETRY_SECONDS', 30))
+# 數據庫連接池：每進程常駐連接數、可額外建立的連接數、等待連接的秒數、借出前檢測連接、連接最長使用秒數
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
+app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=int(os.environ.get('JWT_REFRESH_TOKEN_DAYS', 30)))
+# 進程內運費引擎及運費快照的最長緩存秒數（其他主機提交的導入或直接修改數據庫在此時間內生效）
+app.config['RATE_ENGINE_TTL'] = int(os.environ.get('RATE_ENGINE_TTL', 300))
+# 港口/櫃型比對器的最長緩存秒數
+app.config['PORT_MATCHER_TTL'] = int(os.environ.get('PORT_MATCHER_TTL', 300))
+# 儀表板統計的最長緩存秒數
+app.config['DASHBOARD_STATS_TTL'] = int(os.environ.get('DASHBOARD_STATS_TTL', 60))
+# 導入文件時每塊處理的行數
+app.config['IMPORT_CHUNK_SIZE'] = int(os.environ.get('IMPORT_CHUNK_SIZE', 5000))
+# 後台導入任務：process 為進程池執行，inline 為在請求中同步執行（測試用）
+app.config['IMPORT_JOB_EXECUTOR'] = os.environ.get('IMPORT_JOB_EXECUTOR', 'process')
+app.config['IMPORT_WORKERS'] = int(os.environ.get('IMPORT_WORKERS', 2))
+# 轉運路徑搜尋的最多航段數及每類結果的最多行程數
+app.config['ROUTING_MAX_LEGS'] = int(os.environ.get('ROUTING_MAX_LEGS', 3))
+app.config['ROUTING_MAX_RESULTS'] = int(os.environ.get('ROUTING_MAX_RESULTS', 10))
+# 訂艙確認PDF的緩存目錄；批量導出時 process 為進程池渲染，inline 為在請求中渲染（測試用）
+app.config['PDF_CACHE_DIR'] = os.environ.get('PDF_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'shipping_quote_pdfs'))
+app.config['PDF_RENDER_EXECUTOR'] = os.environ.get('PDF_RENDER_EXECUTOR', 'process')
+app.config['PDF_RENDER_WORKERS'] = int(os.environ.get('PDF_RENDER_WORKERS', 2))
+app.config['PDF_EXPORT_MAX_ITEMS'] = int(os.environ.get('PDF_EXPORT_MAX_ITEMS', 1000))
+# 訂艙寫入合併提交：第一筆到達後最多等待的毫秒數及每次提交的最多行數
+app.config['GROUP_COMMIT_ENABLED'] = os.environ.get('GROUP_COMMIT_ENABLED', '1') == '1'
+app.config['GROUP_COMMIT_WINDOW_MS'] = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 5))
+app.config['GROUP_COMMIT_MAX_BATCH'] = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 100))
+# 訂艙請求在時間窗口之外最多再等待的秒數，超時後改為直接提交或返回503
+app.config['GROUP_COMMIT_TIMEOUT'] = float(os.environ.get('GROUP_COMMIT_TIMEOUT', 5))
+# 報價日誌緩衝：最多緩存的條數（滿則丟棄並計數）、觸發批量寫入的條數及最長間隔秒數
+app.config['QUOTE_LOG_ENABLED'] = os.environ.get('QUOTE_LOG_ENABLED', '1') == '1'
+app.config['QUOTE_LOG_BUFFER_SIZE'] = int(os.environ.get('QUOTE_LOG_BUFFER_SIZE', 10000))
+app.config['QUOTE_LOG_FLUSH_SIZE'] = int(os.environ.get('QUOTE_LOG_FLUSH_SIZE', 500))
+app.config['QUOTE_LOG_FLUSH_INTERVAL'] = float(os.environ.get('QUOTE_LOG_FLUSH_INTERVAL', 2))
+# 需求匯總每批處理的來源行數，及只處理提交超過此秒數的行
+app.config['ANALYTICS_BATCH_SIZE'] = int(os.environ.get('ANALYTICS_BATCH_SIZE', 10000))
+app.config['ANALYTICS_LAG_SECONDS'] = int(os.environ.get('ANALYTICS_LAG_SECONDS', 5))
+# 匯率表的基準貨幣，ExchangeRate.rate 以此貨幣計價
+app.config['FX_BASE_CURRENCY'] = os.environ.get('FX_BASE_CURRENCY', 'USD')
+# 運費數據版本文件（同一主機上所有進程共享），導入和編輯後遞增，用於HTTP緩存驗證及進程內緩存失效
+app.config['DATA_VERSION_FILE'] = os.environ.get('DATA_VERSION_FILE', os.path.join(tempfile.gettempdir(), 'shipping_quote_data_version'))
+# 運費快照文件（同一主機上所有工作進程以內存映射共享），導入運費後發布；為空則各進程自行從數據庫構建
+app.config['RATE_SNAPSHOT_FILE'] = os.environ.get('RATE_SNAPSHOT_FILE', os.path.join(tempfile.gettempdir(), 'shipping_quote_rates.snapshot'))
+# 報價頁面及報價API的Cache-Control；內容只隨數據版本和日期變化，瀏覽器或CDN可憑ETag重新驗證
+app.config['HTTP_CACHE_CONTROL'] = os.environ.get('HTTP_CACHE_CONTROL', 'private, no-cache')
+# 超過此毫秒數的請求連同其SQL記錄到日誌，0為關閉；每個請求最多記錄的SQL條數
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 0))
+app.config['SLOW_REQUEST_MAX_STATEMENTS'] = int(os.environ.get('SLOW_REQUEST_MAX_STATEMENTS', 20))
+# 批量報價單次請求的最大航線數
+app.config['BATCH_QUOTE_MAX_ITEMS'] = int(os.environ.get('BATCH_QUOTE_MAX_ITEMS', 5000))
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose session can send read-only views to the replicas"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
 
 # 初始化擴展
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
 
@@ -26,11 +96,13 @@ def register_blueprints():
     from .quote import quote_bp
     from .admin import admin
     from .main import main_bp
+    from .metrics import metrics_bp
 
     app.register_blueprint(auth, url_prefix='/auth')
     app.register_blueprint(quote_bp, url_prefix='/quote')
     app.register_blueprint(admin, url_prefix='/admin')
     app.register_blueprint(main_bp)
+    app.register_blueprint(metrics_bp)
 
 # 只有在直接運行此文件時才執行
 if __name__ == '__main__':
@@ -1,5 +1,6 @@
-from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, session
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, session, g
+from flask_jwt_extended import (create_access_token, create_refresh_token, jwt_required, get_jwt_identity,
+                                get_jwt, verify_jwt_in_request)
 from .app import db, bcrypt
 from .models import User
 from datetime import datetime
@@ -8,11 +9,43 @@ import functools
 # 創建藍圖
 auth = Blueprint('auth', __name__)
 
-# 登入檢查裝飾器
+def _bearer_login():
+    """Authenticate from an Authorization: Bearer access token; claims carry the role, no DB lookup"""
+    if not request.headers.get('Authorization', '').startswith('Bearer '):
+        return False
+    # 令牌無效或過期時由 JWTManager 的錯誤處理返回401
+    verify_jwt_in_request()
+    claims = get_jwt()
+    g.jwt_user = {'user_id': int(claims['sub']), 'username': claims.get('username'), 'role': claims.get('role')}
+    return True
+
+def current_user_id():
+    """Logged-in user id from the session or the bearer token"""
+    if 'user_id' in session:
+        return session['user_id']
+    jwt_user = g.get('jwt_user')
+    return jwt_user['user_id'] if jwt_user else None
+
+def current_role():
+    if 'user_id' in session:
+        return session.get('role')
+    jwt_user = g.get('jwt_user')
+    return jwt_user['role'] if jwt_user else None
+
+def _forbidden():
+    if g.get('jwt_user'):
+        return jsonify({'success': False, 'message': '您沒有權限訪問此頁面'}), 403
+    flash('您沒有權限訪問此頁面', 'danger')
+    return redirect(url_for('main.dashboard'))
+
+def _token_claims(user):
+    return {'username': user.username, 'role': user.role}
+
+# 登入檢查裝飾器：接受session登入或JWT訪問令牌
 def login_required(f):
     @functools.wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if 'user_id' not in session and not _bearer_login():
             flash('請先登入', 'warning')
             return redirect(url_for('auth.login'))
         return f(*args, **kwargs)
@@ -22,9 +55,8 @@ def login_required(f):
 def admin_required(f):
     @functools.wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'role' not in session or session['role'] != 'admin':
-            flash('您沒有權限訪問此頁面', 'danger')
-            return redirect(url_for('main.dashboard'))
+        if current_role() != 'admin':
+            return _forbidden()
         return f(*args, **kwargs)
     return decorated_function
 
@@ -32,9 +64,8 @@ def admin_required(f):
 def operator_required(f):
     @functools.wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'role' not in session or session['role'] not in ['admin', 'operator']:
-            flash('您沒有權限訪問此頁面', 'danger')
-            return redirect(url_for('main.dashboard'))
+        if current_role() not in ['admin', 'operator']:
+            return _forbidden()
         return f(*args, **kwargs)
     return decorated_function
 
@@ -88,12 +119,14 @@ def api_login():
         user.last_login = datetime.utcnow()
         db.session.commit()
         
-        # 創建JWT令牌
-        access_token = create_access_token(identity=user.id)
+        # 創建JWT令牌：sub 為字串形式的用戶ID，角色寫入聲明，鑑權時無需查詢數據庫
+        access_token = create_access_token(identity=str(user.id), additional_claims=_token_claims(user))
+        refresh_token = create_refresh_token(identity=str(user.id), additional_claims=_token_claims(user))
         
         return jsonify({
             'success': True,
             'access_token': access_token,
+            'refresh_token': refresh_token,
             'user': {
                 'id': user.id,
                 'username': user.username,
@@ -105,3 +138,16 @@ def api_login():
             'success': False,
             'message': '用戶名或密碼錯誤'
         }), 401
+
+# 以刷新令牌換取新的訪問令牌，不需再次驗證密碼
+@auth.route('/api/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def api_refresh():
+    # 按主鍵重新讀取用戶，使角色變更或刪除在下一次刷新時生效
+    user = db.session.get(User, int(get_jwt_identity()))
+    if user is None:
+        return jsonify({'success': False, 'message': '用戶不存在'}), 401
+    return jsonify({
+        'success': True,
+        'access_token': create_access_token(identity=str(user.id), additional_claims=_token_claims(user))
+    }), 200
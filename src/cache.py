@@ -0,0 +1,64 @@
+from flask import current_app
+import threading
+import time
+from .db_routing import primary
+from .data_version import data_version
+
+
+class ReloadingCache:
+    """Process-local snapshot rebuilt lazily after invalidation or once older than its TTL"""
+
+    # app.config 中的最長緩存秒數配置項，為空則只在失效時重建
+    ttl_config = None
+    # 快照讀取的資料表；其他進程提交這些表時，共享數據版本中的計數變化使快照重建
+    tables = ()
+    # 是否允許在只讀視圖中從副本構建；提交後即失效的快照必須讀主庫
+    replica_reads = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._generation = 0
+        self._loaded_at = 0
+        self._version = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def invalidate(self):
+        self._generation += 1
+        self._data = None
+
+    def _expired(self, ttl):
+        return bool(ttl) and time.monotonic() - self._loaded_at >= ttl
+
+    def _table_versions(self):
+        state = data_version.current()
+        # 數據版本文件重建後計數重新開始，epoch 不同即視為已變更
+        return (state.epoch,) + tuple(state.tables.get(table, 0) for table in self.tables)
+
+    def _fresh(self, data, ttl, version):
+        return data is not None and version == self._version and not self._expired(ttl)
+
+    def current(self):
+        ttl = current_app.config.get(self.ttl_config) if self.ttl_config else None
+        version = self._table_versions()
+        data = self._data
+        if self._fresh(data, ttl, version):
+            return data
+        with self._lock:
+            data = self._data
+            if not self._fresh(data, ttl, version):
+                generation = self._generation
+                if self.replica_reads:
+                    data = self.build()
+                else:
+                    # 避免提交後立即重建時讀到副本上尚未同步的舊數據
+                    with primary():
+                        data = self.build()
+                # 構建期間若有提交使其失效，不保存可能過期的結果
+                if generation == self._generation:
+                    self._data = data
+                    self._loaded_at = time.monotonic()
+                    self._version = version
+            return data
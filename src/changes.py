@@ -0,0 +1,65 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from itertools import chain
+
+# 提交後的資料變更通知
+# 進程內的快取（運費引擎、港口比對器等）透過 on_commit 訂閱相關資料表，
+# 在交易成功提交後失效或重建
+
+_listeners = []
+
+
+def on_commit(*tables, shared=False):
+    """Register a callback run after a commit that touched any of the tables
+
+    shared marks callbacks that announce the change to other processes (the data
+    version); notify(..., shared=False) skips them.
+    """
+    def decorator(f):
+        _listeners.append((frozenset(tables), shared, f))
+        return f
+    return decorator
+
+
+def mark_changed(session, *tables):
+    """Record tables changed by statements the ORM does not track (bulk mappings)"""
+    session.info.setdefault('changed_tables', set()).update(tables)
+
+
+def notify(tables, shared=True):
+    tables = set(tables)
+    for watched, announces, f in _listeners:
+        if announces and not shared:
+            continue
+        if not watched or watched & tables:
+            f(tables)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    changed = session.info.setdefault('changed_tables', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            changed.add(table.name)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_executed(orm_execute_state):
+    # session.execute(insert(...)/update(...)/delete(...)) 不經過flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            mark_changed(orm_execute_state.session, table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    changed = session.info.pop('changed_tables', None)
+    if changed:
+        notify(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('changed_tables', None)
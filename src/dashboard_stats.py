@@ -0,0 +1,79 @@
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+from types import SimpleNamespace
+from .app import db
+from .cache import ReloadingCache
+from .models import Port, ContainerType, Route, BaseRate, VesselSchedule
+from . import changes
+
+# 儀表板統計涉及的資料表，任一提交變更即失效
+STATS_TABLES = ('ports', 'container_types', 'routes', 'base_rates', 'vessel_schedules')
+
+
+def _port_view(port):
+    return SimpleNamespace(id=port.id, code=port.code, name=port.name)
+
+
+def _route_view(route):
+    return SimpleNamespace(id=route.id, transit_time=route.transit_time, description=route.description,
+                           origin_port=_port_view(route.origin_port),
+                           destination_port=_port_view(route.destination_port))
+
+
+class DashboardStats(ReloadingCache):
+    """Cached counts and latest rates/schedules shown on the dashboard"""
+
+    ttl_config = 'DASHBOARD_STATS_TTL'
+    tables = STATS_TABLES
+    # 統計本身按TTL刷新，可容忍副本的複製延遲
+    replica_reads = True
+
+    def build(self):
+        # 五個計數合併為一條語句
+        counts = db.session.query(
+            select(func.count(Port.id)).scalar_subquery(),
+            select(func.count(ContainerType.id)).scalar_subquery(),
+            select(func.count(Route.id)).scalar_subquery(),
+            select(func.count(BaseRate.id)).scalar_subquery(),
+            select(func.count(VesselSchedule.id)).scalar_subquery()
+        ).one()
+
+        latest_rates = BaseRate.query.options(
+            joinedload(BaseRate.route).joinedload(Route.origin_port),
+            joinedload(BaseRate.route).joinedload(Route.destination_port),
+            joinedload(BaseRate.container_type)
+        ).order_by(BaseRate.effective_date.desc()).limit(5).all()
+
+        latest_schedules = VesselSchedule.query.options(
+            joinedload(VesselSchedule.route).joinedload(Route.origin_port),
+            joinedload(VesselSchedule.route).joinedload(Route.destination_port)
+        ).order_by(VesselSchedule.departure_date.desc()).limit(5).all()
+
+        # 緩存與會話無關的快照，模板可按原有屬性路徑訪問
+        return {
+            'port_count': counts[0],
+            'container_type_count': counts[1],
+            'route_count': counts[2],
+            'rate_count': counts[3],
+            'schedule_count': counts[4],
+            'latest_rates': [SimpleNamespace(
+                id=rate.id, price=rate.price, currency=rate.currency,
+                effective_date=rate.effective_date, expiry_date=rate.expiry_date,
+                route=_route_view(rate.route),
+                container_type=SimpleNamespace(id=rate.container_type.id, code=rate.container_type.code,
+                                               name=rate.container_type.name)
+            ) for rate in latest_rates],
+            'latest_schedules': [SimpleNamespace(
+                id=schedule.id, vessel_name=schedule.vessel_name, voyage=schedule.voyage,
+                departure_date=schedule.departure_date, arrival_date=schedule.arrival_date,
+                route=_route_view(schedule.route)
+            ) for schedule in latest_schedules],
+        }
+
+
+dashboard_stats = DashboardStats()
+
+
+@changes.on_commit(*STATS_TABLES)
+def _invalidate_dashboard_stats(tables):
+    dashboard_stats.invalidate()
@@ -0,0 +1,145 @@
+from flask import request, make_response
+from collections import namedtuple
+from datetime import datetime, timezone
+import fcntl
+import functools
+import json
+import os
+import tempfile
+import threading
+import uuid
+from .app import app
+from . import changes
+
+# 影響報價頁面和報價結果的資料表，任一提交後版本號加一
+VERSIONED_TABLES = ('ports', 'container_types', 'routes', 'base_rates', 'surcharges', 'rate_surcharges',
+                    'exchange_rates', 'vessel_schedules')
+
+# epoch 在文件首次建立時隨機生成：文件被刪除重建後計數從零開始，憑 epoch 區分前後兩份計數
+VersionState = namedtuple('VersionState', 'version bumped_at tables epoch')
+EMPTY_STATE = VersionState(0, 0.0, {}, '')
+
+
+class DataVersion:
+    """Monotonic rate-data version kept in a file shared by all processes on the host
+
+    The file holds the overall version, the time of the last bump, a counter per
+    table and the epoch of the file. It is replaced atomically, so readers never lock; writers serialize on a
+    separate lock file.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stat = None
+        self._state = EMPTY_STATE
+
+    def _path(self):
+        return app.config['DATA_VERSION_FILE']
+
+    def current(self):
+        """Current VersionState — a stat call, re-reading the file only when it changed"""
+        path = self._path()
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return EMPTY_STATE
+        key = (path, stat.st_mtime_ns, stat.st_ino, stat.st_size)
+        if key != self._stat:
+            state = self._read(path)
+            with self._lock:
+                self._stat, self._state = key, state
+        return self._state
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            return VersionState(int(data['version']), float(data['bumped_at']), data['tables'], data.get('epoch', ''))
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return EMPTY_STATE
+
+    def _update(self, change):
+        """Replace the file with change(state) under the lock file; returns the new state"""
+        path = self._path()
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        with open(path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                state = self._read(path)
+                new_state = change(state)
+                if new_state is not state:
+                    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump(new_state._asdict(), f)
+                    os.replace(tmp_path, path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return new_state
+
+    def bump(self, tables):
+        def change(state):
+            counters = dict(state.tables)
+            for table in tables:
+                counters[table] = counters.get(table, 0) + 1
+            return VersionState(state.version + 1, datetime.now(timezone.utc).timestamp(), counters,
+                                state.epoch or uuid.uuid4().hex)
+        return self._update(change).version
+
+    def ensure(self):
+        """Current state, creating the file first so that it has an epoch"""
+        def change(state):
+            if state.epoch:
+                return state
+            # 新 epoch 之前的資料未知，以建立時間作為最後變更時間
+            return state._replace(epoch=uuid.uuid4().hex, bumped_at=datetime.now(timezone.utc).timestamp())
+        return self._update(change)
+
+
+data_version = DataVersion()
+
+
+@changes.on_commit(*VERSIONED_TABLES, shared=True)
+def _bump_data_version(tables):
+    data_version.bump(tables & set(VERSIONED_TABLES))
+
+
+def _validators():
+    state = data_version.current()
+    if not state.epoch:
+        state = data_version.ensure()
+    version, bumped_at = state.version, state.bumped_at
+    now = datetime.now(timezone.utc)
+    # 報價取決於當日有效的運費和船期，日期變更時即使資料未變也要重新計算
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    last_modified = max(datetime.fromtimestamp(bumped_at, timezone.utc), midnight).replace(microsecond=0)
+    # 數據版本文件重建（如容器重建）後計數從零開始，ETag 含 epoch 以免相同版本號對應不同數據
+    return f'{state.epoch}-{version}-{now:%Y%m%d}', last_modified
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    since = request.if_modified_since
+    return since is not None and since >= last_modified
+
+
+def conditional(f):
+    """ETag/Last-Modified validators from the data version; answers 304 before the view runs"""
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        etag, last_modified = _validators()
+        if _not_modified(etag, last_modified):
+            # 未變更的重複請求直接返回，不查詢數據庫也不記入報價日誌
+            response = make_response('', 304)
+        else:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.headers['Cache-Control'] = app.config['HTTP_CACHE_CONTROL']
+        response.vary.update(('Cookie', 'Authorization'))
+        return response
+    return decorated_function
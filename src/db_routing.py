@@ -0,0 +1,127 @@
+from flask import current_app
+from flask_sqlalchemy import SignallingSession
+from contextlib import contextmanager
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import Select
+import functools
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def engine_options(url, config):
+    """create_engine keyword arguments for a database URL from the DB_POOL_* settings"""
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    # SQLite 不使用 QueuePool，連接池大小相關配置只用於其他數據庫
+    if not url.startswith('sqlite'):
+        options.update({
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+        })
+    return options
+
+
+class ReplicaSet:
+    """Round-robin read replicas; a replica that fails is skipped until its retry time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines = {}
+        self._down_until = {}
+        self._counter = itertools.count()
+
+    def _engine(self, url, config):
+        with self._lock:
+            engine = self._engines.get(url)
+            if engine is None:
+                engine = create_engine(url, **engine_options(url, config))
+                self._engines[url] = engine
+            return engine
+
+    def pick(self, config):
+        urls = config.get('SQLALCHEMY_REPLICA_URIS') or []
+        now = time.monotonic()
+        healthy = [url for url in urls if self._down_until.get(url, 0) <= now]
+        if not healthy:
+            return None
+        url = healthy[next(self._counter) % len(healthy)]
+        return url, self._engine(url, config)
+
+    def mark_down(self, url, config):
+        logger.warning('只讀副本不可用，%s 秒內改用主庫：%s', config['DB_REPLICA_RETRY_SECONDS'], url)
+        self._down_until[url] = time.monotonic() + config['DB_REPLICA_RETRY_SECONDS']
+
+    def dispose(self):
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+            self._down_until.clear()
+
+
+replicas = ReplicaSet()
+
+
+class RoutingSession(SignallingSession):
+    """Session sending SELECTs to a read replica while a read_only view runs, everything else to the primary"""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.info.get('use_replica') and not self._flushing and isinstance(clause, Select):
+            chosen = self.info.get('replica')
+            if chosen is None:
+                chosen = replicas.pick(current_app.config)
+                # 同一請求內固定使用同一個副本，保證讀取一致
+                self.info['replica'] = chosen or False
+            if chosen:
+                return chosen[1]
+        return super().get_bind(mapper, clause, **kwargs)
+
+
+def _session():
+    return current_app.extensions['sqlalchemy'].db.session
+
+
+def read_only(f):
+    """Route the view's reads to a replica, retrying once on the primary if the replica fails"""
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        config = current_app.config
+        if not config.get('SQLALCHEMY_REPLICA_URIS'):
+            return f(*args, **kwargs)
+        session = _session()
+        session.info['use_replica'] = True
+        try:
+            return f(*args, **kwargs)
+        except OperationalError:
+            chosen = session.info.get('replica')
+            if not chosen:
+                raise
+            # 副本連接失敗時標記下線，只讀視圖可安全地在主庫上重試
+            replicas.mark_down(chosen[0], config)
+            session.rollback()
+            session.info['use_replica'] = False
+            return f(*args, **kwargs)
+        finally:
+            session.info.pop('use_replica', None)
+            session.info.pop('replica', None)
+    return decorated_function
+
+
+@contextmanager
+def primary():
+    """Force reads inside the block to the primary, e.g. rebuilding caches right after a commit"""
+    session = _session()
+    saved = session.info.pop('use_replica', None)
+    try:
+        yield
+    finally:
+        if saved is not None:
+            session.info['use_replica'] = saved
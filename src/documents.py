@@ -0,0 +1,256 @@
+from flask import current_app
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from datetime import datetime, date
+import glob
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from .port_matcher import port_matcher
+from .rate_engine import rate_engine
+from .sailing_index import sailing_index
+from .pricing import all_in_quote, add_other_currency_charges
+from . import tasks
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def booking_document(booking, today=None):
+    """Plain data printed on a booking confirmation, resolved from the in-memory indexes"""
+    today = today or datetime.utcnow().date()
+    origin = port_matcher.find_port(booking.origin_port)
+    destination = port_matcher.find_port(booking.destination_port)
+    container_type = port_matcher.find_container_type(booking.container_type)
+
+    rate = None
+    schedule = None
+    route = rate_engine.find_route(origin.id, destination.id) if origin and destination else None
+    if route:
+        base_rate = None
+        if container_type:
+            base_rate = rate_engine.find_rate(origin.id, destination.id, container_type.id, today)
+        if base_rate:
+            priced = (base_rate.rate_id, base_rate.price, base_rate.currency)
+            quote = add_other_currency_charges([priced], [all_in_quote(*priced)], today)[0]
+            rate = {
+                'price': base_rate.price,
+                'currency': base_rate.currency,
+                'surcharges': [[item['code'], item['amount'], item['currency']] for item in quote['surcharges']],
+                'total': quote['total'],
+                # 無匯率可換算、未計入總額的外幣附加費
+                'other_currency_charges': sorted(quote['other_currency_charges'].items()),
+            }
+        sailings = sailing_index.next_departures(route.route_id, date.min, 1)
+        if sailings:
+            schedule = {
+                'vessel_name': sailings[0].vessel_name,
+                'voyage': sailings[0].voyage,
+                'departure_date': sailings[0].departure_date.strftime('%Y-%m-%d'),
+            }
+
+    return {
+        'booking_id': booking.id,
+        'origin_port': booking.origin_port,
+        'destination_port': booking.destination_port,
+        'container_type': booking.container_type,
+        'rate': rate,
+        'schedule': schedule,
+    }
+
+
+def document_version(document):
+    # 內容摘要作為版本：訂艙或其運費、附加費、船期任一變動都會得到新的緩存鍵
+    payload = json.dumps(document, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+
+def render_pdf(document):
+    """Render a booking confirmation; runs in worker processes for bulk exports"""
+    # reportlab 只在首次渲染時載入，不增加每個工作進程的啟動時間和內存
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer)
+    p.drawString(50, 800, 'Booking Confirmation')
+    p.drawString(50, 780, f"Booking ID: {document['booking_id']}")
+    p.drawString(50, 760, f"Origin: {document['origin_port']}")
+    p.drawString(50, 740, f"Destination: {document['destination_port']}")
+    p.drawString(50, 720, f"Container Type: {document['container_type']}")
+    y = 700
+    rate = document['rate']
+    if rate:
+        p.drawString(50, y, f"Rate: {rate['price']} {rate['currency']}")
+        for code, amount, currency in rate['surcharges']:
+            y -= 20
+            p.drawString(70, y, f'{code}: {amount} {currency}')
+        y -= 20
+        if rate['other_currency_charges']:
+            # 總額不含無法換算的外幣附加費，不能標為全包
+            p.drawString(50, y, f"Total: {rate['total']} {rate['currency']}")
+            for currency, amount in rate['other_currency_charges']:
+                y -= 20
+                p.drawString(50, y, f'Plus: {amount} {currency}')
+        else:
+            p.drawString(50, y, f"All-in: {rate['total']} {rate['currency']}")
+        y -= 20
+    schedule = document['schedule']
+    if schedule:
+        p.drawString(50, y, f"Schedule: {schedule['vessel_name']} {schedule['voyage']} {schedule['departure_date']}")
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+class PdfCache:
+    """Rendered PDFs on disk named by booking id and data version, shared by all workers"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, booking_id, version):
+        return os.path.join(self.directory, f'booking_{booking_id}_{version}.pdf')
+
+    def get(self, booking_id, version):
+        try:
+            with open(self._path(booking_id, version), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, booking_id, version, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(booking_id, version)
+        # 先寫臨時文件再原子替換，其他進程不會讀到半個文件
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.discard(booking_id, keep=path)
+
+    def discard(self, booking_id, keep=None):
+        for stale in glob.glob(os.path.join(self.directory, f'booking_{booking_id}_*.pdf')):
+            if stale != keep:
+                try:
+                    os.unlink(stale)
+                except FileNotFoundError:
+                    pass
+
+
+def pdf_cache():
+    return PdfCache(current_app.config['PDF_CACHE_DIR'])
+
+
+def booking_pdf_bytes(booking):
+    """Cached PDF for a booking, rendered only when its data version changed"""
+    document = booking_document(booking)
+    version = document_version(document)
+    cache = pdf_cache()
+    data = cache.get(booking.id, version)
+    if data is None:
+        data = render_pdf(document)
+        cache.put(booking.id, version, data)
+    return data
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=current_app.config.get('PDF_RENDER_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def _discard_executor(broken):
+    # 子進程異常退出後進程池不可再用，丟棄後下次導出重新建立
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+class _ZipStream:
+    """Write-only sink for ZipFile; written bytes are drained by the streaming generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_zip(bookings):
+    """Generator streaming a zip of booking PDFs, rendering cache misses in a process pool"""
+    documents = [booking_document(booking) for booking in bookings]
+    cache = pdf_cache()
+    inline = current_app.config.get('PDF_RENDER_EXECUTOR') == 'inline'
+    # 同時在渲染中的PDF數量有上限，內存中只保留窗口內的結果
+    window = 1 if inline else 2 * current_app.config.get('PDF_RENDER_WORKERS', 2)
+
+    def generate():
+        executor = None if inline else _get_executor()
+        sink = _ZipStream()
+        pending = deque()
+
+        def write_next(archive):
+            nonlocal executor
+            if not _write_entry(archive, cache, *pending.popleft()) and executor is not None:
+                _discard_executor(executor)
+                executor = None
+
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for document in documents:
+                version = document_version(document)
+                data = cache.get(document['booking_id'], version)
+                future = None
+                if data is None and executor is not None:
+                    try:
+                        future = executor.submit(tasks.render_pdf, document)
+                    except BrokenProcessPool:
+                        _discard_executor(executor)
+                        executor = None
+                pending.append((document, version, data, future))
+                while len(pending) >= window:
+                    write_next(archive)
+                    yield sink.drain()
+            while pending:
+                write_next(archive)
+                yield sink.drain()
+        yield sink.drain()
+
+    return generate()
+
+
+def _write_entry(archive, cache, document, version, data, future):
+    """Add one PDF to the archive; False when the pool rendering it broke"""
+    healthy = True
+    if data is None:
+        try:
+            data = future.result() if future is not None else None
+        except BrokenProcessPool:
+            # 進程池損壞時已提交的項目在當前進程渲染，保證導出完整
+            healthy = False
+        if data is None:
+            data = render_pdf(document)
+        cache.put(document['booking_id'], version, data)
+    archive.writestr(f"quote_{document['booking_id']}.pdf", data)
+    return healthy
@@ -0,0 +1,69 @@
+from flask import current_app
+from collections import namedtuple
+from itertools import groupby
+from operator import itemgetter
+import numpy as np
+from .app import db
+from .cache import ReloadingCache
+from .models import ExchangeRate
+from . import changes
+
+# 每種貨幣按生效日期升序排列的匯率
+FxCurve = namedtuple('FxCurve', 'dates rates')
+
+
+class FxTable(ReloadingCache):
+    """Effective-dated exchange rates held as per-currency arrays for bulk conversion"""
+
+    ttl_config = 'RATE_ENGINE_TTL'
+    tables = ('exchange_rates',)
+
+    def build(self):
+        rows = db.session.query(
+            ExchangeRate.currency, ExchangeRate.effective_date, ExchangeRate.rate
+        ).order_by(ExchangeRate.currency, ExchangeRate.effective_date).all()
+
+        curves = {}
+        for currency, group in groupby(rows, key=itemgetter(0)):
+            group = list(group)
+            curves[currency] = FxCurve(np.array([row[1] for row in group], dtype='datetime64[D]'),
+                                       np.array([row[2] for row in group], dtype=np.float64))
+        return curves
+
+    def _to_base(self, curves, currency, on_date):
+        if currency == current_app.config['FX_BASE_CURRENCY']:
+            return 1.0
+        curve = curves.get(currency)
+        if curve is None:
+            return np.nan
+        index = np.searchsorted(curve.dates, np.datetime64(on_date, 'D'), side='right') - 1
+        return curve.rates[index] if index >= 0 else np.nan
+
+    def convert(self, amounts, currencies, to_currency, on_date):
+        """Convert amounts in mixed currencies to one currency; NaN where no rate applies"""
+        amounts = np.asarray(amounts, dtype=np.float64)
+        if not len(amounts):
+            return amounts.copy()
+        curves = self.current()
+        # 每種貨幣只查一次匯率，再按索引廣播到所有金額
+        codes, inverse = np.unique(np.asarray(currencies, dtype=str), return_inverse=True)
+        target = self._to_base(curves, to_currency, on_date)
+        factors = np.array([self._to_base(curves, code, on_date) for code in codes], dtype=np.float64) / target
+        return amounts * factors[inverse]
+
+
+fx_table = FxTable()
+
+
+def parse_currency(value):
+    """Normalize a requested output currency; None when absent, ValueError when malformed"""
+    if value is None or value == '':
+        return None
+    if not isinstance(value, str) or len(value) != 3 or not value.isalpha():
+        raise ValueError(value)
+    return value.upper()
+
+
+@changes.on_commit('exchange_rates')
+def _invalidate_fx_table(tables):
+    fx_table.invalidate()
@@ -0,0 +1,132 @@
+from flask import current_app
+from queue import Queue, Empty
+import threading
+import time
+from .app import db
+
+
+class GroupCommitTimeout(Exception):
+    """The writer thread took a row but did not commit it in time"""
+
+
+class _PendingInsert:
+    def __init__(self, values):
+        self.values = values
+        self.done = threading.Event()
+        self.id = None
+        self.error = None
+        # queued：等待寫入線程；writing：已被寫入線程取走；abandoned：等待超時，由請求線程自行提交
+        self.state = 'queued'
+
+
+class GroupCommitter:
+    """Inserts rows of one model from many request threads in shared short-window transactions
+
+    insert() blocks until the transaction containing the row has committed, so callers get
+    the same durability as a per-request commit while concurrent requests share one fsync.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def insert(self, values):
+        """Insert one row and return its primary key once committed"""
+        if not current_app.config.get('GROUP_COMMIT_ENABLED'):
+            return self._insert_direct(values)
+
+        config = current_app.config
+        self._ensure_writer(current_app._get_current_object())
+        pending = _PendingInsert(values)
+        self._queue.put(pending)
+        if not pending.done.wait(config['GROUP_COMMIT_WINDOW_MS'] / 1000 + config['GROUP_COMMIT_TIMEOUT']):
+            if self._claim(pending, 'abandoned'):
+                # 寫入線程停滯或已退出、尚未取走這一筆，改為直接提交，不會重複寫入
+                return self._insert_direct(values)
+            # 已被寫入線程取走但仍未提交，無法確定結果，不能重試
+            raise GroupCommitTimeout()
+        if pending.error is not None:
+            raise pending.error
+        return pending.id
+
+    def _insert_direct(self, values):
+        row = self.model(**values)
+        db.session.add(row)
+        db.session.commit()
+        return row.id
+
+    def _claim(self, pending, state):
+        with self._lock:
+            if pending.state != 'queued':
+                return False
+            pending.state = state
+            return True
+
+    def _ensure_writer(self, app):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(app,), daemon=True,
+                                                name=f'group-commit-{self.model.__tablename__}')
+                self._thread.start()
+
+    def _run(self, app):
+        while True:
+            batch = [self._queue.get()]
+            # 第一筆到達後在時間窗口內繼續收集，合併為一次提交
+            window = app.config['GROUP_COMMIT_WINDOW_MS'] / 1000
+            max_batch = app.config['GROUP_COMMIT_MAX_BATCH']
+            deadline = time.monotonic() + window
+            while len(batch) < max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except Empty:
+                    break
+
+            # 已超時放棄的不再寫入
+            batch = [pending for pending in batch if self._claim(pending, 'writing')]
+            if not batch:
+                continue
+            try:
+                with app.app_context():
+                    try:
+                        self._commit(batch)
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                for pending in batch:
+                    if pending.id is None and pending.error is None:
+                        pending.error = e
+            finally:
+                # 任何異常都不能讓等待中的請求永久阻塞，也不能讓寫入線程退出
+                for pending in batch:
+                    pending.done.set()
+
+    def _commit(self, batch):
+        try:
+            self._write(batch)
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                batch[0].error = e
+                return
+            # 整批失敗時逐筆重試，只有出錯的那一筆返回異常
+            for pending in batch:
+                try:
+                    self._write([pending])
+                except Exception as e:
+                    db.session.rollback()
+                    pending.error = e
+
+    def _write(self, batch):
+        rows = [self.model(**pending.values) for pending in batch]
+        db.session.add_all(rows)
+        db.session.flush()
+        ids = [row.id for row in rows]
+        db.session.commit()
+        for pending, row_id in zip(batch, ids):
+            pending.id = row_id
@@ -0,0 +1,368 @@
+from flask import current_app
+import os
+import time
+import pandas as pd
+from .app import db
+from .models import Port, ContainerType, Route, BaseRate, VesselSchedule
+from . import changes
+
+RATE_COLUMNS = ['起運港代碼', '目的港代碼', '櫃型代碼', '基本運費', '貨幣', '航程時間', '生效日期']
+SCHEDULE_COLUMNS = ['起運港代碼', '目的港代碼', '船名', '航次', '開航日期', '到達日期']
+
+# 每次按航線查詢既有數據時的航線數
+LOOKUP_CHUNK_SIZE = 500
+
+
+class MissingColumnError(ValueError):
+    """Raised when an uploaded file lacks a required column"""
+
+    def __init__(self, column):
+        super().__init__(f'文件缺少必要的列：{column}')
+        self.column = column
+
+
+class ImportResult:
+    """Success/error counts and flash messages collected during an import"""
+
+    def __init__(self):
+        self.success_count = 0
+        self.error_count = 0
+        self.rows_processed = 0
+        self.messages = []
+        self._seen = set()
+
+    def warn(self, message):
+        # 分塊導入時同一提示只保留一次
+        if message not in self._seen:
+            self._seen.add(message)
+            self.messages.append((message, 'warning'))
+
+
+def iter_frames(path, chunk_size):
+    """Yield the file as DataFrames of at most chunk_size rows without loading it whole"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        yield from pd.read_csv(path, chunksize=chunk_size)
+    elif extension == '.parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError('導入Parquet文件需要安裝pyarrow')
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            batch = []
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                batch.append(row)
+                if len(batch) >= chunk_size:
+                    yield pd.DataFrame(batch, columns=header)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=header)
+        finally:
+            workbook.close()
+
+
+class _Importer:
+    columns = []
+    label = ''
+
+    def __init__(self):
+        self.result = ImportResult()
+        self._port_frame = None
+        self._route_frame = None
+
+    def process(self, df):
+        raise NotImplementedError
+
+    def run_file(self, path, chunk_size=None, progress=None):
+        """Stream the file in fixed-size chunks, committing and reporting after each chunk"""
+        chunk_size = chunk_size or current_app.config.get('IMPORT_CHUNK_SIZE', 5000)
+        result = self.result
+        started = time.monotonic()
+        for index, df in enumerate(iter_frames(path, chunk_size)):
+            if index == 0:
+                for col in self.columns:
+                    if col not in df.columns:
+                        raise MissingColumnError(col)
+
+            success_count, error_count = result.success_count, result.error_count
+            try:
+                self.process(df)
+                db.session.commit()
+            except Exception as e:
+                # 單個分塊失敗時回滾該塊並計入失敗，繼續處理後續分塊
+                db.session.rollback()
+                current_app.logger.exception('導入%s數據第%d塊時出錯', self.label, index + 1)
+                result.success_count = success_count
+                result.error_count = error_count + len(df)
+                result.warn(f'第{index + 1}塊數據導入失敗：{e}')
+                self._route_frame = None
+
+            result.rows_processed += len(df)
+            current_app.logger.info('導入%s數據：已處理%d行（成功%d，失敗%d，%.1f秒）', self.label,
+                                    result.rows_processed, result.success_count, result.error_count,
+                                    time.monotonic() - started)
+            if progress:
+                progress(result)
+        return result
+
+    def ports(self):
+        if self._port_frame is None:
+            self._port_frame = pd.DataFrame(db.session.query(Port.code, Port.id, Port.name).all(),
+                                            columns=['code', 'port_id', 'port_name'])
+        return self._port_frame
+
+    def routes(self):
+        if self._route_frame is None:
+            routes = pd.DataFrame(
+                db.session.query(Route.id, Route.origin_port_id, Route.destination_port_id).order_by(Route.id).all(),
+                columns=['route_id', 'origin_port_id', 'destination_port_id']
+            )
+            # 同一港口對取第一條航線
+            self._route_frame = routes.drop_duplicates(['origin_port_id', 'destination_port_id']).astype('int64')
+        return self._route_frame
+
+    def _resolve_ports(self, df):
+        """Map origin/destination codes to port ids, counting rows with unknown codes as errors"""
+        ports = self.ports()
+        rows = pd.DataFrame({
+            'origin_code': _codes(df['起運港代碼']),
+            'destination_code': _codes(df['目的港代碼']),
+        }, index=df.index)
+        rows = rows.merge(
+            ports.rename(columns={'code': 'origin_code', 'port_id': 'origin_port_id', 'port_name': 'origin_name'}),
+            on='origin_code', how='left'
+        ).merge(
+            ports.rename(columns={'code': 'destination_code', 'port_id': 'destination_port_id',
+                                  'port_name': 'destination_name'}),
+            on='destination_code', how='left'
+        )
+        rows.index = df.index
+
+        # 與逐行導入相同的檢查順序，每行只計一次失敗
+        missing_origin = rows['origin_port_id'].isna()
+        self._report_missing(rows, missing_origin, 'origin_code', '起運港代碼')
+        missing_destination = ~missing_origin & rows['destination_port_id'].isna()
+        self._report_missing(rows, missing_destination, 'destination_code', '目的港代碼')
+        return rows, ~(missing_origin | missing_destination)
+
+    def _report_missing(self, rows, mask, column, label):
+        # 每個缺失的代碼只提示一次，但按行計入失敗數
+        for code in rows.loc[mask, column].drop_duplicates():
+            self.result.warn(f'找不到{label}：{code}')
+        self.result.error_count += int(mask.sum())
+
+
+class RateImporter(_Importer):
+    """Upsert BaseRate rows from rate sheets using set-based lookups and bulk statements"""
+
+    columns = RATE_COLUMNS
+    label = '運費'
+
+    def __init__(self):
+        super().__init__()
+        self._container_type_ids = None
+
+    def process(self, df):
+        result = self.result
+        if df.empty:
+            return result
+        if self._container_type_ids is None:
+            self._container_type_ids = dict(db.session.query(ContainerType.code, ContainerType.id).all())
+
+        rows, valid = self._resolve_ports(df)
+        rows['container_type_id'] = _codes(df['櫃型代碼']).map(self._container_type_ids)
+        missing_container = valid & rows['container_type_id'].isna()
+        rows['container_code'] = _codes(df['櫃型代碼'])
+        self._report_missing(rows, missing_container, 'container_code', '櫃型代碼')
+        valid &= ~missing_container
+
+        # 數值和日期無法解析的行記為失敗
+        rows['price'] = pd.to_numeric(df['基本運費'], errors='coerce')
+        rows['currency'] = df['貨幣']
+        rows['transit_time'] = pd.to_numeric(df['航程時間'], errors='coerce')
+        rows['effective_date'] = pd.to_datetime(df['生效日期'], errors='coerce')
+        if '失效日期' in df.columns:
+            rows['expiry_date'] = pd.to_datetime(df['失效日期'], errors='coerce')
+            bad_expiry = rows['expiry_date'].isna() & df['失效日期'].notna()
+        else:
+            rows['expiry_date'] = pd.NaT
+            bad_expiry = False
+        malformed = valid & (rows['price'].isna() | rows['currency'].isna()
+                             | rows['effective_date'].isna() | bad_expiry)
+        result.error_count += int(malformed.sum())
+        rows = rows[valid & ~malformed].copy()
+        if rows.empty:
+            return result
+        rows['origin_port_id'] = rows['origin_port_id'].astype(int)
+        rows['destination_port_id'] = rows['destination_port_id'].astype(int)
+        rows['container_type_id'] = rows['container_type_id'].astype(int)
+
+        # 航線：與緩存的航線表合併，缺少的批量創建
+        rows = rows.merge(self.routes(), on=['origin_port_id', 'destination_port_id'], how='left')
+        new_routes = rows[rows['route_id'].isna()].drop_duplicates(['origin_port_id', 'destination_port_id'])
+        bad_transit = new_routes['transit_time'].isna()
+        if bad_transit.any():
+            # 需要新建航線但航程時間無效的行無法導入
+            bad_pairs = new_routes.loc[bad_transit, ['origin_port_id', 'destination_port_id']]
+            unroutable = rows.merge(bad_pairs, how='left', indicator=True)['_merge'].eq('both').to_numpy()
+            result.error_count += int(unroutable.sum())
+            rows = rows[~unroutable]
+            new_routes = new_routes[~bad_transit]
+        if not new_routes.empty:
+            db.session.execute(Route.__table__.insert(), [{
+                'origin_port_id': int(route.origin_port_id),
+                'destination_port_id': int(route.destination_port_id),
+                'transit_time': int(route.transit_time),
+                'description': f'從{route.origin_name}到{route.destination_name}'
+            } for route in new_routes.itertuples()])
+            changes.mark_changed(db.session, Route.__tablename__)
+            self._route_frame = None
+            rows = rows.drop(columns='route_id').merge(
+                self.routes(), on=['origin_port_id', 'destination_port_id'], how='left')
+        if rows.empty:
+            return result
+        rows['route_id'] = rows['route_id'].astype(int)
+        rows['effective_date'] = rows['effective_date'].dt.date
+
+        # 運費：同一鍵出現多次時以最後一行為準（與逐行導入結果相同）
+        result.success_count += len(rows)
+        key = ['route_id', 'container_type_id', 'effective_date']
+        rows = rows.drop_duplicates(key, keep='last')
+        rows = rows.merge(_existing_rate_frame(rows['route_id'].unique().tolist()), on=key, how='left')
+
+        updates = rows[rows['rate_id'].notna()]
+        inserts = rows[rows['rate_id'].isna()]
+        if not updates.empty:
+            db.session.bulk_update_mappings(BaseRate, [{
+                'id': int(rate.rate_id),
+                'price': float(rate.price),
+                'currency': rate.currency,
+                'expiry_date': _date_or_none(rate.expiry_date)
+            } for rate in updates.itertuples()])
+        if not inserts.empty:
+            db.session.bulk_insert_mappings(BaseRate, [{
+                'route_id': int(rate.route_id),
+                'container_type_id': int(rate.container_type_id),
+                'price': float(rate.price),
+                'currency': rate.currency,
+                'effective_date': rate.effective_date,
+                'expiry_date': _date_or_none(rate.expiry_date)
+            } for rate in inserts.itertuples()])
+        changes.mark_changed(db.session, BaseRate.__tablename__)
+        return result
+
+
+class ScheduleImporter(_Importer):
+    """Upsert VesselSchedule rows from schedule sheets using set-based lookups and bulk statements"""
+
+    columns = SCHEDULE_COLUMNS
+    label = '船期'
+
+    def process(self, df):
+        result = self.result
+        if df.empty:
+            return result
+
+        rows, valid = self._resolve_ports(df)
+        rows = rows[valid].copy()
+        rows['origin_port_id'] = rows['origin_port_id'].astype(int)
+        rows['destination_port_id'] = rows['destination_port_id'].astype(int)
+        rows = rows.reset_index().merge(
+            self.routes(), on=['origin_port_id', 'destination_port_id'], how='left').set_index('index')
+
+        # 船期只掛在既有航線上
+        missing_route = rows['route_id'].isna()
+        for pair in rows.loc[missing_route, ['origin_code', 'destination_code']].drop_duplicates().itertuples():
+            result.warn(f'找不到從{pair.origin_code}到{pair.destination_code}的航線')
+        result.error_count += int(missing_route.sum())
+        rows = rows[~missing_route].copy()
+
+        rows['vessel_name'] = df['船名']
+        rows['voyage'] = df['航次']
+        rows['departure_date'] = pd.to_datetime(df['開航日期'], errors='coerce')
+        rows['arrival_date'] = pd.to_datetime(df['到達日期'], errors='coerce')
+        malformed = (rows['vessel_name'].isna() | rows['voyage'].isna()
+                     | rows['departure_date'].isna() | rows['arrival_date'].isna())
+        result.error_count += int(malformed.sum())
+        rows = rows[~malformed]
+        if rows.empty:
+            return result
+        rows['route_id'] = rows['route_id'].astype(int)
+        rows['vessel_name'] = rows['vessel_name'].astype(str)
+        rows['voyage'] = rows['voyage'].astype(str)
+        rows['departure_date'] = rows['departure_date'].dt.date
+        rows['arrival_date'] = rows['arrival_date'].dt.date
+
+        result.success_count += len(rows)
+        key = ['route_id', 'vessel_name', 'voyage', 'departure_date']
+        rows = rows.drop_duplicates(key, keep='last')
+        rows = rows.merge(_existing_schedule_frame(rows['route_id'].unique().tolist(),
+                                                   rows['departure_date'].min(), rows['departure_date'].max()),
+                          on=key, how='left')
+
+        updates = rows[rows['schedule_id'].notna()]
+        inserts = rows[rows['schedule_id'].isna()]
+        if not updates.empty:
+            db.session.bulk_update_mappings(VesselSchedule, [{
+                'id': int(schedule.schedule_id),
+                'arrival_date': schedule.arrival_date
+            } for schedule in updates.itertuples()])
+        if not inserts.empty:
+            db.session.bulk_insert_mappings(VesselSchedule, [{
+                'route_id': int(schedule.route_id),
+                'vessel_name': schedule.vessel_name,
+                'voyage': schedule.voyage,
+                'departure_date': schedule.departure_date,
+                'arrival_date': schedule.arrival_date
+            } for schedule in inserts.itertuples()])
+        changes.mark_changed(db.session, VesselSchedule.__tablename__)
+        return result
+
+
+def _codes(series):
+    return series.astype(str)
+
+
+def _date_or_none(value):
+    return None if pd.isna(value) else value.date()
+
+
+def _existing_rate_frame(route_ids):
+    records = []
+    for start in range(0, len(route_ids), LOOKUP_CHUNK_SIZE):
+        chunk = route_ids[start:start + LOOKUP_CHUNK_SIZE]
+        records.extend(db.session.query(
+            BaseRate.id, BaseRate.route_id, BaseRate.container_type_id, BaseRate.effective_date
+        ).filter(BaseRate.route_id.in_(chunk)).all())
+    rates = pd.DataFrame(records, columns=['rate_id', 'route_id', 'container_type_id', 'effective_date'])
+    rates = rates.astype({'rate_id': 'float64', 'route_id': 'int64', 'container_type_id': 'int64'})
+    return rates.drop_duplicates(['route_id', 'container_type_id', 'effective_date'])
+
+
+def _existing_schedule_frame(route_ids, first_departure, last_departure):
+    records = []
+    for start in range(0, len(route_ids), LOOKUP_CHUNK_SIZE):
+        chunk = route_ids[start:start + LOOKUP_CHUNK_SIZE]
+        records.extend(db.session.query(
+            VesselSchedule.id, VesselSchedule.route_id, VesselSchedule.vessel_name,
+            VesselSchedule.voyage, VesselSchedule.departure_date
+        ).filter(
+            VesselSchedule.route_id.in_(chunk),
+            VesselSchedule.departure_date >= first_departure,
+            VesselSchedule.departure_date <= last_departure
+        ).all())
+    schedules = pd.DataFrame(records, columns=['schedule_id', 'route_id', 'vessel_name', 'voyage', 'departure_date'])
+    schedules = schedules.astype({'schedule_id': 'float64', 'route_id': 'int64',
+                                  'vessel_name': 'object', 'voyage': 'object'})
+    return schedules.drop_duplicates(['route_id', 'vessel_name', 'voyage', 'departure_date'])
@@ -0,0 +1,227 @@
+from flask import current_app
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from .app import db
+from .models import ImportJob
+from .metrics import record_import
+from . import changes, tasks
+
+logger = logging.getLogger(__name__)
+
+# 支持的上傳格式：Excel 以唯讀模式逐行讀取，CSV/Parquet 按塊讀取
+SUPPORTED_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.parquet')
+
+# 導入任務類型對應的導入器及其寫入的資料表
+IMPORT_KINDS = {
+    'rates': ('RateImporter', ('routes', 'base_rates')),
+    'schedules': ('ScheduleImporter', ('vessel_schedules',)),
+}
+
+# 傳給導入子進程的配置：子進程須寫入同一數據庫、數據版本文件及運費快照文件
+WORKER_CONFIG = ('SQLALCHEMY_DATABASE_URI', 'DATA_VERSION_FILE', 'RATE_SNAPSHOT_FILE', 'IMPORT_CHUNK_SIZE')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn 啟動的子進程不繼承web進程的數據庫連接和線程
+            _executor = ProcessPoolExecutor(
+                max_workers=current_app.config.get('IMPORT_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def _discard_executor(broken):
+    # 子進程異常退出（如被 OOM 終止）後進程池不可再用，丟棄後下次提交重新建立
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+def _submit(*args):
+    executor = _get_executor()
+    try:
+        return executor, executor.submit(*args)
+    except BrokenProcessPool:
+        # 進程池已損壞：重建後重試一次
+        _discard_executor(executor)
+        executor = _get_executor()
+        return executor, executor.submit(*args)
+
+
+def _abandon(job_id, path, error):
+    # 任務未能在子進程中運行，臨時文件不會被子進程刪除
+    _finish(job_id, 'failed', error=str(error))
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+def submit_import(kind, path, filename, user_id=None):
+    """Record an import job for an uploaded file and hand it to the worker pool"""
+    job = ImportJob(kind=kind, filename=filename, user_id=user_id, status='pending')
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+
+    if current_app.config.get('IMPORT_JOB_EXECUTOR') == 'inline':
+        _record(kind, _run_job(job_id, kind, path))
+        return job_id
+
+    app = current_app._get_current_object()
+    try:
+        executor, future = _submit(tasks.run_import_job, job_id, kind, path,
+                                   {key: app.config[key] for key in WORKER_CONFIG})
+    except BrokenProcessPool as e:
+        logger.exception('導入進程池不可用，任務 %d 失敗', job_id)
+        _abandon(job_id, path, e)
+        return job_id
+
+    def _done(future):
+        # 子進程中的提交不會通知本進程，完成後讓本進程的緩存失效；
+        # 數據版本已由子進程遞增，再次遞增會使子進程發布的運費快照與版本不符
+        changes.notify(IMPORT_KINDS[kind][1], shared=False)
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            _discard_executor(executor)
+        if error is not None:
+            with app.app_context():
+                _abandon(job_id, path, error)
+                db.session.remove()
+        else:
+            _record(kind, future.result())
+
+    future.add_done_callback(_done)
+    return job_id
+
+
+def _record(kind, summary):
+    # 子進程中的計數無法被本進程的 /metrics 看到，由任務返回的摘要在本進程記錄
+    if summary is not None:
+        record_import(kind, *summary)
+
+
+def _run_job(job_id, kind, path):
+    """Run one import job; returns (status, rows processed, successes, errors, seconds) once it ran"""
+    from . import importers
+    from .rate_snapshot import SNAPSHOT_TABLES
+
+    try:
+        job = ImportJob.query.get(job_id)
+        if job.status == 'cancelled' or job.cancel_requested:
+            _finish(job_id, 'cancelled')
+            return
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+
+        importer = getattr(importers, IMPORT_KINDS[kind][0])()
+        started = time.monotonic()
+
+        def progress(result):
+            _update_counts(job_id, result)
+            if db.session.query(ImportJob.cancel_requested).filter_by(id=job_id).scalar():
+                raise JobCancelled()
+
+        try:
+            importer.run_file(path, progress=progress)
+            status = 'completed'
+            _finish(job_id, status, importer.result)
+        except JobCancelled:
+            # 已提交的分塊保留，停止處理後續分塊
+            status = 'cancelled'
+            _finish(job_id, status, importer.result)
+        except Exception as e:
+            db.session.rollback()
+            status = 'failed'
+            _finish(job_id, status, importer.result, error=str(e))
+        if set(IMPORT_KINDS[kind][1]) & set(SNAPSHOT_TABLES):
+            _publish_snapshot()
+        result = importer.result
+        return status, result.rows_processed, result.success_count, result.error_count, time.monotonic() - started
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def _publish_snapshot():
+    from .rate_snapshot import publish
+
+    if not current_app.config.get('RATE_SNAPSHOT_FILE'):
+        return
+    try:
+        publish()
+    except Exception:
+        # 發布失敗時各進程繼續從數據庫構建運費索引，不影響導入結果
+        logger.exception('發布運費快照失敗')
+
+
+def _update_counts(job_id, result):
+    ImportJob.query.filter_by(id=job_id).update({
+        'rows_processed': result.rows_processed,
+        'success_count': result.success_count,
+        'error_count': result.error_count,
+    })
+    db.session.commit()
+
+
+def _finish(job_id, status, result=None, error=None):
+    values = {'status': status, 'finished_at': datetime.utcnow()}
+    messages = []
+    if result is not None:
+        values.update({
+            'rows_processed': result.rows_processed,
+            'success_count': result.success_count,
+            'error_count': result.error_count,
+        })
+        messages = list(result.messages)
+    if error:
+        messages.append((error, 'danger'))
+    values['messages'] = json.dumps(messages, ensure_ascii=False)
+    ImportJob.query.filter_by(id=job_id).update(values)
+    db.session.commit()
+
+
+def cancel_job(job):
+    """Request cancellation; running jobs stop after the chunk in progress"""
+    if job.status in ('pending', 'running'):
+        job.cancel_requested = True
+        if job.status == 'pending':
+            job.status = 'cancelled'
+            job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def job_status(job):
+    end = job.finished_at or (datetime.utcnow() if job.started_at else None)
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'filename': job.filename,
+        'status': job.status,
+        'cancel_requested': job.cancel_requested,
+        'rows_processed': job.rows_processed,
+        'success_count': job.success_count,
+        'error_count': job.error_count,
+        'messages': [{'message': message, 'category': category}
+                     for message, category in json.loads(job.messages or '[]')],
+        'created_at': job.created_at.strftime('%Y-%m-%d %H:%M:%S') if job.created_at else None,
+        'duration': round((end - job.started_at).total_seconds(), 3) if job.started_at else None,
+    }
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, redirect, url_for
 from .auth import login_required
-from .models import Port, ContainerType, Route, BaseRate, VesselSchedule
+from .db_routing import read_only
+from .dashboard_stats import dashboard_stats
 
 main_bp = Blueprint('main', __name__)
 
@@ -10,28 +11,10 @@ def index():
 
 @main_bp.route('/dashboard')
 @login_required
+@read_only
 def dashboard():
-    # 獲取基本統計數據
-    port_count = Port.query.count()
-    container_type_count = ContainerType.query.count()
-    route_count = Route.query.count()
-    rate_count = BaseRate.query.count()
-    schedule_count = VesselSchedule.query.count()
-    
-    # 獲取最新的運費數據
-    latest_rates = BaseRate.query.order_by(BaseRate.effective_date.desc()).limit(5).all()
-    
-    # 獲取最新的船期數據
-    latest_schedules = VesselSchedule.query.order_by(VesselSchedule.departure_date.desc()).limit(5).all()
-    
-    return render_template('main/dashboard.html', 
-                          port_count=port_count,
-                          container_type_count=container_type_count,
-                          route_count=route_count,
-                          rate_count=rate_count,
-                          schedule_count=schedule_count,
-                          latest_rates=latest_rates,
-                          latest_schedules=latest_schedules)
+    # 統計數據來自進程內緩存，導入或編輯提交後失效
+    return render_template('main/dashboard.html', **dashboard_stats.current())
 
 @main_bp.route('/about')
 def about():
@@ -0,0 +1,207 @@
+from flask import Blueprint, Response, current_app, g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from bisect import bisect_left
+import logging
+import threading
+import time
+from .quote_log import quote_log
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# 請求耗時直方圖的桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# 每個請求SQL語句數直方圖的桶
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+# 不在請求中執行的SQL（後台寫入線程、導入任務等）記在此端點名下
+BACKGROUND = 'background'
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._samples(items))
+        return lines
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labels, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self, items):
+        return [f'{self.name}{self._label_text(labels)} {_number(value)}' for labels, value in items]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels, buckets):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # 各桶計數（非累計）、總和、總數
+                counts = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts[0][bisect_left(self.buckets, value)] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def _samples(self, items):
+        lines = []
+        for labels, (buckets, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), buckets):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else _number(bound)
+                lines.append(f'{self.name}_bucket{self._label_text(labels, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{self._label_text(labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{self._label_text(labels)} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency by endpoint',
+                            ('endpoint', 'method'), LATENCY_BUCKETS)
+REQUESTS = Counter('http_requests_total', 'Requests by endpoint and status', ('endpoint', 'method', 'status'))
+REQUEST_STATEMENTS = Histogram('http_request_sql_statements', 'SQL statements issued per request',
+                               ('endpoint',), STATEMENT_BUCKETS)
+SQL_STATEMENTS = Counter('sql_statements_total', 'SQL statements executed by endpoint', ('endpoint',))
+SQL_SECONDS = Counter('sql_duration_seconds_total', 'Time spent executing SQL by endpoint', ('endpoint',))
+IMPORT_ROWS = Counter('import_rows_total', 'Rows read by import jobs', ('kind', 'outcome'))
+IMPORT_SECONDS = Counter('import_duration_seconds_total', 'Time spent running import jobs', ('kind',))
+IMPORT_JOBS = Counter('import_jobs_total', 'Finished import jobs by status', ('kind', 'status'))
+
+METRICS = (REQUEST_LATENCY, REQUESTS, REQUEST_STATEMENTS, SQL_STATEMENTS, SQL_SECONDS, IMPORT_ROWS, IMPORT_SECONDS,
+           IMPORT_JOBS)
+
+
+def record_import(kind, status, rows_processed, success_count, error_count, seconds):
+    """Count a finished import job; rate(import_rows_total) gives rows per second"""
+    IMPORT_JOBS.inc(kind, status)
+    IMPORT_ROWS.inc(kind, 'success', amount=success_count)
+    IMPORT_ROWS.inc(kind, 'error', amount=error_count)
+    IMPORT_ROWS.inc(kind, 'total', amount=rows_processed)
+    IMPORT_SECONDS.inc(kind, amount=seconds)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    # 報價日誌緩衝的計數由其自身維護
+    for name, documentation, value in (
+            ('quote_log_written_total', 'Quote log rows written', quote_log.written),
+            ('quote_log_dropped_total', 'Quote log rows dropped', quote_log.dropped)):
+        lines.extend([f'# HELP {name} {documentation}', f'# TYPE {name} counter', f'{name} {value}'])
+    lines.extend(['# HELP quote_log_pending Quote log rows waiting to be written', '# TYPE quote_log_pending gauge',
+                  f'quote_log_pending {quote_log.pending()}'])
+    return '\n'.join(lines) + '\n'
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    # 每個工作進程各自統計，由Prometheus分別抓取
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+class _RequestStats:
+    def __init__(self, capture):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        # 僅在開啟慢請求日誌時保存語句
+        self.captured = [] if capture else None
+
+
+@metrics_bp.before_app_request
+def _start_request():
+    config = current_app.config
+    g.request_stats = _RequestStats(bool(config.get('SLOW_REQUEST_MS')))
+
+
+@metrics_bp.after_app_request
+def _record_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@metrics_bp.teardown_app_request
+def _finish_request(exc):
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return
+    elapsed = time.perf_counter() - stats.started
+    endpoint = request.endpoint or 'unknown'
+    status = 500 if exc is not None else g.pop('response_status', 500)
+    REQUEST_LATENCY.observe(elapsed, endpoint, request.method)
+    REQUESTS.inc(endpoint, request.method, str(status))
+    REQUEST_STATEMENTS.observe(stats.statements, endpoint)
+
+    threshold = current_app.config.get('SLOW_REQUEST_MS')
+    if threshold and elapsed * 1000 >= threshold:
+        logger.warning('慢請求 %s %s（%s）：%.1f 毫秒，SQL %d 條共 %.1f 毫秒%s', request.method, request.path, endpoint,
+                       elapsed * 1000, stats.statements, stats.sql_seconds * 1000,
+                       ''.join(f'\n  {ms:.1f} ms  {statement}' for ms, statement in stats.captured or ()))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    elapsed = time.perf_counter() - started
+    stats = g.get('request_stats') if has_request_context() else None
+    if stats is None:
+        endpoint = BACKGROUND
+    else:
+        endpoint = request.endpoint or 'unknown'
+        stats.statements += 1
+        stats.sql_seconds += elapsed
+        if stats.captured is not None and len(stats.captured) < current_app.config['SLOW_REQUEST_MAX_STATEMENTS']:
+            stats.captured.append((elapsed * 1000, ' '.join(statement.split())))
+    SQL_STATEMENTS.inc(endpoint)
+    SQL_SECONDS.inc(endpoint, amount=elapsed)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _cursor_error(context):
+    # 執行失敗時沒有 after_cursor_execute，丟棄對應的開始時間
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
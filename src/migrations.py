@@ -0,0 +1,134 @@
+from sqlalchemy import inspect, func, select
+from datetime import date
+import argparse
+import sys
+from .app import app, db
+from .models import Route, BaseRate, VesselSchedule
+
+
+class MigrationError(Exception):
+    pass
+
+
+def upgrade(engine=None):
+    """Create missing tables, nullable columns and indexes declared in models.py on an existing database"""
+    engine = engine or db.engine
+    db.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                _add_column(engine, table, column)
+                created.append(f'{table.name}.{column.name}')
+
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name in existing:
+                continue
+            if index.unique:
+                _check_duplicates(engine, table, index)
+            index.create(bind=engine)
+            created.append(index.name)
+    return created
+
+
+def _add_column(engine, table, column):
+    # 已有數據的表只能自動加入可為空的欄位，非空欄位需要人工遷移填充數據
+    if not column.nullable:
+        raise MigrationError(f'{table.name} 缺少非空欄位 {column.name}，請手動遷移')
+    with engine.begin() as conn:
+        column_type = column.type.compile(dialect=conn.dialect)
+        preparer = conn.dialect.identifier_preparer
+        conn.exec_driver_sql(f'ALTER TABLE {preparer.format_table(table)} '
+                             f'ADD COLUMN {preparer.format_column(column)} {column_type}')
+
+
+def _check_duplicates(engine, table, index):
+    # 唯一索引建立前先檢查重複數據，由管理員決定保留哪一條
+    columns = list(index.columns)
+    query = select(*columns, func.count().label('rows')).group_by(*columns).having(func.count() > 1).limit(5)
+    with engine.connect() as conn:
+        duplicates = conn.execute(query).fetchall()
+    if duplicates:
+        keys = '；'.join(str(tuple(row)[:-1]) for row in duplicates)
+        raise MigrationError(f'{table.name} 存在重複數據，無法建立唯一索引 {index.name}：{keys}')
+
+
+# get_rate 相關查詢及其應使用的索引
+def _plan_queries():
+    today = date.today()
+    return [
+        ('route_lookup', 'uq_routes_origin_destination',
+         select(Route.id).where(Route.origin_port_id == 1, Route.destination_port_id == 2).limit(1)),
+        ('current_rate', 'uq_base_rates_route_container_effective',
+         select(BaseRate.id).where(
+             BaseRate.route_id == 1,
+             BaseRate.container_type_id == 1,
+             BaseRate.effective_date <= today,
+             (BaseRate.expiry_date >= today) | (BaseRate.expiry_date.is_(None))
+         ).order_by(BaseRate.effective_date.desc()).limit(1)),
+        ('next_sailings', 'uq_vessel_schedules_route_departure_voyage',
+         select(VesselSchedule.id).where(
+             VesselSchedule.route_id == 1,
+             VesselSchedule.departure_date >= today,
+             VesselSchedule.departure_date <= today
+         ).order_by(VesselSchedule.departure_date).limit(3)),
+    ]
+
+
+def explain(conn, statement):
+    compiled = statement.compile(dialect=conn.dialect)
+    if conn.dialect.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    rows = conn.exec_driver_sql(prefix + str(compiled), params).fetchall()
+    return '\n'.join(' '.join(str(value) for value in row) for row in rows)
+
+
+def check_query_plans(engine=None):
+    """Return (name, expected index, plan, uses index) for each quote query"""
+    engine = engine or db.engine
+    results = []
+    with engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            # 小表上規劃器傾向順序掃描，關閉後檢查索引是否可用
+            conn.exec_driver_sql('SET enable_seqscan = off')
+        for name, index_name, statement in _plan_queries():
+            plan = explain(conn, statement)
+            results.append((name, index_name, plan, index_name in plan))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='數據庫結構升級工具')
+    parser.add_argument('command', choices=['upgrade', 'check'])
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        if args.command == 'upgrade':
+            try:
+                created = upgrade()
+            except MigrationError as e:
+                print(e)
+                return 1
+            print('已建立欄位及索引：' + ('、'.join(created) if created else '無'))
+            return 0
+
+        failed = False
+        for name, index_name, plan, ok in check_query_plans():
+            print(f'[{"OK" if ok else "FAIL"}] {name}：{index_name}')
+            print('    ' + plan.replace('\n', '\n    '))
+            failed |= not ok
+        return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -42,6 +42,9 @@ class ContainerType(db.Model):
 
 class Route(db.Model):
     __tablename__ = 'routes'
+    __table_args__ = (
+        db.Index('uq_routes_origin_destination', 'origin_port_id', 'destination_port_id', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     origin_port_id = db.Column(db.Integer, db.ForeignKey('ports.id'), nullable=False)
@@ -53,10 +56,17 @@ class Route(db.Model):
     destination_port = db.relationship('Port', foreign_keys=[destination_port_id])
 
     def __repr__(self):
-        return f'<Route {self.id} - {self.origin_port.code} to {self.destination_port.code}>'
+        return f'<Route {self.id} - {self.origin_port_id} to {self.destination_port_id}>'
 
 class BaseRate(db.Model):
     __tablename__ = 'base_rates'
+    __table_args__ = (
+        # 報價查詢及導入更新均按此鍵定位運費
+        db.Index('uq_base_rates_route_container_effective', 'route_id', 'container_type_id', 'effective_date',
+                 unique=True),
+        # 管理列表按 (生效日期, ID) 分頁
+        db.Index('ix_base_rates_effective_id', 'effective_date', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     route_id = db.Column(db.Integer, db.ForeignKey('routes.id'), nullable=False)
@@ -70,7 +80,7 @@ class BaseRate(db.Model):
     container_type = db.relationship('ContainerType')
 
     def __repr__(self):
-        return f'<BaseRate {self.id} - {self.route.origin_port.code} to {self.route.destination_port.code} - {self.container_type.code}>'
+        return f'<BaseRate {self.id} - route {self.route_id} - container type {self.container_type_id}>'
 
 class Surcharge(db.Model):
     __tablename__ = 'surcharges'
@@ -97,10 +107,27 @@ class RateSurcharge(db.Model):
     surcharge = db.relationship('Surcharge')
 
     def __repr__(self):
-        return f'<RateSurcharge {self.id} - {self.surcharge.code}>'
+        return f'<RateSurcharge {self.id} - surcharge {self.surcharge_id}>'
+
+class ExchangeRate(db.Model):
+    __tablename__ = 'exchange_rates'
+    __table_args__ = (
+        db.Index('uq_exchange_rates_currency_effective', 'currency', 'effective_date', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    currency = db.Column(db.String(3), nullable=False)
+    rate = db.Column(db.Float, nullable=False)  # 1單位該貨幣折合的基準貨幣金額
+    effective_date = db.Column(db.Date, nullable=False)
+
+    def __repr__(self):
+        return f'<ExchangeRate {self.currency} {self.rate} @ {self.effective_date}>'
 
 class QuoteQuery(db.Model):
     __tablename__ = 'quote_queries'
+    __table_args__ = (
+        db.Index('ix_quote_queries_user_date', 'user_id', 'query_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -110,6 +137,7 @@ class QuoteQuery(db.Model):
     query_date = db.Column(db.DateTime, default=datetime.utcnow)
     result_rate = db.Column(db.Float, nullable=True)
     result_currency = db.Column(db.String(3), nullable=True)
+    latency_ms = db.Column(db.Float, nullable=True)  # 報價處理耗時（毫秒）
 
     user = db.relationship('User')
     origin_port = db.relationship('Port', foreign_keys=[origin_port_id])
@@ -117,11 +145,14 @@ class QuoteQuery(db.Model):
     container_type = db.relationship('ContainerType')
 
     def __repr__(self):
-        return f'<QuoteQuery {self.id} - {self.origin_port.code} to {self.destination_port.code}>'
+        return f'<QuoteQuery {self.id} - {self.origin_port_id} to {self.destination_port_id}>'
 
 # 新增的Booking模型
 class Booking(db.Model):
     __tablename__ = 'bookings'
+    __table_args__ = (
+        db.Index('ix_bookings_user_date', 'user_id', 'booking_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -139,6 +170,13 @@ class Booking(db.Model):
 # 新增的VesselSchedule模型
 class VesselSchedule(db.Model):
     __tablename__ = 'vessel_schedules'
+    __table_args__ = (
+        # 前兩列服務按航線和開航日期的篩選排序，整體為導入更新的唯一鍵
+        db.Index('uq_vessel_schedules_route_departure_voyage', 'route_id', 'departure_date', 'vessel_name', 'voyage',
+                 unique=True),
+        # 管理列表按 (開航日期, ID) 分頁
+        db.Index('ix_vessel_schedules_departure_id', 'departure_date', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     route_id = db.Column(db.Integer, db.ForeignKey('routes.id'), nullable=False)
@@ -151,3 +189,58 @@ class VesselSchedule(db.Model):
 
     def __repr__(self):
         return f'<VesselSchedule {self.id} - {self.vessel_name} {self.voyage}>'
+
+# 後台導入任務
+class ImportJob(db.Model):
+    __tablename__ = 'import_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # rates, schedules
+    filename = db.Column(db.String(200), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    status = db.Column(db.String(20), default='pending')  # pending, running, completed, failed, cancelled
+    cancel_requested = db.Column(db.Boolean, default=False, nullable=False)
+    rows_processed = db.Column(db.Integer, default=0, nullable=False)
+    success_count = db.Column(db.Integer, default=0, nullable=False)
+    error_count = db.Column(db.Integer, default=0, nullable=False)
+    messages = db.Column(db.Text, nullable=True)  # JSON格式的提示列表
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    user = db.relationship('User')
+
+    def __repr__(self):
+        return f'<ImportJob {self.id} - {self.kind} {self.status}>'
+
+# 航線需求日匯總（航線 × 櫃型 × 日），由 analytics 按高水位增量維護
+class LaneDailyStat(db.Model):
+    __tablename__ = 'lane_daily_stats'
+    __table_args__ = (
+        db.Index('uq_lane_daily_stats_day_lane', 'day', 'origin_port_id', 'destination_port_id', 'container_type_id',
+                 unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    origin_port_id = db.Column(db.Integer, db.ForeignKey('ports.id'), nullable=False)
+    destination_port_id = db.Column(db.Integer, db.ForeignKey('ports.id'), nullable=False)
+    container_type_id = db.Column(db.Integer, db.ForeignKey('container_types.id'), nullable=False)
+    quote_count = db.Column(db.Integer, default=0, nullable=False)
+    priced_count = db.Column(db.Integer, default=0, nullable=False)  # 有報價結果且可換算為基準貨幣的次數
+    price_sum = db.Column(db.Float, default=0, nullable=False)  # 基準貨幣
+    booking_count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<LaneDailyStat {self.day} {self.origin_port_id}-{self.destination_port_id} {self.container_type_id}>'
+
+# 增量匯總的高水位：每個來源表已處理的最大ID
+class RollupState(db.Model):
+    __tablename__ = 'rollup_states'
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<RollupState {self.name} {self.last_id}>'
@@ -0,0 +1,197 @@
+from collections import namedtuple, deque
+from .app import db
+from .cache import ReloadingCache
+from .models import Port, ContainerType
+from . import changes
+
+PortRef = namedtuple('PortRef', 'id code name')
+ContainerRef = namedtuple('ContainerRef', 'id code name')
+QueryMatch = namedtuple('QueryMatch', 'origin_port destination_port container_type')
+# exact_ports / exact_container_types 按原樣的代碼或名稱精確查找
+MatcherSnapshot = namedtuple('MatcherSnapshot', 'automaton exact_ports exact_container_types')
+
+# 常見縮寫對應的港口代碼或名稱
+ABBREVIATION_MAP = {
+    'shanghai': ['sha', '上海'],
+    'sha': ['sha', '上海'],
+    'los angeles': ['lax', '洛杉磯'],
+    'lax': ['lax', '洛杉磯'],
+    'kaohsiung': ['khh', '高雄'],
+    'kh': ['khh', '高雄'],
+}
+
+# 緊接在港口前的起運港/目的港標記
+ORIGIN_MARKERS = ['從', '自', '起運港', 'from']
+DESTINATION_MARKERS = ['到', '至', '目的港', 'to']
+
+_ORIGIN = 'origin'
+_DESTINATION = 'destination'
+_PORT = 'port'
+_CONTAINER = 'container'
+
+
+class Automaton:
+    """Aho-Corasick automaton yielding every (start, end, value) match in one pass"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+    def add(self, pattern, value):
+        node = 0
+        for ch in pattern:
+            child = self._goto[node].get(ch)
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[node][ch] = child
+            node = child
+        self._out[node].append((len(pattern), value))
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def iter_matches(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, value in out[node]:
+                yield i + 1 - length, i + 1, value
+
+
+def _is_word_char(ch):
+    return ch.isascii() and ch.isalnum()
+
+
+class PortMatcher(ReloadingCache):
+    """Finds port, container type and origin/destination markers in a free-text query"""
+
+    ttl_config = 'PORT_MATCHER_TTL'
+    tables = ('ports', 'container_types')
+
+    def build(self):
+        automaton = Automaton()
+
+        ports_by_key = {}
+        exact_ports = {}
+        for port_id, code, name in db.session.query(Port.id, Port.code, Port.name).order_by(Port.id):
+            port = PortRef(port_id, code, name)
+            exact_ports.setdefault(code, port)
+            exact_ports.setdefault(name, port)
+            for key in {code.lower(), name.lower()}:
+                automaton.add(key, (_PORT, port))
+                ports_by_key.setdefault(key, []).append(port)
+
+        for alias, targets in ABBREVIATION_MAP.items():
+            aliased = {port for target in targets for port in ports_by_key.get(target, [])}
+            for port in aliased:
+                automaton.add(alias, (_PORT, port))
+
+        exact_container_types = {}
+        for ct_id, code, name in db.session.query(
+                ContainerType.id, ContainerType.code, ContainerType.name).order_by(ContainerType.id):
+            container_type = ContainerRef(ct_id, code, name)
+            exact_container_types.setdefault(code, container_type)
+            exact_container_types.setdefault(name, container_type)
+            for key in {code.lower(), name.lower()}:
+                automaton.add(key, (_CONTAINER, container_type))
+
+        for marker in ORIGIN_MARKERS:
+            automaton.add(marker, (_ORIGIN, None))
+        for marker in DESTINATION_MARKERS:
+            automaton.add(marker, (_DESTINATION, None))
+
+        automaton.build()
+        return MatcherSnapshot(automaton, exact_ports, exact_container_types)
+
+    def find_port(self, value):
+        """Port whose code or name equals the value, as stored on bookings"""
+        return self.current().exact_ports.get(value)
+
+    def find_container_type(self, value):
+        return self.current().exact_container_types.get(value)
+
+    def tokens(self, text):
+        """Return non-overlapping (start, end, kind, value) tokens, leftmost-longest first"""
+        text = text.lower()
+        matches = []
+        for start, end, value in self.current().automaton.iter_matches(text):
+            # 英文代碼和名稱需要完整單詞，避免 "sha" 命中 "shanghai"
+            if _is_word_char(text[start]) and start > 0 and _is_word_char(text[start - 1]):
+                continue
+            if _is_word_char(text[end - 1]) and end < len(text) and _is_word_char(text[end]):
+                continue
+            matches.append((start, end, value))
+
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+        tokens = []
+        last_end = 0
+        for start, end, (kind, value) in matches:
+            if start < last_end:
+                # 同一位置的等長匹配（例如別名對應多個港口）保留
+                if tokens and tokens[-1][0] == start and tokens[-1][1] == end:
+                    tokens.append((start, end, kind, value))
+                continue
+            tokens.append((start, end, kind, value))
+            last_end = end
+        return tokens
+
+    def match(self, text):
+        origin_port = None
+        destination_port = None
+        container_type = None
+        mentioned = []
+        role = None
+        previous_end = 0
+        text_lower = text.lower()
+
+        for start, end, kind, value in self.tokens(text):
+            # 標記只作用於緊接其後（允許空白）的港口
+            if text_lower[previous_end:start].strip():
+                role = None
+            previous_end = end
+            if kind in (_ORIGIN, _DESTINATION):
+                role = kind
+                continue
+            if kind == _PORT:
+                if role == _ORIGIN and origin_port is None:
+                    origin_port = value
+                elif role == _DESTINATION and destination_port is None:
+                    destination_port = value
+                elif value not in mentioned:
+                    mentioned.append(value)
+            elif container_type is None:
+                container_type = value
+            role = None
+
+        # 缺少標記時按出現順序補齊起運港和目的港
+        for port in mentioned:
+            if origin_port is None and port != destination_port:
+                origin_port = port
+            elif destination_port is None and port != origin_port:
+                destination_port = port
+
+        return QueryMatch(origin_port, destination_port, container_type)
+
+
+port_matcher = PortMatcher()
+
+
+@changes.on_commit('ports', 'container_types')
+def _invalidate_port_matcher(tables):
+    port_matcher.invalidate()
@@ -0,0 +1,166 @@
+from collections import namedtuple
+import numpy as np
+from .app import db
+from .cache import ReloadingCache
+from .models import BaseRate, Surcharge, RateSurcharge
+from .fx import fx_table
+from . import changes
+
+SurchargeVectors = namedtuple('SurchargeVectors', 'rate_ids offsets amounts percentages currencies codes names '
+                                                  'fixed_totals percentage_totals')
+
+
+class SurchargeTable(ReloadingCache):
+    """Surcharges precompiled per rate into CSR-style arrays for vectorized all-in totals"""
+
+    ttl_config = 'RATE_ENGINE_TTL'
+    tables = ('base_rates', 'surcharges', 'rate_surcharges')
+
+    def build(self):
+        rows = db.session.query(
+            RateSurcharge.rate_id, Surcharge.code, Surcharge.name, RateSurcharge.amount,
+            RateSurcharge.percentage, RateSurcharge.currency, BaseRate.currency
+        ).join(Surcharge, RateSurcharge.surcharge_id == Surcharge.id
+        ).join(BaseRate, RateSurcharge.rate_id == BaseRate.id
+        ).order_by(RateSurcharge.rate_id, RateSurcharge.id).all()
+
+        count = len(rows)
+        component_rate_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+        # 有固定金額時使用金額，否則使用百分比；附加費貨幣為空時使用基本運費的貨幣
+        amounts = np.array([row[3] if row[3] is not None else 0.0 for row in rows], dtype=np.float64)
+        percentages = np.array([row[4] if row[3] is None and row[4] is not None else 0.0 for row in rows],
+                               dtype=np.float64)
+        currencies = [row[5] or row[6] for row in rows]
+        same_currency = np.array([row[5] is None or row[5] == row[6] for row in rows], dtype=bool)
+
+        rate_ids, starts = np.unique(component_rate_ids, return_index=True)
+        offsets = np.append(starts, count).astype(np.int64)
+        segments = np.repeat(np.arange(len(rate_ids)), np.diff(offsets))
+
+        # 每個運費預先彙總同幣種固定金額及百分比，批量計算時只需一次索引
+        fixed_totals = np.bincount(segments, weights=np.where(same_currency, amounts, 0.0), minlength=len(rate_ids))
+        percentage_totals = np.bincount(segments, weights=percentages, minlength=len(rate_ids))
+
+        return SurchargeVectors(rate_ids, offsets, amounts, percentages, currencies,
+                                [row[1] for row in rows], [row[2] for row in rows],
+                                fixed_totals, percentage_totals)
+
+    def _positions(self, vectors, rate_ids):
+        rate_ids = np.asarray(rate_ids, dtype=np.int64)
+        if not len(vectors.rate_ids):
+            return np.zeros(len(rate_ids), dtype=np.int64), np.zeros(len(rate_ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(vectors.rate_ids, rate_ids), len(vectors.rate_ids) - 1)
+        return positions, vectors.rate_ids[positions] == rate_ids
+
+    def totals(self, rate_ids, base_prices):
+        """All-in totals in each rate's own currency for many rates at once"""
+        vectors = self.current()
+        base_prices = np.asarray(base_prices, dtype=np.float64)
+        positions, found = self._positions(vectors, rate_ids)
+        if not found.any():
+            return base_prices.copy()
+        fixed = np.where(found, vectors.fixed_totals[positions], 0.0)
+        percentage = np.where(found, vectors.percentage_totals[positions], 0.0)
+        return base_prices + fixed + base_prices * percentage / 100
+
+    def breakdown(self, rate_id, base_price, currency):
+        """Itemized surcharges of one rate"""
+        vectors = self.current()
+        positions, found = self._positions(vectors, [rate_id])
+        if not found[0]:
+            return []
+        return self._items(vectors, positions[0], base_price, currency)
+
+    def _items(self, vectors, position, base_price, currency):
+        start, end = vectors.offsets[position], vectors.offsets[position + 1]
+        items = []
+        for i in range(start, end):
+            percentage = vectors.percentages[i] if vectors.percentages[i] else None
+            amount = base_price * percentage / 100 if percentage is not None else vectors.amounts[i]
+            items.append({
+                'code': vectors.codes[i],
+                'name': vectors.names[i],
+                'amount': round(float(amount), 2),
+                'currency': vectors.currencies[i] if percentage is None else currency,
+                'percentage': percentage,
+            })
+        return items
+
+
+surcharge_table = SurchargeTable()
+
+
+def all_in_quotes(rates):
+    """Base price, itemized surcharges and total for (rate_id, price, currency) tuples"""
+    if not rates:
+        return []
+    rate_ids = [rate[0] for rate in rates]
+    totals = surcharge_table.totals(rate_ids, [rate[1] for rate in rates])
+    vectors = surcharge_table.current()
+    positions, found = surcharge_table._positions(vectors, rate_ids)
+    quotes = []
+    for (rate_id, price, currency), total, position, has_surcharges in zip(rates, totals, positions, found):
+        surcharges = surcharge_table._items(vectors, position, price, currency) if has_surcharges else []
+        # 與基本運費幣種不同的固定附加費單獨列出，不計入總額
+        other_currencies = {}
+        for item in surcharges:
+            if item['currency'] != currency:
+                other_currencies[item['currency']] = round(other_currencies.get(item['currency'], 0) + item['amount'], 2)
+        quotes.append({
+            'surcharges': surcharges,
+            'total': round(float(total), 2),
+            'other_currency_charges': other_currencies,
+        })
+    return quotes
+
+
+def all_in_quote(rate_id, price, currency):
+    return all_in_quotes([(rate_id, price, currency)])[0]
+
+
+def add_other_currency_charges(rates, quotes, on_date):
+    """Convert surcharges billed in other currencies into each rate's currency and add them to its total
+
+    Charges without an applicable FX rate stay in other_currency_charges; callers list them next to the total.
+    """
+    # 按運費幣種分組，每組一次換算
+    groups = {}
+    for (rate_id, price, currency), quote in zip(rates, quotes):
+        for other_currency, amount in quote['other_currency_charges'].items():
+            groups.setdefault(currency, []).append((quote, other_currency, amount))
+    for currency, charges in groups.items():
+        converted = fx_table.convert([amount for _, _, amount in charges],
+                                     [other_currency for _, other_currency, _ in charges], currency, on_date)
+        for (quote, other_currency, amount), value in zip(charges, converted):
+            if not np.isnan(value):
+                quote['total'] = round(quote['total'] + float(value), 2)
+                del quote['other_currency_charges'][other_currency]
+    return quotes
+
+
+def convert_quotes(rates, quotes, currency, on_date):
+    """Add price and all-in total in one output currency to each quote; None where an FX rate is missing"""
+    # 總額與各外幣附加費攤平成一維數組，一次換算後按報價歸併
+    amounts, currencies, owners = [], [], []
+    for index, ((rate_id, price, rate_currency), quote) in enumerate(zip(rates, quotes)):
+        amounts.append(quote['total'])
+        currencies.append(rate_currency)
+        owners.append(index)
+        for other_currency, amount in quote['other_currency_charges'].items():
+            amounts.append(amount)
+            currencies.append(other_currency)
+            owners.append(index)
+    totals = np.bincount(owners, weights=fx_table.convert(amounts, currencies, currency, on_date),
+                         minlength=len(quotes))
+    prices = fx_table.convert([rate[1] for rate in rates], [rate[2] for rate in rates], currency, on_date)
+    for quote, price, total in zip(quotes, prices, totals):
+        if np.isnan(total):
+            quote['converted'] = None
+        else:
+            quote['converted'] = {'currency': currency, 'price': round(float(price), 2), 'total': round(float(total), 2)}
+    return quotes
+
+
+@changes.on_commit('base_rates', 'surcharges', 'rate_surcharges')
+def _invalidate_surcharge_table(tables):
+    surcharge_table.invalidate()
@@ -1,15 +1,37 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, send_file, session
-from .models import Port, ContainerType, Route, BaseRate, VesselSchedule, Booking
-from .auth import login_required
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, send_file, current_app, Response
+from sqlalchemy import and_, tuple_
+from .models import Port, ContainerType, Route, BaseRate, Booking
+from .auth import login_required, current_user_id, current_role
 from .app import db
+from .db_routing import read_only
+from .data_version import conditional
+from .rate_engine import rate_engine
+from .port_matcher import port_matcher
+from .pricing import all_in_quote, all_in_quotes, add_other_currency_charges, convert_quotes
+from .fx import parse_currency
+from .routing import find_itineraries
+from .sailing_index import sailing_index
+from .documents import booking_pdf_bytes, export_zip
+from .group_commit import GroupCommitter, GroupCommitTimeout
+from .quote_log import quote_log
 from datetime import datetime, timedelta
 import io
-from reportlab.pdfgen import canvas
+import time
 
 quote_bp = Blueprint('quote', __name__)
 
+booking_writer = GroupCommitter(Booking)
+
+# 批量報價每次查詢的航線數（每條航線3個綁定參數）
+BATCH_CHUNK_SIZE = 300
+# 船期搜尋默認及最多返回的班次數
+SCHEDULE_SEARCH_LIMIT = 100
+SCHEDULE_SEARCH_MAX_LIMIT = 1000
+
 @quote_bp.route('/')
 @login_required
+@conditional
+@read_only
 def index():
     ports = Port.query.order_by(Port.name).all()
     container_types = ContainerType.query.order_by(ContainerType.name).all()
@@ -17,67 +39,300 @@ def index():
 
 @quote_bp.route('/get_rate', methods=['POST'])
 @login_required
+@read_only
 def get_rate():
-    origin_port_id = request.form.get('origin_port')
-    destination_port_id = request.form.get('destination_port')
-    container_type_id = request.form.get('container_type')
-    
-    # 查詢航線
-    route = Route.query.filter_by(
-        origin_port_id=origin_port_id,
-        destination_port_id=destination_port_id
-    ).first()
+    return _rate_response(request.form)
+
+@quote_bp.route('/rate')
+@login_required
+@conditional
+@read_only
+def rate_lookup():
+    """GET form of get_rate, cacheable by browsers and CDNs until the next data change"""
+    return _rate_response(request.args)
+
+def _rate_response(params):
+    started = time.perf_counter()
+    origin_port_id = params.get('origin_port')
+    destination_port_id = params.get('destination_port')
+    container_type_id = params.get('container_type')
+    try:
+        currency = parse_currency(params.get('currency'))
+    except ValueError:
+        return jsonify({'success': False, 'message': '貨幣代碼不正確'}), 400
+
+    result = _quote_lane(origin_port_id, destination_port_id, container_type_id, currency)
+    rate = result.get('rate')
+    quote_log.record(current_user_id(), origin_port_id, destination_port_id, container_type_id,
+                     rate['total'] if rate else None, rate['currency'] if rate else None, started)
+    return jsonify(result)
+
+def _quote_lane(origin_port_id, destination_port_id, container_type_id, currency=None):
+    # 查詢航線（進程內運費引擎，不經過數據庫）
+    route = rate_engine.find_route(origin_port_id, destination_port_id)
     
     if not route:
-        return jsonify({
+        # 沒有直達航線時提供經樞紐港轉運的方案
+        itineraries = find_itineraries(origin_port_id, destination_port_id, container_type_id,
+                                       currency=currency)['cheapest']
+        if itineraries:
+            return {
+                'success': False,
+                'message': '找不到直達航線，可選擇轉運方案',
+                'itineraries': itineraries
+            }
+        return {
             'success': False,
             'message': '找不到匹配的航線'
-        })
+        }
     
     # 查詢當前有效的運費
     today = datetime.utcnow().date()
-    base_rate = BaseRate.query.filter(
-        BaseRate.route_id == route.id,
-        BaseRate.container_type_id == container_type_id,
-        BaseRate.effective_date <= today,
-        (BaseRate.expiry_date >= today) | (BaseRate.expiry_date.is_(None))
-    ).order_by(BaseRate.effective_date.desc()).first()
+    base_rate = rate_engine.find_rate(origin_port_id, destination_port_id, container_type_id, today)
     
     if not base_rate:
-        return jsonify({
+        return {
             'success': False,
             'message': '找不到有效的運費'
-        })
+        }
     
     # 查詢最近的船期
-    next_month = today + timedelta(days=30)
-    vessel_schedules = VesselSchedule.query.filter(
-        VesselSchedule.route_id == route.id,
-        VesselSchedule.departure_date >= today,
-        VesselSchedule.departure_date <= next_month
-    ).order_by(VesselSchedule.departure_date).limit(3).all()
+    vessel_schedules = _next_sailings(route.route_id, today)
     
-    schedules_data = []
-    for schedule in vessel_schedules:
-        schedules_data.append({
-            'vessel_name': schedule.vessel_name,
-            'voyage': schedule.voyage,
-            'departure_date': schedule.departure_date.strftime('%Y-%m-%d'),
-            'arrival_date': schedule.arrival_date.strftime('%Y-%m-%d')
-        })
+    schedules_data = [_schedule_data(schedule) for schedule in vessel_schedules]
     
     # 返回報價和船期信息
-    return jsonify({
+    rate_data = {
+        'price': base_rate.price,
+        'currency': base_rate.currency,
+        'transit_time': route.transit_time,
+        'effective_date': base_rate.effective_date.strftime('%Y-%m-%d')
+    }
+    priced = (base_rate.rate_id, base_rate.price, base_rate.currency)
+    rate_data.update(all_in_quote(*priced))
+    # 外幣附加費按當日匯率計入全包總額，無匯率的仍在 other_currency_charges 中單獨列出
+    add_other_currency_charges([priced], [rate_data], today)
+    if currency:
+        convert_quotes([priced], [rate_data], currency, today)
+        if rate_data['converted'] is None:
+            return {
+                'success': False,
+                'message': f'找不到適用的匯率，無法換算為{currency}'
+            }
+    return {
         'success': True,
-        'rate': {
-            'price': base_rate.price,
-            'currency': base_rate.currency,
-            'transit_time': route.transit_time,
-            'effective_date': base_rate.effective_date.strftime('%Y-%m-%d')
-        },
+        'rate': rate_data,
         'schedules': schedules_data
+    }
+
+@quote_bp.route('/get_rates', methods=['POST'])
+@login_required
+@read_only
+def get_rates():
+    """Resolve many (origin, destination, container type) lanes in one request"""
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': '缺少必要信息'}), 400
+
+    max_items = current_app.config.get('BATCH_QUOTE_MAX_ITEMS')
+    if max_items and len(items) > max_items:
+        return jsonify({'success': False, 'message': f'每次最多查詢{max_items}條航線'}), 400
+
+    try:
+        currency = parse_currency(data.get('currency'))
+    except ValueError:
+        return jsonify({'success': False, 'message': '貨幣代碼不正確'}), 400
+    sort = data.get('sort')
+    if sort not in (None, 'total'):
+        return jsonify({'success': False, 'message': '不支持的排序方式'}), 400
+    if sort and not currency:
+        return jsonify({'success': False, 'message': '按總價排序需要指定貨幣'}), 400
+
+    lanes = [_parse_lane(item) for item in items]
+    today = datetime.utcnow().date()
+    quotes = _resolve_lanes([lane for lane in lanes if lane], today, currency)
+
+    results = []
+    for item, lane in zip(items, lanes):
+        if lane is None:
+            results.append({'success': False, 'message': '請求項目格式不正確'})
+            continue
+        result = dict(quotes[lane])
+        result.update({
+            'origin_port': lane[0],
+            'destination_port': lane[1],
+            'container_type': lane[2]
+        })
+        results.append(result)
+
+    if sort == 'total':
+        # 換算為同一貨幣後按全包總價排序，無法報價的項目排在最後
+        results.sort(key=lambda result: (not result['success'],
+                                         result['rate']['converted']['total'] if result['success'] else 0))
+
+    return jsonify({'success': True, 'results': results})
+
+@quote_bp.route('/itineraries', methods=['POST'])
+@login_required
+@read_only
+def itineraries():
+    """Cheapest and fastest direct or transshipment itineraries between two ports"""
+    data = request.get_json(silent=True) or request.form
+    lane = _parse_lane(data)
+    if lane is None:
+        return jsonify({'success': False, 'message': '缺少必要信息'}), 400
+    try:
+        currency = parse_currency(data.get('currency'))
+        k = int(data.get('k') or 3)
+        max_legs = int(data.get('max_legs') or current_app.config['ROUTING_MAX_LEGS'])
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '請求參數不正確'}), 400
+    k = max(1, min(k, current_app.config['ROUTING_MAX_RESULTS']))
+    max_legs = max(1, min(max_legs, current_app.config['ROUTING_MAX_LEGS']))
+
+    result = find_itineraries(*lane, k=k, max_legs=max_legs, currency=currency)
+    if not result['cheapest'] and not result['fastest']:
+        return jsonify({'success': False, 'message': '找不到匹配的航線'})
+    result['success'] = True
+    return jsonify(result)
+
+def _parse_lane(item):
+    # 支持 {"origin_port": 1, ...} 或 [origin, destination, container_type] 兩種格式
+    if isinstance(item, dict):
+        item = (item.get('origin_port'), item.get('destination_port'), item.get('container_type'))
+    if not isinstance(item, (list, tuple)) or len(item) != 3:
+        return None
+    try:
+        return tuple(int(value) for value in item)
+    except (TypeError, ValueError):
+        return None
+
+def _resolve_lanes(lanes, today, currency=None):
+    """Price lanes with set-based queries, in chunks to stay under bind parameter limits"""
+    quotes = {}
+    unique_lanes = list(dict.fromkeys(lanes))
+    for start in range(0, len(unique_lanes), BATCH_CHUNK_SIZE):
+        chunk = unique_lanes[start:start + BATCH_CHUNK_SIZE]
+        quotes.update(_resolve_lane_chunk(chunk, today, currency))
+    return quotes
+
+def _resolve_lane_chunk(lanes, today, currency=None):
+    port_pairs = list({(origin, destination) for origin, destination, _ in lanes})
+
+    # 航線與當前有效運費：一次外連接查詢
+    rows = db.session.query(
+        Route.id, Route.origin_port_id, Route.destination_port_id, Route.transit_time,
+        BaseRate.id.label('rate_id'), BaseRate.container_type_id, BaseRate.price, BaseRate.currency, BaseRate.effective_date
+    ).outerjoin(BaseRate, and_(
+        BaseRate.route_id == Route.id,
+        tuple_(Route.origin_port_id, Route.destination_port_id, BaseRate.container_type_id).in_(lanes),
+        BaseRate.effective_date <= today,
+        (BaseRate.expiry_date >= today) | (BaseRate.expiry_date.is_(None))
+    )).filter(
+        tuple_(Route.origin_port_id, Route.destination_port_id).in_(port_pairs)
+    ).order_by(Route.id, BaseRate.effective_date).all()
+
+    routes = {}
+    rates = {}
+    for row in rows:
+        pair = (row.origin_port_id, row.destination_port_id)
+        # 與 get_rate 一致，同一港口對取第一條航線
+        route = routes.setdefault(pair, row)
+        if row.id != route.id or row.container_type_id is None:
+            continue
+        # 按生效日期升序，後者覆蓋前者即為最新運費
+        rates[pair + (row.container_type_id,)] = row
+
+    # 最近30天內的船期：船期索引中每條航線取前3班
+    schedules = {route.id: [_schedule_data(schedule) for schedule in _next_sailings(route.id, today)]
+                 for route in routes.values()}
+
+    # 全包價格：附加費向量一次計算所有命中運費的總額
+    priced_lanes = [lane for lane in lanes if lane[:2] in routes and lane in rates]
+    priced_rates = [(rates[lane].rate_id, rates[lane].price, rates[lane].currency) for lane in priced_lanes]
+    all_in_data = add_other_currency_charges(priced_rates, all_in_quotes(priced_rates), today)
+    if currency:
+        convert_quotes(priced_rates, all_in_data, currency, today)
+    all_in = dict(zip(priced_lanes, all_in_data))
+
+    quotes = {}
+    for lane in lanes:
+        route = routes.get(lane[:2])
+        rate = rates.get(lane)
+        if not route:
+            quotes[lane] = {'success': False, 'message': '找不到匹配的航線'}
+        elif not rate:
+            quotes[lane] = {'success': False, 'message': '找不到有效的運費'}
+        elif currency and all_in[lane]['converted'] is None:
+            quotes[lane] = {'success': False, 'message': f'找不到適用的匯率，無法換算為{currency}'}
+        else:
+            rate_data = {
+                'price': rate.price,
+                'currency': rate.currency,
+                'transit_time': route.transit_time,
+                'effective_date': rate.effective_date.strftime('%Y-%m-%d')
+            }
+            rate_data.update(all_in[lane])
+            quotes[lane] = {
+                'success': True,
+                'rate': rate_data,
+                'schedules': schedules.get(route.id, [])
+            }
+    return quotes
+
+@quote_bp.route('/schedules')
+@login_required
+@read_only
+def search_schedules():
+    """Sailings across every route from an origin and/or to a destination within a date window"""
+    try:
+        origin_port_id = _optional_int(request.args.get('origin_port'))
+        destination_port_id = _optional_int(request.args.get('destination_port'))
+        date_from = _optional_date(request.args.get('date_from')) or datetime.utcnow().date()
+        date_to = _optional_date(request.args.get('date_to')) or date_from + timedelta(days=30)
+        arrive_by = _optional_date(request.args.get('arrive_by'))
+        limit = _optional_int(request.args.get('limit')) or SCHEDULE_SEARCH_LIMIT
+        if limit < 1:
+            raise ValueError(limit)
+    except ValueError:
+        return jsonify({'success': False, 'message': '請求參數不正確'}), 400
+    if origin_port_id is None and destination_port_id is None:
+        return jsonify({'success': False, 'message': '請指定起運港或目的港'}), 400
+
+    routes, _ = rate_engine.current()
+    lanes = {
+        route.route_id: (origin, destination)
+        for (origin, destination), route in routes.items()
+        if origin_port_id in (None, origin) and destination_port_id in (None, destination)
+    }
+    sailings = sailing_index.search(lanes, date_from, date_to, arrive_by=arrive_by,
+                                    limit=min(limit, SCHEDULE_SEARCH_MAX_LIMIT))
+    return jsonify({
+        'success': True,
+        'schedules': [dict(_schedule_data(sailing),
+                           route_id=sailing.route_id,
+                           origin_port=lanes[sailing.route_id][0],
+                           destination_port=lanes[sailing.route_id][1]) for sailing in sailings]
     })
 
+def _optional_int(value):
+    return int(value) if value not in (None, '') else None
+
+def _optional_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+def _next_sailings(route_id, today):
+    return sailing_index.next_departures(route_id, today, 3, until=today + timedelta(days=30))
+
+def _schedule_data(schedule):
+    return {
+        'vessel_name': schedule.vessel_name,
+        'voyage': schedule.voyage,
+        'departure_date': schedule.departure_date.strftime('%Y-%m-%d'),
+        'arrival_date': schedule.arrival_date.strftime('%Y-%m-%d')
+    }
+
 @quote_bp.route('/ai_quote')
 @login_required
 def ai_quote():
@@ -85,75 +340,26 @@ def ai_quote():
 
 @quote_bp.route('/process_ai_query', methods=['POST'])
 @login_required
+@read_only
 def process_ai_query():
+    started = time.perf_counter()
     query = request.form.get('query', '')
-      query_lower = query.lower() # ← mis‑indented
-
-    # 常見縮寫對應的港口代碼或名稱
-    abbreviation_map = {
-        'shanghai': ['sha', '上海'],
-        'sha': ['sha', '上海'],
-        'los angeles': ['lax', '洛杉磯'],
-        'lax': ['lax', '洛杉磯'],
-        'kaohsiung': ['khh', '高雄'],
-        'kh': ['khh', '高雄'],
-    }
-
-    for abbr, reps in abbreviation_map.items():
-        if abbr in query_lower:
-            query_lower += ' ' + ' '.join(reps)
     
     # 這裡可以接入實際的AI處理邏輯
-    # 目前使用簡單的關鍵詞匹配作為示例
-    
-    # 提取可能的起運港和目的港
-    ports = Port.query.all()
-    origin_port = None
-    destination_port = None
-    +                      # ← invalid “+” line
-    for port in ports:
-        port_name_lc = port.name.lower()
-        port_code_lc = port.code.lower()
-        if port_name_lc in query_lower or port_code_lc in query_lower:
-            if f"從{port.name}".lower() in query_lower or f"自{port.name}".lower() in query_lower or f"起運港{port.name}".lower() in query_lower:
-                origin_port = port
-            elif f"到{port.name}".lower() in query_lower or f"至{port.name}".lower() in query_lower or f"目的港{port.name}".lower() in query_lower:
-                destination_port = port
-    
-    # 提取可能的櫃型
-    container_types = ContainerType.query.all()
-    container_type = None
-    +                     # ← invalid “+” line
-    for ct in container_types:
-        ct_name_lc = ct.name.lower()
-        ct_code_lc = ct.code.lower()
-        if ct_name_lc in query_lower or ct_code_lc in query_lower:
-            container_type = ct
+    # 目前使用預編譯的多模式比對器，一次掃描找出港口、櫃型及起運/目的標記
+    origin_port, destination_port, container_type = port_matcher.match(query)
     
     # 如果找到了必要信息，查詢運費
     if origin_port and destination_port and container_type:
-        route = Route.query.filter_by(
-            origin_port_id=origin_port.id,
-            destination_port_id=destination_port.id
-        ).first()
+        route = rate_engine.find_route(origin_port.id, destination_port.id)
         
         if route:
             today = datetime.utcnow().date()
-            base_rate = BaseRate.query.filter(
-                BaseRate.route_id == route.id,
-                BaseRate.container_type_id == container_type.id,
-                BaseRate.effective_date <= today,
-                (BaseRate.expiry_date >= today) | (BaseRate.expiry_date.is_(None))
-            ).order_by(BaseRate.effective_date.desc()).first()
+            base_rate = rate_engine.find_rate(origin_port.id, destination_port.id, container_type.id, today)
             
             if base_rate:
                 # 查詢最近的船期
-                next_month = today + timedelta(days=30)
-                vessel_schedules = VesselSchedule.query.filter(
-                    VesselSchedule.route_id == route.id,
-                    VesselSchedule.departure_date >= today,
-                    VesselSchedule.departure_date <= next_month
-                ).order_by(VesselSchedule.departure_date).limit(3).all()
+                vessel_schedules = _next_sailings(route.route_id, today)
                 
                 schedules_html = ""
                 for schedule in vessel_schedules:
@@ -164,11 +370,24 @@ def process_ai_query():
                 else:
                     schedules_html = "<p>近期沒有可用的船期</p>"
                 
+                priced = (base_rate.rate_id, base_rate.price, base_rate.currency)
+                quote = add_other_currency_charges([priced], [all_in_quote(*priced)], today)[0]
+                # 無匯率可換算的外幣附加費在總額後單獨列出
+                total_text = f"{quote['total']} {base_rate.currency}" + ''.join(
+                    f" + {amount} {code}" for code, amount in quote['other_currency_charges'].items())
+                surcharges_html = ""
+                for item in quote['surcharges']:
+                    surcharges_html += f"<li>{item['name']}（{item['code']}）：{item['amount']} {item['currency']}</li>"
+                if surcharges_html:
+                    surcharges_html = f"<p>附加費：</p><ul>{surcharges_html}</ul>"
+                
                 response = f"""
                 <div class="ai-response">
                     <p>根據您的詢問，我找到了從 {origin_port.name} 到 {destination_port.name} 的 {container_type.name} 運費報價：</p>
                     <div class="quote-result">
                         <p>基本運費：{base_rate.price} {base_rate.currency}</p>
+                        {surcharges_html}
+                        <p>全包運費：{total_text}</p>
                         <p>航程時間：{route.transit_time} 天</p>
                         <p>生效日期：{base_rate.effective_date.strftime('%Y-%m-%d')}</p>
                     </div>
@@ -176,7 +395,29 @@ def process_ai_query():
                     <p>如需更詳細的報價或有其他問題，請隨時詢問。</p>
                 </div>
                 """
+                quote_log.record(current_user_id(), origin_port.id, destination_port.id, container_type.id,
+                                 quote['total'], base_rate.currency, started)
                 return jsonify({'success': True, 'response': response})
+        
+        # 無航線或運費的詢價同樣記錄需求
+        quote_log.record(current_user_id(), origin_port.id, destination_port.id, container_type.id,
+                         None, None, started)
+    
+    # 如果無法提取完整信息或找不到匹配的運費
+    return jsonify({
+        'success': True,
+        'response': """
+        <div class="ai-response">
+            <p>很抱歉，我無法根據您提供的信息找到匹配的運費報價。請提供更完整的信息，包括：</p>
+            <ul>
+                <li>起運港（例如：高雄、上海）</li>
+                <li>目的港（例如：洛杉磯、鹿特丹）</li>
+                <li>櫃型（例如：20呎標準貨櫃、40呎高櫃）</li>
+            </ul>
+            <p>例如：「請提供從高雄到洛杉磯的40呎高櫃運費報價」</p>
+        </div>
+        """
+    })
 
 @quote_bp.route('/book', methods=['POST'])
 @login_required
@@ -189,66 +430,50 @@ def book():
     if not origin or not destination or not container_type:
         return jsonify({'success': False, 'message': '缺少必要信息'}), 400
 
-    booking = Booking(
-        user_id=session.get('user_id'),
-        origin_port=origin,
-        destination_port=destination,
-        container_type=container_type
-    )
-    db.session.add(booking)
-    db.session.commit()
-    return jsonify({'success': True, 'booking_id': booking.id})
+    # 並發的訂艙在短時間窗口內合併提交，提交完成後才返回訂艙編號
+    try:
+        booking_id = booking_writer.insert({
+            'user_id': current_user_id(),
+            'origin_port': origin,
+            'destination_port': destination,
+            'container_type': container_type
+        })
+    except GroupCommitTimeout:
+        return jsonify({'success': False, 'message': '訂艙處理逾時，請稍後查詢訂艙記錄確認是否成功'}), 503
+    return jsonify({'success': True, 'booking_id': booking_id})
 
 @quote_bp.route('/<int:booking_id>/pdf')
 @login_required
 def booking_pdf(booking_id):
-    """Generate a simple PDF quote for the booking"""
-    booking = Booking.query.get_or_404(booking_id)
-
-    # 查找航線及運費資料
-    origin_port = Port.query.filter((Port.name == booking.origin_port) | (Port.code == booking.origin_port)).first()
-    destination_port = Port.query.filter((Port.name == booking.destination_port) | (Port.code == booking.destination_port)).first()
-    base_rate = None
-    schedule = None
-    if origin_port and destination_port:
-        route = Route.query.filter_by(origin_port_id=origin_port.id, destination_port_id=destination_port.id).first()
-        if route:
-            today = datetime.utcnow().date()
-            base_rate = BaseRate.query.filter(
-                BaseRate.route_id == route.id,
-                BaseRate.effective_date <= today,
-                (BaseRate.expiry_date >= today) | (BaseRate.expiry_date.is_(None))
-            ).order_by(BaseRate.effective_date.desc()).first()
-            schedule = VesselSchedule.query.filter_by(route_id=route.id).order_by(VesselSchedule.departure_date).first()
-
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer)
-    p.drawString(50, 800, 'Booking Confirmation')
-    p.drawString(50, 780, f'Booking ID: {booking.id}')
-    p.drawString(50, 760, f'Origin: {booking.origin_port}')
-    p.drawString(50, 740, f'Destination: {booking.destination_port}')
-    p.drawString(50, 720, f'Container Type: {booking.container_type}')
-    if base_rate:
-        p.drawString(50, 700, f'Rate: {base_rate.price} {base_rate.currency}')
-    if schedule:
-        p.drawString(50, 680, f'Schedule: {schedule.vessel_name} {schedule.voyage} {schedule.departure_date}')
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-    return send_file(buffer, mimetype='application/pdf', as_attachment=True,
-                     download_name=f'quote_{booking.id}.pdf')    
-    # 如果無法提取完整信息或找不到匹配的運費
-    return jsonify({
-        'success': True,
-        'response': """
-        <div class="ai-response">
-            <p>很抱歉，我無法根據您提供的信息找到匹配的運費報價。請提供更完整的信息，包括：</p>
-            <ul>
-                <li>起運港（例如：高雄、上海）</li>
-                <li>目的港（例如：洛杉磯、鹿特丹）</li>
-                <li>櫃型（例如：20呎標準貨櫃、40呎高櫃）</li>
-            </ul>
-            <p>例如：「請提供從高雄到洛杉磯的40呎高櫃運費報價」</p>
-        </div>
-        """
-    })
+    """Serve the booking confirmation PDF, rendered once per version of its data"""
+    booking = _visible_bookings().filter(Booking.id == booking_id).first_or_404()
+    return send_file(io.BytesIO(booking_pdf_bytes(booking)), mimetype='application/pdf', as_attachment=True,
+                     download_name=f'quote_{booking.id}.pdf')
+
+@quote_bp.route('/bookings/export', methods=['POST'])
+@login_required
+def export_booking_pdfs():
+    """Stream a zip of booking confirmation PDFs"""
+    data = request.get_json(silent=True) or {}
+    booking_ids = data.get('booking_ids')
+    if not isinstance(booking_ids, list) or not booking_ids:
+        return jsonify({'success': False, 'message': '缺少必要信息'}), 400
+    try:
+        booking_ids = list(dict.fromkeys(int(booking_id) for booking_id in booking_ids))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '請求項目格式不正確'}), 400
+    max_items = current_app.config.get('PDF_EXPORT_MAX_ITEMS')
+    if max_items and len(booking_ids) > max_items:
+        return jsonify({'success': False, 'message': f'每次最多導出{max_items}份訂艙確認'}), 400
+
+    bookings = _visible_bookings().filter(Booking.id.in_(booking_ids)).order_by(Booking.id).all()
+    if not bookings:
+        return jsonify({'success': False, 'message': '找不到訂艙記錄'}), 404
+    return Response(export_zip(bookings), mimetype='application/zip',
+                    headers={'Content-Disposition': 'attachment; filename=booking_quotes.zip'})
+
+def _visible_bookings():
+    # 客戶只能取得自己的訂艙，其他客戶的訂艙視同不存在；管理員和操作員可查看全部
+    if current_role() in ('admin', 'operator'):
+        return Booking.query
+    return Booking.query.filter(Booking.user_id == current_user_id())
@@ -0,0 +1,128 @@
+from flask import current_app
+from datetime import datetime
+import atexit
+import logging
+import threading
+import time
+from sqlalchemy.exc import IntegrityError
+from .app import db
+from .models import QuoteQuery
+
+logger = logging.getLogger(__name__)
+
+
+class QuoteLog:
+    """Bounded in-process buffer of quote requests flushed to quote_queries in bulk by a background thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._app = None
+        self.dropped = 0
+        self.written = 0
+
+    def record(self, user_id, origin_port_id, destination_port_id, container_type_id,
+               result_rate, result_currency, started):
+        """Queue one quote; never blocks on the database and drops the entry when the buffer is full"""
+        config = current_app.config
+        if not config.get('QUOTE_LOG_ENABLED'):
+            return
+        ids = [_to_id(value) for value in (user_id, origin_port_id, destination_port_id, container_type_id)]
+        # 未能識別用戶、港口或櫃型的請求無法寫入（外鍵非空）
+        if None in ids:
+            return
+
+        entry = {
+            'user_id': ids[0],
+            'origin_port_id': ids[1],
+            'destination_port_id': ids[2],
+            'container_type_id': ids[3],
+            'query_date': datetime.utcnow(),
+            'result_rate': result_rate,
+            'result_currency': result_currency,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+        }
+        with self._lock:
+            if len(self._buffer) >= config['QUOTE_LOG_BUFFER_SIZE']:
+                self.dropped += 1
+                return
+            self._buffer.append(entry)
+            full = len(self._buffer) >= config['QUOTE_LOG_FLUSH_SIZE']
+        self._ensure_writer(current_app._get_current_object())
+        if full:
+            self._wakeup.set()
+
+    def _ensure_writer(self, app):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._app = app
+                self._thread = threading.Thread(target=self._run, daemon=True, name='quote-log')
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._app.config['QUOTE_LOG_FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered so far in one bulk insert"""
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+        if not entries or self._app is None:
+            return 0
+        with self._app.app_context():
+            try:
+                # 使用獨立連接批量插入，不影響調用線程的會話
+                with db.engine.begin() as conn:
+                    conn.execute(QuoteQuery.__table__.insert(), entries)
+                written = len(entries)
+            except IntegrityError:
+                # 請求中不存在的港口或櫃型編號違反外鍵約束會使整批失敗，逐條重試以保留其餘日誌
+                written = self._insert_each(entries)
+            except Exception:
+                # 其他寫入失敗（如數據庫不可用）不重試，避免積壓拖慢請求
+                self.dropped += len(entries)
+                logger.exception('報價日誌寫入失敗，丟棄 %d 條', len(entries))
+                return 0
+        self.written += written
+        return written
+
+    def _insert_each(self, entries):
+        written = rejected = 0
+        for index, entry in enumerate(entries):
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(QuoteQuery.__table__.insert(), entry)
+                written += 1
+            except IntegrityError:
+                rejected += 1
+            except Exception:
+                self.dropped += len(entries) - index
+                logger.exception('報價日誌寫入失敗，丟棄 %d 條', len(entries) - index)
+                break
+        if rejected:
+            self.dropped += rejected
+            logger.warning('報價日誌中 %d 條違反約束，已丟棄', rejected)
+        return written
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+
+def _to_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+quote_log = QuoteLog()
+
+# 進程退出前寫入緩衝中剩餘的日誌
+atexit.register(quote_log.flush)
@@ -0,0 +1,119 @@
+from flask import current_app
+from bisect import bisect_right
+import logging
+from .app import db
+from .cache import ReloadingCache
+from .data_version import data_version
+from .models import Route, BaseRate
+from .rate_snapshot import (RouteInfo, RateInfo, SNAPSHOT_TABLES, SnapshotRoutes, SnapshotRates,
+                            snapshot_file, publish)
+from . import changes
+
+logger = logging.getLogger(__name__)
+
+
+class RateEngine(ReloadingCache):
+    """Index of BaseRate keyed by (origin, destination, container type)
+
+    Uses the shared memory-mapped snapshot when one was published for the current data
+    version, otherwise builds a process-local index from the database.
+    """
+
+    ttl_config = 'RATE_ENGINE_TTL'
+    tables = SNAPSHOT_TABLES
+
+    def _fresh(self, data, ttl, version):
+        if not super()._fresh(data, ttl, version):
+            return False
+        snapshot = snapshot_file.matching(data_version.current(), ttl)
+        if isinstance(data[0], SnapshotRoutes):
+            # 快照發布超過 TTL 或已被替換時重新載入，而不是從載入時起再信任一個 TTL
+            return snapshot is not None and data[0] is snapshot.routes
+        # 從數據庫構建的索引在相同版本的快照發布後改用快照，釋放本進程的副本
+        return snapshot is None
+
+    def build(self):
+        ttl = current_app.config.get(self.ttl_config)
+        state = data_version.current()
+        snapshot = snapshot_file.matching(state, ttl)
+        if snapshot is None and snapshot_file.matching(state) is not None:
+            # 數據版本只記錄本主機的提交，其他主機的導入或直接修改數據庫不會使快照過期；
+            # 超過 TTL 的快照從數據庫重新發布，與進程內索引的最長過期時間一致
+            snapshot = self._republish(ttl)
+        if snapshot is not None:
+            return snapshot.routes, snapshot.rates
+
+        routes = {}
+        route_ports = {}
+        for route_id, origin_id, destination_id, transit_time in db.session.query(
+                Route.id, Route.origin_port_id, Route.destination_port_id, Route.transit_time
+        ).order_by(Route.id):
+            # 與 Route.query.filter_by(...).first() 一致，同一港口對取第一條航線
+            routes.setdefault((origin_id, destination_id), RouteInfo(route_id, transit_time))
+            route_ports[route_id] = (origin_id, destination_id)
+
+        grouped = {}
+        for rate in db.session.query(
+                BaseRate.id, BaseRate.route_id, BaseRate.container_type_id, BaseRate.price,
+                BaseRate.currency, BaseRate.effective_date, BaseRate.expiry_date
+        ).order_by(BaseRate.effective_date, BaseRate.id):
+            origin_id, destination_id = route_ports[rate.route_id]
+            grouped.setdefault((origin_id, destination_id, rate.container_type_id), []).append(
+                RateInfo(rate.id, rate.route_id, rate.price, rate.currency,
+                         rate.effective_date, rate.expiry_date))
+
+        # 每個鍵保存按生效日期排序的日期陣列，查詢時二分搜尋
+        rates = {key: ([r.effective_date for r in entries], entries) for key, entries in grouped.items()}
+
+        return routes, rates
+
+    def _republish(self, ttl):
+        try:
+            publish()
+        except Exception:
+            # 發布失敗時本進程從數據庫構建索引
+            logger.exception('重新發布運費快照失敗')
+            return None
+        return snapshot_file.matching(data_version.current(), ttl)
+
+    def find_route(self, origin_port_id, destination_port_id):
+        routes, _ = self.current()
+        return routes.get((_to_id(origin_port_id), _to_id(destination_port_id)))
+
+    def find_rate(self, origin_port_id, destination_port_id, container_type_id, on_date):
+        """Return the rate in effect on the date, preferring the latest effective date"""
+        _, rates = self.current()
+        key = (_to_id(origin_port_id), _to_id(destination_port_id), _to_id(container_type_id))
+        if isinstance(rates, SnapshotRates):
+            return rates.rate_on(key, on_date)
+        entry = rates.get(key)
+        if entry is None:
+            return None
+        return rate_on(entry, on_date)
+
+
+def rate_on(entry, on_date):
+    """Pick the rate in effect on the date from a (dates, entries) index entry"""
+    dates, entries = entry
+    i = bisect_right(dates, on_date) - 1
+    while i >= 0:
+        rate = entries[i]
+        if rate.expiry_date is None or rate.expiry_date >= on_date:
+            return rate
+        i -= 1
+    return None
+
+
+def _to_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+rate_engine = RateEngine()
+
+
+@changes.on_commit('routes', 'base_rates')
+def _invalidate_rate_engine(tables):
+    rate_engine.invalidate()
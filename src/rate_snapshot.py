@@ -0,0 +1,339 @@
+from bisect import bisect_right
+from collections import namedtuple
+from collections.abc import Mapping
+from datetime import datetime, timezone
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+import tempfile
+import threading
+import numpy as np
+from .app import app, db
+from .models import Route, BaseRate
+from .data_version import data_version
+
+logger = logging.getLogger(__name__)
+
+RouteInfo = namedtuple('RouteInfo', 'route_id transit_time')
+RateInfo = namedtuple('RateInfo', 'rate_id route_id price currency effective_date expiry_date')
+
+# 快照包含的資料表；快照記錄構建時這些表在數據版本中的計數，計數不一致即視為過期
+SNAPSHOT_TABLES = ('routes', 'base_rates')
+
+MAGIC = b'RATESNP1'
+# 各欄位在文件中按此字節數對齊，映射後可直接視為對應類型的陣列
+ALIGNMENT = 64
+
+# 港口ID和櫃型ID打包成一個 int64 排序鍵：起運港、目的港各24位，櫃型15位
+PORT_BITS = 24
+CONTAINER_BITS = 15
+
+# 欄位名稱及類型；航線按 route_key 排序，運費按 (lane_key, 生效日期, ID) 排序
+ROUTE_COLUMNS = (('route_key', '<i8'), ('route_id', '<i8'), ('transit_time', '<i4'))
+LANE_COLUMNS = (('lane_key', '<i8'), ('lane_start', '<i8'))
+RATE_COLUMNS = (('rate_id', '<i8'), ('rate_route_id', '<i8'), ('price', '<f8'), ('currency', '<U3'),
+                ('effective_date', '<M8[D]'), ('expiry_date', '<M8[D]'))
+
+
+def _route_key(origin_id, destination_id):
+    return (origin_id << PORT_BITS) | destination_id
+
+
+def _lane_key(origin_id, destination_id, container_type_id):
+    return (_route_key(origin_id, destination_id) << CONTAINER_BITS) | container_type_id
+
+
+def _split_lane_key(key):
+    route_key = key >> CONTAINER_BITS
+    return route_key >> PORT_BITS, route_key & ((1 << PORT_BITS) - 1), key & ((1 << CONTAINER_BITS) - 1)
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _check_ids(values, bits, name):
+    if len(values) and (values.min() < 0 or values.max() >= 1 << bits):
+        raise ValueError(f'{name} 超出快照鍵可容納的範圍')
+
+
+def build_columns():
+    """Current routes and rates as sorted fixed-width column arrays"""
+    routes = np.array(db.session.query(Route.id, Route.origin_port_id, Route.destination_port_id,
+                                       Route.transit_time).all(), dtype=np.int64).reshape(-1, 4)
+    route_ids, origins, destinations, transit_times = routes.T
+    _check_ids(origins, PORT_BITS, '港口ID')
+    _check_ids(destinations, PORT_BITS, '港口ID')
+    route_keys = _route_key(origins, destinations)
+    # 與 RateEngine 一致，同一港口對取ID最小的航線（舊數據庫可能未建唯一約束）
+    order = np.lexsort((route_ids, route_keys))
+    unique_keys, first = np.unique(route_keys[order], return_index=True)
+    chosen = order[first]
+
+    rates = db.session.query(BaseRate.id, BaseRate.route_id, BaseRate.container_type_id, BaseRate.price,
+                             BaseRate.currency, BaseRate.effective_date, BaseRate.expiry_date).all()
+    rate_ids = np.array([r[0] for r in rates], dtype=np.int64)
+    rate_route_ids = np.array([r[1] for r in rates], dtype=np.int64)
+    container_type_ids = np.array([r[2] for r in rates], dtype=np.int64)
+    _check_ids(container_type_ids, CONTAINER_BITS, '櫃型ID')
+    # 運費的航線ID換算成港口對
+    by_route = np.argsort(route_ids)
+    positions = by_route[np.searchsorted(route_ids, rate_route_ids, sorter=by_route)] if len(rates) else rate_route_ids
+    lane_keys = (route_keys[positions] << CONTAINER_BITS) | container_type_ids
+    effective = np.array([r[5] for r in rates], dtype='<M8[D]')
+    order = np.lexsort((rate_ids, effective, lane_keys))
+    lanes, lane_start = np.unique(lane_keys[order], return_index=True)
+
+    return {
+        'route_key': unique_keys,
+        'route_id': route_ids[chosen],
+        'transit_time': transit_times[chosen].astype('<i4'),
+        'lane_key': lanes,
+        # 第 i 條航線的運費位於 [lane_start[i], lane_start[i + 1])
+        'lane_start': np.append(lane_start, len(rates)).astype('<i8'),
+        'rate_id': rate_ids[order],
+        'rate_route_id': rate_route_ids[order],
+        'price': np.array([r[3] for r in rates], dtype='<f8')[order],
+        'currency': np.array([r[4] for r in rates], dtype='<U3')[order],
+        'effective_date': effective[order],
+        'expiry_date': np.array([r[6] for r in rates], dtype='<M8[D]')[order],
+    }
+
+
+def write(path, columns, tables, epoch):
+    """Write the columns to path atomically; processes that mapped the old file keep reading it"""
+    dtypes = dict(ROUTE_COLUMNS + LANE_COLUMNS + RATE_COLUMNS)
+    layout = {}
+    offset = 0
+    for name, dtype in dtypes.items():
+        array = np.ascontiguousarray(columns[name], dtype=dtype)
+        columns[name] = array
+        layout[name] = {'dtype': dtype, 'offset': offset, 'length': len(array)}
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({'tables': tables, 'epoch': epoch, 'created_at': datetime.now(timezone.utc).timestamp(),
+                         'columns': layout}).encode()
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC + struct.pack('<I', len(header)) + header)
+            base = _aligned(f.tell())
+            for name, entry in layout.items():
+                f.write(b'\0' * (base + entry['offset'] - f.tell()))
+                f.write(columns[name].tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def publish(path=None):
+    """Build a snapshot of the current rates from the database and replace the shared file"""
+    path = path or app.config['RATE_SNAPSHOT_FILE']
+    # 先讀取計數再查詢：構建期間若有提交，快照記錄的計數較舊，各進程不會採用
+    state = data_version.ensure()
+    tables = {table: state.tables.get(table, 0) for table in SNAPSHOT_TABLES}
+    columns = build_columns()
+    write(path, columns, tables, state.epoch)
+    logger.info('已發布運費快照：%d 條航線，%d 條運費', len(columns['route_key']), len(columns['rate_id']))
+    return len(columns['rate_id'])
+
+
+class RateSnapshot:
+    """Read-only view of a memory-mapped snapshot file
+
+    The column arrays are views into one np.memmap, so every process mapping the same
+    file shares the page cache copy instead of holding its own rate tables.
+    """
+
+    def __init__(self, path):
+        raw = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(raw[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f'不是運費快照文件：{path}')
+        header_end = len(MAGIC) + 4
+        (length,) = struct.unpack('<I', bytes(raw[len(MAGIC):header_end]))
+        header = json.loads(bytes(raw[header_end:header_end + length]))
+        base = _aligned(header_end + length)
+        self.tables = header['tables']
+        self.epoch = header.get('epoch', '')
+        self.created_at = header.get('created_at', 0)
+        self.columns = {}
+        for name, entry in header['columns'].items():
+            dtype = np.dtype(entry['dtype'])
+            start = base + entry['offset']
+            self.columns[name] = raw[start:start + entry['length'] * dtype.itemsize].view(dtype)
+        self.routes = SnapshotRoutes(self.columns)
+        self.rates = SnapshotRates(self.columns)
+
+    def version(self):
+        return tuple(self.tables.get(table, 0) for table in SNAPSHOT_TABLES)
+
+    def age(self):
+        return datetime.now(timezone.utc).timestamp() - self.created_at
+
+
+def _find(keys, key):
+    i = int(np.searchsorted(keys, key))
+    if i < len(keys) and keys[i] == key:
+        return i
+    raise KeyError(key)
+
+
+def _valid_id(value, bits):
+    return type(value) is int and 0 <= value < 1 << bits
+
+
+class SnapshotRoutes(Mapping):
+    """(origin_id, destination_id) -> RouteInfo backed by the snapshot columns"""
+
+    def __init__(self, columns):
+        self._keys = columns['route_key']
+        self._route_ids = columns['route_id']
+        self._transit_times = columns['transit_time']
+
+    def _info(self, i):
+        return RouteInfo(int(self._route_ids[i]), int(self._transit_times[i]))
+
+    def __getitem__(self, key):
+        origin_id, destination_id = key
+        if not (_valid_id(origin_id, PORT_BITS) and _valid_id(destination_id, PORT_BITS)):
+            raise KeyError(key)
+        return self._info(_find(self._keys, _route_key(origin_id, destination_id)))
+
+    def __iter__(self):
+        for key in self._keys.tolist():
+            yield key >> PORT_BITS, key & ((1 << PORT_BITS) - 1)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def items(self):
+        for i, key in enumerate(self):
+            yield key, self._info(i)
+
+
+class SnapshotRates(Mapping):
+    """(origin_id, destination_id, container_type_id) -> (dates, RateInfo list), as RateEngine builds"""
+
+    def __init__(self, columns):
+        self._keys = columns['lane_key']
+        self._starts = columns['lane_start']
+        self._columns = columns
+
+    def _entry(self, i):
+        start, end = self._starts[i:i + 2].tolist()
+        c = self._columns
+        dates = c['effective_date'][start:end].tolist()
+        entries = [RateInfo(*values) for values in zip(
+            c['rate_id'][start:end].tolist(), c['rate_route_id'][start:end].tolist(),
+            c['price'][start:end].tolist(), c['currency'][start:end].tolist(), dates,
+            c['expiry_date'][start:end].tolist())]
+        return dates, entries
+
+    def _index(self, key):
+        origin_id, destination_id, container_type_id = key
+        if not (_valid_id(origin_id, PORT_BITS) and _valid_id(destination_id, PORT_BITS)
+                and _valid_id(container_type_id, CONTAINER_BITS)):
+            raise KeyError(key)
+        return _find(self._keys, _lane_key(origin_id, destination_id, container_type_id))
+
+    def __getitem__(self, key):
+        return self._entry(self._index(key))
+
+    def rate_on(self, key, on_date):
+        """The rate in effect on the date for a lane, building only that one RateInfo"""
+        try:
+            i = self._index(key)
+        except KeyError:
+            return None
+        start, end = self._starts[i:i + 2].tolist()
+        c = self._columns
+        dates = c['effective_date'][start:end].tolist()
+        expiry = c['expiry_date'][start:end].tolist()
+        j = bisect_right(dates, on_date) - 1
+        while j >= 0 and expiry[j] is not None and expiry[j] < on_date:
+            j -= 1
+        if j < 0:
+            return None
+        k = start + j
+        return RateInfo(int(c['rate_id'][k]), int(c['rate_route_id'][k]), float(c['price'][k]),
+                        str(c['currency'][k]), dates[j], expiry[j])
+
+    def __iter__(self):
+        for key in self._keys.tolist():
+            yield _split_lane_key(key)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def items(self):
+        for i, key in enumerate(self):
+            yield key, self._entry(i)
+
+
+class SnapshotFile:
+    """The shared snapshot file, re-mapped only when it was replaced"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stat = None
+        self._snapshot = None
+
+    def load(self):
+        """Current RateSnapshot, or None when there is no usable file"""
+        path = app.config.get('RATE_SNAPSHOT_FILE')
+        if not path:
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = (path, stat.st_mtime_ns, stat.st_ino, stat.st_size)
+        if key != self._stat:
+            try:
+                snapshot = RateSnapshot(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning('無法讀取運費快照 %s：%s', path, e)
+                snapshot = None
+            # 替換引用即完成切換，仍在使用舊快照的請求不受影響
+            with self._lock:
+                self._stat, self._snapshot = key, snapshot
+        return self._snapshot
+
+    def matching(self, state, max_age=None):
+        """The snapshot if it was built at this data version state's SNAPSHOT_TABLES counters
+        and, when max_age is given, less than max_age seconds ago; else None"""
+        snapshot = self.load()
+        if snapshot is None or not snapshot.epoch or snapshot.epoch != state.epoch:
+            # 數據版本文件重建後計數從零開始，其他 epoch 的快照即使計數相同也已過期
+            return None
+        if snapshot.version() != tuple(state.tables.get(table, 0) for table in SNAPSHOT_TABLES):
+            return None
+        if max_age and snapshot.age() >= max_age:
+            return None
+        return snapshot
+
+
+snapshot_file = SnapshotFile()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='發布供所有工作進程共享的運費快照')
+    parser.add_argument('--path', help='默認為 RATE_SNAPSHOT_FILE')
+    args = parser.parse_args(argv)
+    with app.app_context():
+        count = publish(args.path)
+    print(f'已發布運費快照：{count} 條運費')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+from flask import current_app
+from collections import namedtuple, defaultdict
+from datetime import datetime
+from heapq import heappush, heappop
+from itertools import count
+from .cache import ReloadingCache
+from .rate_engine import rate_engine, rate_on, _to_id
+from .pricing import all_in_quotes, convert_quotes
+from .fx import fx_table
+from .data_version import data_version
+from . import changes
+
+# 影響各段全包運費的資料表，變動後所有腿都要重新計價
+PRICING_TABLES = ('surcharges', 'rate_surcharges', 'exchange_rates')
+
+# 一段航線：total 為該段全包運費（運費幣種），cost 為換算成基準貨幣的全包運費
+Leg = namedtuple('Leg', 'origin destination route_id rate_id transit_time price currency total cost')
+RoutingSnapshot = namedtuple('RoutingSnapshot', 'day legs adjacency')
+
+
+class RouteGraph(ReloadingCache):
+    """Per-container-type adjacency of priced Route legs for transshipment search"""
+
+    ttl_config = 'RATE_ENGINE_TTL'
+    tables = ('routes', 'base_rates', 'surcharges', 'rate_surcharges', 'exchange_rates')
+
+    def __init__(self):
+        super().__init__()
+        self._previous = None
+        self._reprice = True
+        self._pricing = None
+
+    def invalidate(self, reprice=False):
+        # 航線/運費變動時未變的腿沿用上次的價格；附加費或匯率變動則全部重新計價
+        self._reprice = self._reprice or reprice
+        super().invalidate()
+
+    def current(self):
+        snapshot = super().current()
+        if snapshot.day != datetime.utcnow().date():
+            # 跨日後生效的運費可能不同
+            self.invalidate(reprice=True)
+            snapshot = super().current()
+        return snapshot
+
+    def build(self):
+        today = datetime.utcnow().date()
+        routes, rates = rate_engine.current()
+        # 其他進程修改附加費或匯率時不會通知本進程，由共享數據版本中的計數判斷是否需要全部重新計價
+        counters = data_version.current().tables
+        pricing = tuple(counters.get(table, 0) for table in PRICING_TABLES)
+        previous = self._previous
+        reuse = previous is not None and previous.day == today and not self._reprice and pricing == self._pricing
+        self._reprice = False
+        self._pricing = pricing
+
+        legs = {}
+        changed = []
+        for key, entry in rates.items():
+            route = routes.get(key[:2])
+            rate = rate_on(entry, today)
+            if route is None or rate is None:
+                continue
+            old = previous.legs.get(key) if reuse else None
+            if old is not None and (old.route_id, old.transit_time, old.rate_id, old.price, old.currency) == \
+                    (route.route_id, route.transit_time, rate.rate_id, rate.price, rate.currency):
+                legs[key] = old
+            else:
+                changed.append((key, route, rate))
+
+        # 只有新增或變動的腿需要計算附加費和匯率換算
+        if changed:
+            priced = [(rate.rate_id, rate.price, rate.currency) for _, _, rate in changed]
+            quotes = convert_quotes(priced, all_in_quotes(priced), current_app.config['FX_BASE_CURRENCY'], today)
+            for (key, route, rate), quote in zip(changed, quotes):
+                cost = quote['converted']['total'] if quote['converted'] else None
+                legs[key] = Leg(key[0], key[1], route.route_id, rate.rate_id, route.transit_time,
+                                rate.price, rate.currency, quote['total'], cost)
+
+        adjacency = defaultdict(lambda: defaultdict(list))
+        for (origin, _, container_type), leg in legs.items():
+            adjacency[container_type][origin].append(leg)
+
+        snapshot = RoutingSnapshot(today, legs, {ct: dict(origins) for ct, origins in adjacency.items()})
+        self._previous = snapshot
+        return snapshot
+
+    def search(self, origin, destination, container_type, k, max_legs, fastest=False):
+        """Up to k itineraries (tuples of legs) ordered by total cost, or by transit time when fastest"""
+        adjacency = self.current().adjacency.get(container_type, {})
+        if fastest:
+            weight = lambda leg: (leg.transit_time, leg.cost or 0)
+        else:
+            weight = lambda leg: (leg.cost, leg.transit_time)
+
+        # Dijkstra式搜尋：每個 (港口, 段數) 狀態最多出隊 k 次，路徑不重複經過同一港口
+        tiebreak = count()
+        heap = [(0, 0, next(tiebreak), (origin,), ())]
+        settled = defaultdict(int)
+        found = []
+        while heap and len(found) < k:
+            primary, secondary, _, ports, path = heappop(heap)
+            node = ports[-1]
+            state = (node, len(path))
+            if settled[state] >= k:
+                continue
+            settled[state] += 1
+            if node == destination:
+                found.append(path)
+                continue
+            if len(path) >= max_legs:
+                continue
+            for leg in adjacency.get(node, ()):
+                if leg.destination in ports:
+                    continue
+                first, second = weight(leg)
+                if first is None:
+                    continue
+                heappush(heap, (primary + first, secondary + second, next(tiebreak),
+                                ports + (leg.destination,), path + (leg,)))
+        return found
+
+
+route_graph = RouteGraph()
+
+
+def find_itineraries(origin_port_id, destination_port_id, container_type_id, k=3, max_legs=None, currency=None):
+    """The k cheapest and k fastest itineraries, each leg a direct Route with a current rate"""
+    origin, destination, container_type = (_to_id(origin_port_id), _to_id(destination_port_id),
+                                           _to_id(container_type_id))
+    max_legs = max_legs or current_app.config['ROUTING_MAX_LEGS']
+    base_currency = current_app.config['FX_BASE_CURRENCY']
+    currency = currency or base_currency
+
+    cheapest = route_graph.search(origin, destination, container_type, k, max_legs)
+    fastest = route_graph.search(origin, destination, container_type, k, max_legs, fastest=True)
+
+    # 所有行程的基準貨幣總額一次換算為輸出貨幣
+    itineraries = cheapest + fastest
+    costs = [sum(leg.cost for leg in path) if all(leg.cost is not None for leg in path) else float('nan')
+             for path in itineraries]
+    totals = fx_table.convert(costs, [base_currency] * len(costs), currency, datetime.utcnow().date())
+    data = [_itinerary_data(path, total, currency) for path, total in zip(itineraries, totals)]
+    return {'cheapest': data[:len(cheapest)], 'fastest': data[len(cheapest):]}
+
+
+def _itinerary_data(path, total, currency):
+    return {
+        'legs': [{
+            'origin_port': leg.origin,
+            'destination_port': leg.destination,
+            'route_id': leg.route_id,
+            'transit_time': leg.transit_time,
+            'price': leg.price,
+            'currency': leg.currency,
+            'total': leg.total
+        } for leg in path],
+        'transit_time': sum(leg.transit_time for leg in path),
+        'total': None if total != total else round(float(total), 2),
+        'currency': currency
+    }
+
+
+@changes.on_commit('routes', 'base_rates')
+def _invalidate_route_graph(tables):
+    route_graph.invalidate()
+
+
+@changes.on_commit(*PRICING_TABLES)
+def _reprice_route_graph(tables):
+    route_graph.invalidate(reprice=True)
@@ -0,0 +1,80 @@
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from heapq import merge
+from itertools import groupby, islice
+from operator import attrgetter
+from .app import db
+from .cache import ReloadingCache
+from .models import VesselSchedule
+from . import changes
+
+Sailing = namedtuple('Sailing', 'schedule_id route_id vessel_name voyage departure_date arrival_date')
+# departures 與 sailings 按開航日期排序；arrivals 與 by_arrival 按到達日期排序
+RouteSailings = namedtuple('RouteSailings', 'departures sailings arrivals by_arrival')
+
+
+class SailingIndex(ReloadingCache):
+    """Per-route VesselSchedule arrays answering departure and arrival date queries by binary search"""
+
+    ttl_config = 'RATE_ENGINE_TTL'
+    tables = ('vessel_schedules',)
+
+    def build(self):
+        rows = db.session.query(
+            VesselSchedule.id, VesselSchedule.route_id, VesselSchedule.vessel_name, VesselSchedule.voyage,
+            VesselSchedule.departure_date, VesselSchedule.arrival_date
+        ).order_by(VesselSchedule.route_id, VesselSchedule.departure_date, VesselSchedule.id)
+
+        index = {}
+        for route_id, group in groupby((Sailing(*row) for row in rows), key=attrgetter('route_id')):
+            sailings = list(group)
+            by_arrival = sorted(sailings, key=attrgetter('arrival_date'))
+            index[route_id] = RouteSailings([s.departure_date for s in sailings], sailings,
+                                            [s.arrival_date for s in by_arrival], by_arrival)
+        return index
+
+    def next_departures(self, route_id, after, n, until=None):
+        """The first n sailings departing on or after a date, optionally no later than until"""
+        entry = self.current().get(route_id)
+        if entry is None:
+            return []
+        start = bisect_left(entry.departures, after)
+        end = bisect_right(entry.departures, until) if until else len(entry.departures)
+        return entry.sailings[start:min(end, start + n)]
+
+    def window(self, route_id, start, end):
+        """All sailings departing within [start, end]"""
+        entry = self.current().get(route_id)
+        if entry is None:
+            return []
+        return entry.sailings[bisect_left(entry.departures, start):bisect_right(entry.departures, end)]
+
+    def arriving_before(self, route_id, deadline, departing_after=None):
+        """Sailings arriving on or before the deadline, ordered by departure"""
+        entry = self.current().get(route_id)
+        if entry is None:
+            return []
+        sailings = entry.by_arrival[:bisect_right(entry.arrivals, deadline)]
+        if departing_after:
+            sailings = [s for s in sailings if s.departure_date >= departing_after]
+        return sorted(sailings, key=attrgetter('departure_date'))
+
+    def search(self, route_ids, start, end, arrive_by=None, limit=None):
+        """Sailings of many routes departing within [start, end], merged in departure order"""
+        per_route = []
+        for route_id in route_ids:
+            sailings = self.window(route_id, start, end)
+            if arrive_by:
+                sailings = [s for s in sailings if s.arrival_date <= arrive_by]
+            if sailings:
+                per_route.append(sailings)
+        merged = merge(*per_route, key=attrgetter('departure_date'))
+        return list(islice(merged, limit) if limit else merged)
+
+
+sailing_index = SailingIndex()
+
+
+@changes.on_commit('vessel_schedules')
+def _invalidate_sailing_index(tables):
+    sailing_index.invalidate()
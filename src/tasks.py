@@ -0,0 +1,27 @@
+"""Entry points executed in spawned pool processes
+
+A spawned worker unpickles these functions by importing this module first. Importing
+src.app before anything else registers the blueprints in the same order as the web
+process; importing src.jobs or src.documents first would hit their import cycle
+through src.app.
+"""
+from .app import app, db
+
+
+def run_import_job(job_id, kind, path, config):
+    """Run one import job with the web process's database and shared file settings"""
+    from .jobs import _run_job
+
+    app.config.update(config)
+    with app.app_context():
+        try:
+            return _run_job(job_id, kind, path)
+        finally:
+            db.session.remove()
+
+
+def render_pdf(document):
+    """Render one booking confirmation for a bulk export"""
+    from .documents import render_pdf
+
+    return render_pdf(document)
@@ -0,0 +1,65 @@
+import os
+import sys
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app
+
+
+@pytest.fixture(autouse=True)
+def quote_log_disabled():
+    # 報價日誌的後台線程會寫入其他測試的數據庫，只在需要的測試中開啟
+    app.config['QUOTE_LOG_ENABLED'] = False
+    yield
+    app.config['QUOTE_LOG_ENABLED'] = False
+
+
+@pytest.fixture(autouse=True)
+def isolated_data_version(tmp_path, monkeypatch):
+    # 數據版本文件默認在系統臨時目錄，與同一主機上運行的服務共享，測試中改用各自的臨時文件
+    monkeypatch.setitem(app.config, 'DATA_VERSION_FILE', str(tmp_path / 'data_version'))
+
+
+@pytest.fixture(autouse=True)
+def isolated_rate_snapshot(tmp_path, monkeypatch):
+    # 運費快照同樣默認在系統臨時目錄
+    monkeypatch.setitem(app.config, 'RATE_SNAPSHOT_FILE', str(tmp_path / 'rates.snapshot'))
+
+
+class QueryBudget:
+    """Context manager failing the test when more than `limit` SQL statements run inside it
+
+        with query_budget(3):
+            client.get('/quote/')
+    """
+
+    def __init__(self, limit, label=''):
+        self.limit = limit
+        self.label = label
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(' '.join(statement.split()))
+
+    def __enter__(self):
+        # 掛在 Engine 類上，主庫、副本及後台線程的語句都會計入
+        event.listen(Engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(Engine, 'before_cursor_execute', self._record)
+        if exc_type is None and len(self.statements) > self.limit:
+            listing = '\n'.join(f'{i}. {statement}' for i, statement in enumerate(self.statements, 1))
+            pytest.fail(f'{self.label or "block"} ran {len(self.statements)} SQL statements, '
+                        f'budget is {self.limit}:\n{listing}', pytrace=False)
+        return False
+
+
+@pytest.fixture
+def query_budget():
+    """Factory for QueryBudget, so tests can cap the statements an endpoint may issue"""
+    return QueryBudget
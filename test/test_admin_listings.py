@@ -0,0 +1,106 @@
+import os
+import sys
+from datetime import date, timedelta
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate, VesselSchedule
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.app_context():
+        db.create_all()
+        port_sha = Port(code='SHA', name='上海', country='CN', region='Asia')
+        port_lax = Port(code='LAX', name='洛杉磯', country='US', region='America')
+        ct_20gp = ContainerType(code='20GP', name='20呎標準貨櫃', size='20', description='')
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        db.session.add_all([port_sha, port_lax, ct_20gp, ct_40hq])
+        db.session.flush()
+        outbound = Route(origin_port_id=port_sha.id, destination_port_id=port_lax.id, transit_time=15)
+        inbound = Route(origin_port_id=port_lax.id, destination_port_id=port_sha.id, transit_time=18)
+        db.session.add_all([outbound, inbound])
+        db.session.flush()
+        start = date(2024, 1, 1)
+        for i in range(6):
+            for route in (outbound, inbound):
+                db.session.add(BaseRate(route_id=route.id, container_type_id=ct_40hq.id if i % 2 else ct_20gp.id,
+                                        price=1000 + i, currency='USD', effective_date=start + timedelta(days=i)))
+                db.session.add(VesselSchedule(route_id=route.id, vessel_name='EVER', voyage=f'{i:03d}',
+                                              departure_date=start + timedelta(days=i // 2),
+                                              arrival_date=start + timedelta(days=20)))
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['username'] = 'admin'
+            sess['role'] = 'admin'
+        yield client
+        db.session.remove()
+        db.drop_all()
+
+
+def test_rates_keyset_pages(client):
+    seen = []
+    cursor = None
+    while True:
+        resp = client.get('/admin/api/rates', query_string={'limit': 5, 'cursor': cursor or ''})
+        data = resp.get_json()
+        seen.extend((rate['effective_date'], rate['id']) for rate in data['rates'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    assert len(seen) == 12
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_rates_filters(client):
+    data = client.get('/admin/api/rates', query_string={
+        'origin_port': 1, 'container_type': 2, 'date_from': '2024-01-02', 'date_to': '2024-01-04'
+    }).get_json()
+    assert [(r['origin_port'], r['container_type'], r['effective_date']) for r in data['rates']] == [
+        ('SHA', '40HQ', '2024-01-04'), ('SHA', '40HQ', '2024-01-02')]
+    assert data['next_cursor'] is None
+
+
+def test_schedules_keyset_pages_with_ties(client):
+    first = client.get('/admin/api/schedules', query_string={'limit': 5, 'destination_port': 2}).get_json()
+    second = client.get('/admin/api/schedules', query_string={
+        'limit': 5, 'destination_port': 2, 'cursor': first['next_cursor']}).get_json()
+    voyages = [s['voyage'] for s in first['schedules'] + second['schedules']]
+    assert sorted(voyages) == ['000', '001', '002', '003', '004', '005']
+    assert second['next_cursor'] is None
+
+
+def test_invalid_cursor(client):
+    assert client.get('/admin/api/rates', query_string={'cursor': 'bad'}).status_code == 400
+
+
+def test_invalid_limit(client):
+    for limit in (-2, -1, 0):
+        assert client.get('/admin/api/rates', query_string={'limit': limit}).status_code == 400
+        assert client.get('/admin/api/schedules', query_string={'limit': limit}).status_code == 400
+        assert client.get('/admin/api/analytics/lanes', query_string={'limit': limit}).status_code == 400
+
+
+def test_exchange_rates_upsert(client):
+    payload = {'exchange_rates': [
+        {'currency': 'eur', 'rate': 1.1, 'effective_date': '2024-01-01'},
+        {'currency': 'EUR', 'rate': 1.08, 'effective_date': '2024-02-01'},
+    ]}
+    assert client.post('/admin/api/exchange_rates', json=payload).get_json()['count'] == 2
+    payload['exchange_rates'][1]['rate'] = 1.09
+    client.post('/admin/api/exchange_rates', json=payload)
+    rates = client.get('/admin/api/exchange_rates?currency=eur').get_json()['exchange_rates']
+    assert [(rate['effective_date'], rate['rate']) for rate in rates] == [('2024-02-01', 1.09), ('2024-01-01', 1.1)]
+
+    resp = client.post('/admin/api/exchange_rates', json={'exchange_rates': [{'currency': 'EURO', 'rate': 1}]})
+    assert resp.status_code == 400
+    for rate in ('nan', 'inf', '-inf', 0):
+        resp = client.post('/admin/api/exchange_rates', json={'exchange_rates': [
+            {'currency': 'EUR', 'rate': rate, 'effective_date': '2024-03-01'}]})
+        assert resp.status_code == 400
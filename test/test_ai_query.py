@@ -60,3 +60,22 @@ def test_english_query(client):
     assert data['success'] is True
     assert '上海' in data['response']
     assert '洛杉磯' in data['response']
+
+
+def test_query_resolves_quote(client):
+    login_session(client)
+    for query in ['請提供從上海到洛杉磯的40HQ運費', 'rate from shanghai to los angeles 40hq', '上海到洛杉磯 40呎高櫃']:
+        resp = client.post('/quote/process_ai_query', data={'query': query})
+        data = resp.get_json()
+        assert '基本運費：1000' in data['response'], query
+
+
+def test_port_matcher_markers(client):
+    from src.port_matcher import port_matcher
+    match = port_matcher.match('到洛杉磯, 從上海出發 40HQ')
+    assert match.origin_port.name == '上海'
+    assert match.destination_port.name == '洛杉磯'
+    assert match.container_type.code == '40HQ'
+    # 代碼需完整單詞，"lax" 不應命中 "relaxed"
+    match = port_matcher.match('relaxed shipping')
+    assert match.origin_port is None and match.destination_port is None
@@ -0,0 +1,107 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, QuoteQuery, Booking, ExchangeRate, LaneDailyStat, RollupState
+from src.analytics import refresh_rollups
+
+# 固定在某週一，便於按週彙總
+MONDAY = datetime(2024, 3, 4, 10, 0)
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['ANALYTICS_LAG_SECONDS'] = 0
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Port(code='SHA', name='上海', country='CN', region='Asia'),
+            Port(code='LAX', name='洛杉磯', country='US', region='America'),
+            Port(code='RTM', name='鹿特丹', country='NL', region='Europe'),
+            ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description=''),
+            ExchangeRate(currency='EUR', rate=1.1, effective_date=datetime(2024, 1, 1).date()),
+        ])
+        db.session.commit()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+def login_session(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+
+def add_quotes(day_offset, destination, prices):
+    for price, currency in prices:
+        db.session.add(QuoteQuery(user_id=1, origin_port_id=1, destination_port_id=destination, container_type_id=1,
+                                  query_date=MONDAY + timedelta(days=day_offset), result_rate=price,
+                                  result_currency=currency))
+    db.session.commit()
+
+
+def test_incremental_rollup(client):
+    add_quotes(0, 2, [(1000, 'USD'), (1000, 'EUR'), (None, None)])
+    db.session.add_all([
+        Booking(user_id=1, origin_port='SHA', destination_port='洛杉磯', container_type='40HQ', booking_date=MONDAY),
+        Booking(user_id=1, origin_port='???', destination_port='LAX', container_type='40HQ', booking_date=MONDAY),
+    ])
+    db.session.commit()
+    assert refresh_rollups() == {'quote_queries': 3, 'bookings': 2}
+
+    stat = LaneDailyStat.query.one()
+    assert (stat.quote_count, stat.priced_count, stat.booking_count) == (3, 2, 1)
+    assert stat.price_sum == pytest.approx(2100)
+
+    # 只處理高水位之後的新行
+    add_quotes(0, 2, [(900, 'USD')])
+    add_quotes(1, 3, [(1500, 'USD')])
+    assert refresh_rollups(batch_size=1) == {'quote_queries': 2, 'bookings': 0}
+    assert refresh_rollups() == {'quote_queries': 0, 'bookings': 0}
+    assert LaneDailyStat.query.count() == 2
+    assert LaneDailyStat.query.filter_by(destination_port_id=2).one().quote_count == 4
+    assert db.session.get(RollupState, 'quote_queries').last_id == 5
+
+
+def test_weekly_report_reads_rollups(client):
+    add_quotes(0, 2, [(1000, 'USD')] * 4)
+    add_quotes(2, 3, [(2000, 'USD')] * 2)
+    add_quotes(7, 3, [(1800, 'USD')] * 3)
+    db.session.add(Booking(user_id=1, origin_port='SHA', destination_port='LAX', container_type='40HQ',
+                           booking_date=MONDAY))
+    db.session.commit()
+    login_session(client)
+    client.post('/admin/analytics/refresh')
+
+    resp = client.get('/admin/api/analytics/lanes', query_string={'date_from': '2024-03-01', 'date_to': '2024-03-31'})
+    lanes = resp.get_json()['lanes']
+    assert [(lane['week'], lane['destination_port'], lane['quote_count']) for lane in lanes] == [
+        ('2024-03-11', 'RTM', 3), ('2024-03-04', 'LAX', 4), ('2024-03-04', 'RTM', 2)]
+    assert lanes[1]['conversion_rate'] == 0.25
+    assert lanes[1]['average_price'] == 1000
+
+
+def test_refresh_conflict_returns_409(client, monkeypatch):
+    from src import analytics
+    add_quotes(0, 2, [(1000, 'USD')])
+    login_session(client)
+    # 模擬其他進程在讀取高水位後搶先推進
+    loader = analytics._quote_deltas
+
+    def racing_loader(last_id, batch_size, cutoff):
+        result = loader(last_id, batch_size, cutoff)
+        db.session.execute(RollupState.__table__.insert().values(name='quote_queries', last_id=99,
+                                                                updated_at=datetime.utcnow()))
+        db.session.commit()
+        return result
+
+    monkeypatch.setattr(analytics, '_quote_deltas', racing_loader)
+    resp = client.post('/admin/analytics/refresh')
+    assert resp.status_code == 409
+    assert resp.get_json()['success'] is False
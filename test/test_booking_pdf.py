@@ -0,0 +1,150 @@
+import io
+import os
+import sys
+import zipfile
+from datetime import datetime, timedelta
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate, Booking
+from src import documents
+
+@pytest.fixture
+def client(tmp_path):
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['PDF_CACHE_DIR'] = str(tmp_path)
+    app.config['PDF_RENDER_EXECUTOR'] = 'inline'
+    with app.app_context():
+        db.create_all()
+        today = datetime.utcnow().date()
+        port_sha = Port(code='SHA', name='上海', country='CN', region='Asia')
+        port_lax = Port(code='LAX', name='洛杉磯', country='US', region='America')
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        db.session.add_all([port_sha, port_lax, ct_40hq])
+        db.session.flush()
+        route = Route(origin_port_id=port_sha.id, destination_port_id=port_lax.id, transit_time=15)
+        db.session.add(route)
+        db.session.flush()
+        db.session.add(BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=1000, currency='USD',
+                                effective_date=today - timedelta(days=10)))
+        db.session.add_all([
+            Booking(user_id=1, origin_port='SHA', destination_port='洛杉磯', container_type='40HQ'),
+            Booking(user_id=1, origin_port='上海', destination_port='LAX', container_type='40呎高櫃'),
+            Booking(user_id=1, origin_port='XXX', destination_port='LAX', container_type='40HQ'),
+        ])
+        db.session.commit()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+def login_session(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'tester'
+        sess['role'] = 'customer'
+
+@pytest.fixture
+def renders(monkeypatch):
+    calls = []
+    render_pdf = documents.render_pdf
+
+    def counting_render(document):
+        calls.append(document['booking_id'])
+        return render_pdf(document)
+
+    monkeypatch.setattr(documents, 'render_pdf', counting_render)
+    return calls
+
+
+def test_document_resolves_rate(client):
+    document = documents.booking_document(Booking.query.get(1))
+    assert document['rate']['price'] == 1000
+    assert documents.booking_document(Booking.query.get(3))['rate'] is None
+
+
+def test_pdf_cached_until_rate_changes(client, tmp_path, renders):
+    login_session(client)
+    first = client.get('/quote/1/pdf')
+    assert first.status_code == 200
+    assert client.get('/quote/1/pdf').data == first.data
+    assert renders == [1]
+
+    BaseRate.query.update({'price': 1200})
+    db.session.commit()
+    client.get('/quote/1/pdf')
+    assert renders == [1, 1]
+    # 舊版本的文件已被替換
+    assert len(list(tmp_path.glob('booking_1_*.pdf'))) == 1
+
+
+def test_export_zip(client, renders):
+    login_session(client)
+    client.get('/quote/2/pdf')
+    resp = client.post('/quote/bookings/export', json={'booking_ids': [3, 2, 1, 99]})
+    assert resp.mimetype == 'application/zip'
+    archive = zipfile.ZipFile(io.BytesIO(resp.data))
+    assert archive.namelist() == ['quote_1.pdf', 'quote_2.pdf', 'quote_3.pdf']
+    assert archive.read('quote_2.pdf').startswith(b'%PDF')
+    # 已緩存的PDF不重新渲染
+    assert sorted(renders) == [1, 2, 3]
+
+    assert client.post('/quote/bookings/export', json={'booking_ids': [99]}).status_code == 404
+
+
+@pytest.fixture
+def process_pool(client):
+    app.config['PDF_RENDER_EXECUTOR'] = 'process'
+    app.config['PDF_RENDER_WORKERS'] = 1
+    yield
+    if documents._executor is not None:
+        documents._executor.shutdown()
+        documents._executor = None
+    app.config['PDF_RENDER_EXECUTOR'] = 'inline'
+
+
+def test_export_zip_in_spawned_pool(client, process_pool):
+    login_session(client)
+    resp = client.post('/quote/bookings/export', json={'booking_ids': [1, 2, 3]})
+    archive = zipfile.ZipFile(io.BytesIO(resp.data))
+    assert archive.namelist() == ['quote_1.pdf', 'quote_2.pdf', 'quote_3.pdf']
+    assert all(archive.read(name).startswith(b'%PDF') for name in archive.namelist())
+
+
+def test_export_recovers_from_broken_pool(client, process_pool):
+    login_session(client)
+    # 讓唯一的子進程異常退出，進程池進入損壞狀態
+    broken = documents._get_executor()
+    with pytest.raises(Exception):
+        broken.submit(os._exit, 1).result()
+
+    resp = client.post('/quote/bookings/export', json={'booking_ids': [1, 2]})
+    assert zipfile.ZipFile(io.BytesIO(resp.data)).namelist() == ['quote_1.pdf', 'quote_2.pdf']
+    assert documents._executor is not broken
+
+    # 下次導出重新建立進程池
+    BaseRate.query.update({'price': 1200})
+    db.session.commit()
+    resp = client.post('/quote/bookings/export', json={'booking_ids': [1]})
+    assert zipfile.ZipFile(io.BytesIO(resp.data)).read('quote_1.pdf').startswith(b'%PDF')
+    assert documents._executor is not None and documents._executor is not broken
+
+
+def test_customer_cannot_export_other_customers_bookings(client):
+    db.session.add(Booking(user_id=2, origin_port='SHA', destination_port='LAX', container_type='40HQ'))
+    db.session.commit()
+    login_session(client)
+
+    assert client.get('/quote/4/pdf').status_code == 404
+    assert client.post('/quote/bookings/export', json={'booking_ids': [4]}).status_code == 404
+    resp = client.post('/quote/bookings/export', json={'booking_ids': [1, 4]})
+    assert zipfile.ZipFile(io.BytesIO(resp.data)).namelist() == ['quote_1.pdf']
+
+    # 操作員可導出任何客戶的訂艙
+    with client.session_transaction() as sess:
+        sess['role'] = 'operator'
+    resp = client.post('/quote/bookings/export', json={'booking_ids': [1, 4]})
+    assert zipfile.ZipFile(io.BytesIO(resp.data)).namelist() == ['quote_1.pdf', 'quote_4.pdf']
@@ -0,0 +1,58 @@
+import os
+import sys
+from datetime import date
+import pytest
+from sqlalchemy import event
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate, Booking
+from src.dashboard_stats import dashboard_stats
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.app_context():
+        db.create_all()
+        port_sha = Port(code='SHA', name='上海', country='CN', region='Asia')
+        port_lax = Port(code='LAX', name='洛杉磯', country='US', region='America')
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        db.session.add_all([port_sha, port_lax, ct_40hq])
+        db.session.flush()
+        route = Route(origin_port_id=port_sha.id, destination_port_id=port_lax.id, transit_time=15)
+        db.session.add(route)
+        db.session.flush()
+        db.session.add(BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=1000,
+                                currency='USD', effective_date=date(2024, 1, 1)))
+        db.session.commit()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def test_stats_cached_until_commit(client):
+    stats = dashboard_stats.current()
+    assert (stats['port_count'], stats['route_count'], stats['rate_count']) == (2, 1, 1)
+    assert stats['latest_rates'][0].route.origin_port.code == 'SHA'
+    assert stats['latest_rates'][0].container_type.code == '40HQ'
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        assert dashboard_stats.current() is stats
+        assert statements == []
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    # 與統計無關的寫入不使緩存失效
+    db.session.add(Booking(user_id=1, origin_port='SHA', destination_port='LAX', container_type='40HQ'))
+    db.session.commit()
+    assert dashboard_stats.current() is stats
+
+    db.session.add(Port(code='KHH', name='高雄', country='TW', region='Asia'))
+    db.session.commit()
+    assert dashboard_stats.current()['port_count'] == 3
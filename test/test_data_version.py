@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate
+from src.rate_engine import rate_engine
+from src.data_version import data_version
+
+LANE = {'origin_port': '1', 'destination_port': '2', 'container_type': '1'}
+
+
+@pytest.fixture
+def client(tmp_path):
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['DATA_VERSION_FILE'] = str(tmp_path / 'data_version')
+    with app.app_context():
+        db.create_all()
+        today = datetime.utcnow().date()
+        port_sha = Port(code='SHA', name='上海', country='CN', region='Asia')
+        port_lax = Port(code='LAX', name='洛杉磯', country='US', region='America')
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        db.session.add_all([port_sha, port_lax, ct_40hq])
+        db.session.flush()
+        route = Route(origin_port_id=port_sha.id, destination_port_id=port_lax.id, transit_time=15)
+        db.session.add(route)
+        db.session.flush()
+        db.session.add(BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=1000, currency='USD',
+                                effective_date=today - timedelta(days=10)))
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['username'] = 'tester'
+            sess['role'] = 'customer'
+        yield client
+        db.session.remove()
+        db.drop_all()
+
+
+def test_version_bumps_on_commit(client):
+    before = data_version.current()
+    db.session.add(BaseRate(route_id=1, container_type_id=1, price=1100, currency='USD',
+                            effective_date=datetime.utcnow().date()))
+    db.session.commit()
+    after = data_version.current()
+    assert after.version == before.version + 1
+    assert after.tables['base_rates'] == before.tables.get('base_rates', 0) + 1
+    assert 'vessel_schedules' not in after.tables
+
+
+def test_rate_api_not_modified(client):
+    resp = client.get('/quote/rate', query_string=LANE)
+    assert resp.status_code == 200
+    assert resp.get_json()['rate']['price'] == 1000
+    etag = resp.headers['ETag']
+    last_modified = resp.headers['Last-Modified']
+    assert resp.headers['Cache-Control'] == app.config['HTTP_CACHE_CONTROL']
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        resp = client.get('/quote/rate', query_string=LANE, headers={'If-None-Match': etag})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert resp.status_code == 304
+    assert resp.headers['ETag'] == etag
+    assert statements == []
+
+    resp = client.get('/quote/rate', query_string=LANE,
+                      headers={'If-Modified-Since': last_modified})
+    assert resp.status_code == 304
+
+    db.session.add(BaseRate(route_id=1, container_type_id=1, price=1100, currency='USD',
+                            effective_date=datetime.utcnow().date()))
+    db.session.commit()
+    resp = client.get('/quote/rate', query_string=LANE, headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+    assert resp.get_json()['rate']['price'] == 1100
+
+
+def test_recreated_version_file_is_not_cached(client):
+    resp = client.get('/quote/rate', query_string=LANE)
+    etag = resp.headers['ETag']
+    last_modified = resp.headers['Last-Modified']
+    assert data_version.current().epoch in etag
+
+    # 版本文件被重建（如容器重建後 /tmp 清空），計數重新開始並回到相同的版本號
+    version = data_version.current().version
+    time.sleep(1)
+    os.unlink(app.config['DATA_VERSION_FILE'])
+    for _ in range(version):
+        data_version.bump(['base_rates'])
+    assert data_version.current().version == version
+    resp = client.get('/quote/rate', query_string=LANE, headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+    resp = client.get('/quote/rate', query_string=LANE, headers={'If-Modified-Since': last_modified})
+    assert resp.status_code == 200
+
+
+def test_errors_are_not_cached(client):
+    resp = client.get('/quote/rate', query_string=dict(LANE, currency='??'))
+    assert resp.status_code == 400
+    assert 'ETag' not in resp.headers
+
+
+def test_other_process_change_rebuilds_cache(client):
+    today = datetime.utcnow().date()
+    assert rate_engine.find_rate(1, 2, 1, today).price == 1000
+    # 模擬其他進程的提交：直接寫入不觸發本進程的提交通知，只有共享數據版本變化
+    with db.engine.begin() as conn:
+        conn.execute(BaseRate.__table__.update().values(price=1200))
+    assert rate_engine.find_rate(1, 2, 1, today).price == 1000
+    data_version.bump({'base_rates'})
+    assert rate_engine.find_rate(1, 2, 1, today).price == 1200
@@ -0,0 +1,88 @@
+import os
+import sys
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate, ExchangeRate
+from src.db_routing import replicas
+
+
+def _seed(session, rate_count):
+    port_sha = Port(code='SHA', name='上海', country='CN', region='Asia')
+    port_lax = Port(code='LAX', name='洛杉磯', country='US', region='America')
+    ct_20gp = ContainerType(code='20GP', name='20呎標準貨櫃', size='20', description='')
+    session.add_all([port_sha, port_lax, ct_20gp])
+    session.flush()
+    route = Route(origin_port_id=port_sha.id, destination_port_id=port_lax.id, transit_time=15)
+    session.add(route)
+    session.flush()
+    for i in range(rate_count):
+        session.add(BaseRate(route_id=route.id, container_type_id=ct_20gp.id, price=1000 + i, currency='USD',
+                             effective_date=date(2024, 1, 1) + timedelta(days=i)))
+    session.commit()
+
+
+@pytest.fixture
+def replica_url(tmp_path):
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = create_engine(url)
+    db.Model.metadata.create_all(engine)
+    with Session(engine) as session:
+        _seed(session, 1)
+    engine.dispose()
+    return url
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.app_context():
+        db.create_all()
+        _seed(db.session, 3)
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['username'] = 'admin'
+            sess['role'] = 'admin'
+        yield client
+        db.session.remove()
+        db.drop_all()
+    app.config['SQLALCHEMY_REPLICA_URIS'] = []
+    replicas.dispose()
+
+
+def test_read_only_views_use_replica(client, replica_url):
+    app.config['SQLALCHEMY_REPLICA_URIS'] = [replica_url]
+    data = client.get('/admin/api/rates').get_json()
+    assert [rate['price'] for rate in data['rates']] == [1000]
+
+
+def test_writes_use_primary(client, replica_url):
+    app.config['SQLALCHEMY_REPLICA_URIS'] = [replica_url]
+    resp = client.post('/admin/api/exchange_rates', json={
+        'exchange_rates': [{'currency': 'EUR', 'rate': 1.1, 'effective_date': '2024-01-01'}]
+    })
+    assert resp.get_json()['success']
+    assert ExchangeRate.query.filter_by(currency='EUR').count() == 1
+    engine = create_engine(replica_url)
+    with engine.connect() as conn:
+        assert conn.execute(ExchangeRate.__table__.select()).fetchall() == []
+    engine.dispose()
+
+
+def test_failover_to_primary_when_replica_down(client, tmp_path):
+    down_url = f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"
+    app.config['SQLALCHEMY_REPLICA_URIS'] = [down_url]
+    data = client.get('/admin/api/rates').get_json()
+    assert sorted(rate['price'] for rate in data['rates']) == [1000, 1001, 1002]
+    # 標記下線後的請求直接走主庫
+    assert replicas.pick(app.config) is None
+    data = client.get('/admin/api/rates').get_json()
+    assert len(data['rates']) == 3
@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Booking
+from src.quote import booking_writer
+from src.group_commit import GroupCommitter
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['GROUP_COMMIT_ENABLED'] = True
+    app.config['GROUP_COMMIT_WINDOW_MS'] = 50
+    app.config['GROUP_COMMIT_TIMEOUT'] = 5
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+    app.config['GROUP_COMMIT_TIMEOUT'] = 5
+
+def run_concurrently(target, count):
+    results = [None] * count
+
+    def worker(i):
+        with app.app_context():
+            try:
+                results[i] = target(i)
+            except Exception as e:
+                results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_bookings_share_commits(client):
+    def book(i):
+        with app.test_client() as c:
+            with c.session_transaction() as sess:
+                sess['user_id'] = 1
+            return c.post('/quote/book', json={'origin': 'SHA', 'destination': f'P{i}',
+                                               'container_type': '40HQ'}).get_json()
+
+    results = run_concurrently(book, 20)
+    ids = [result['booking_id'] for result in results]
+    assert len(set(ids)) == 20
+    destinations = {booking.id: booking.destination_port for booking in Booking.query}
+    assert [destinations[booking_id] for booking_id in ids] == [f'P{i}' for i in range(20)]
+
+
+def test_failed_row_does_not_fail_batch(client):
+    def insert(i):
+        # user_id 為空違反非空約束
+        return booking_writer.insert({'user_id': None if i == 3 else 1, 'origin_port': 'SHA',
+                                      'destination_port': 'LAX', 'container_type': '40HQ'})
+
+    results = run_concurrently(insert, 8)
+    errors = [i for i, result in enumerate(results) if isinstance(result, Exception)]
+    assert errors == [3]
+    assert Booking.query.count() == 7
+
+
+def test_disabled_commits_inline(client):
+    app.config['GROUP_COMMIT_ENABLED'] = False
+    try:
+        booking_id = booking_writer.insert({'user_id': 1, 'origin_port': 'SHA', 'destination_port': 'LAX',
+                                            'container_type': '40HQ'})
+    finally:
+        app.config['GROUP_COMMIT_ENABLED'] = True
+    assert Booking.query.get(booking_id).origin_port == 'SHA'
+
+
+BOOKING = {'user_id': 1, 'origin_port': 'SHA', 'destination_port': 'LAX', 'container_type': '40HQ'}
+
+
+def test_dead_writer_falls_back_to_direct_commit(client, monkeypatch):
+    app.config['GROUP_COMMIT_TIMEOUT'] = 0.05
+    writer = GroupCommitter(Booking)
+    # 寫入線程沒有運行，請求超時後自行提交
+    monkeypatch.setattr(writer, '_ensure_writer', lambda app: None)
+    booking_id = writer.insert(dict(BOOKING))
+    assert Booking.query.get(booking_id).destination_port == 'LAX'
+    assert Booking.query.count() == 1
+
+
+def test_stalled_write_times_out_with_503(client, monkeypatch):
+    app.config['GROUP_COMMIT_TIMEOUT'] = 0.05
+    release = threading.Event()
+    monkeypatch.setattr(booking_writer, '_write', lambda batch: release.wait(5))
+    try:
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        # 寫入線程取走後停滯，結果未知，返回503而不是重試
+        resp = client.post('/quote/book', json={'origin': 'SHA', 'destination': 'LAX', 'container_type': '40HQ'})
+        assert resp.status_code == 503
+        # 之後的請求未被停滯的寫入線程取走，直接提交
+        booking_id = booking_writer.insert(dict(BOOKING))
+        assert Booking.query.get(booking_id) is not None
+    finally:
+        release.set()
@@ -0,0 +1,252 @@
+import io
+import os
+import sys
+import time
+from datetime import date
+import pandas as pd
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate, VesselSchedule
+from src.importers import RateImporter, ScheduleImporter, MissingColumnError
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['IMPORT_JOB_EXECUTOR'] = 'inline'
+    with app.app_context():
+        db.create_all()
+        port_sha = Port(code='SHA', name='上海', country='CN', region='Asia')
+        port_lax = Port(code='LAX', name='洛杉磯', country='US', region='America')
+        port_khh = Port(code='KHH', name='高雄', country='TW', region='Asia')
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        db.session.add_all([port_sha, port_lax, port_khh, ct_40hq])
+        db.session.flush()
+        route = Route(origin_port_id=port_sha.id, destination_port_id=port_lax.id, transit_time=15)
+        db.session.add(route)
+        db.session.flush()
+        db.session.add(BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=1000,
+                                currency='USD', effective_date=date(2024, 1, 1)))
+        db.session.commit()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def pool_client(tmp_path):
+    # 子進程無法訪問內存數據庫，使用臨時文件
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'pool.db'}"
+    app.config['IMPORT_JOB_EXECUTOR'] = 'process'
+    app.config['IMPORT_WORKERS'] = 1
+    from src import jobs
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Port(code='SHA', name='上海', country='CN', region='Asia'),
+                            Port(code='LAX', name='洛杉磯', country='US', region='America'),
+                            Port(code='KHH', name='高雄', country='TW', region='Asia'),
+                            ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')])
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['username'] = 'admin'
+            sess['role'] = 'admin'
+        yield client
+        if jobs._executor is not None:
+            jobs._executor.shutdown()
+            jobs._executor = None
+        db.session.remove()
+        db.drop_all()
+    app.config['IMPORT_JOB_EXECUTOR'] = 'inline'
+
+
+def wait_for_job(client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f'/admin/import/jobs/{job_id}').get_json()['job']
+        if job['status'] in ('completed', 'failed', 'cancelled') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.1)
+
+
+def rate_sheet():
+    return pd.DataFrame({
+        '起運港代碼': ['SHA', 'SHA', 'KHH', 'XXX', 'SHA', 'KHH', 'SHA'],
+        '目的港代碼': ['LAX', 'LAX', 'LAX', 'LAX', 'YYY', 'SHA', 'LAX'],
+        '櫃型代碼': ['40HQ', '40HQ', '40HQ', '40HQ', '40HQ', '40HQ', '40HQ'],
+        '基本運費': [1100, 1200, 800, 500, 500, 'abc', 1300],
+        '貨幣': ['USD'] * 7,
+        '航程時間': [15, 15, 18, 10, 10, 3, 15],
+        '生效日期': ['2024-01-01', '2024-01-01', '2024-02-01', '2024-01-01', '2024-01-01',
+                 '2024-01-01', '2024-03-01'],
+        '失效日期': [None, '2024-06-30', None, None, None, None, None],
+    })
+
+
+def test_import_rates_frame_upserts(client):
+    result = RateImporter().process(rate_sheet())
+    db.session.commit()
+
+    assert result.success_count == 4
+    assert result.error_count == 3
+    assert ('找不到起運港代碼：XXX', 'warning') in result.messages
+    assert ('找不到目的港代碼：YYY', 'warning') in result.messages
+
+    # 同一鍵重複出現時以最後一行為準，並更新既有運費
+    rates = BaseRate.query.filter_by(route_id=1).order_by(BaseRate.effective_date).all()
+    assert [(r.price, r.expiry_date) for r in rates] == [(1200, date(2024, 6, 30)), (1300, None)]
+
+    # 缺少的航線批量創建
+    route = Route.query.filter_by(origin_port_id=3, destination_port_id=2).one()
+    assert route.transit_time == 18
+    assert route.description == '從高雄到洛杉磯'
+    assert BaseRate.query.filter_by(route_id=route.id).one().price == 800
+
+
+def test_import_rates_endpoint(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    buffer = io.BytesIO()
+    rate_sheet().to_excel(buffer, index=False, engine='openpyxl')
+    buffer.seek(0)
+    resp = client.post('/admin/import/rates', data={'file': (buffer, 'rates.xlsx')},
+                       content_type='multipart/form-data', headers={'Accept': 'application/json'})
+    assert resp.status_code == 202
+    job_id = resp.get_json()['job_id']
+
+    job = client.get(f'/admin/import/jobs/{job_id}').get_json()['job']
+    assert job['status'] == 'completed'
+    assert (job['rows_processed'], job['success_count'], job['error_count']) == (7, 4, 3)
+    assert {'message': '找不到起運港代碼：XXX', 'category': 'warning'} in job['messages']
+    assert BaseRate.query.count() == 3
+
+    # 已完成的任務不能取消
+    job = client.post(f'/admin/import/jobs/{job_id}/cancel').get_json()['job']
+    assert job['status'] == 'completed'
+
+
+def test_import_job_runs_in_spawned_pool(pool_client):
+    buffer = io.BytesIO(rate_sheet().to_csv(index=False).encode('utf-8'))
+    resp = pool_client.post('/admin/import/rates', data={'file': (buffer, 'rates.csv')},
+                            content_type='multipart/form-data', headers={'Accept': 'application/json'})
+    assert resp.status_code == 202
+
+    job = wait_for_job(pool_client, resp.get_json()['job_id'])
+    assert job['status'] == 'completed', job['messages']
+    assert (job['rows_processed'], job['success_count'], job['error_count']) == (7, 4, 3)
+    db.session.expire_all()
+    assert BaseRate.query.count() == 3
+
+
+def test_import_recovers_from_killed_worker(pool_client, tmp_path, monkeypatch):
+    import signal
+    import tempfile
+    from src import jobs
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(uploads))
+
+    def upload():
+        buffer = io.BytesIO(rate_sheet().to_csv(index=False).encode('utf-8'))
+        resp = pool_client.post('/admin/import/rates', data={'file': (buffer, 'rates.csv')},
+                                content_type='multipart/form-data', headers={'Accept': 'application/json'})
+        assert resp.status_code == 202
+        return resp.get_json()['job_id']
+
+    # 唯一的子進程忙碌時被終止，排隊中的任務標記失敗並刪除臨時文件
+    broken = jobs._get_executor()
+    busy = broken.submit(time.sleep, 30)
+    job_id = upload()
+    for process in list(broken._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+    job = wait_for_job(pool_client, job_id)
+    assert job['status'] == 'failed'
+    assert list(uploads.iterdir()) == []
+    with pytest.raises(Exception):
+        busy.result()
+    assert jobs._executor is not broken
+
+    # 提交時進程池已損壞：重新建立後照常完成
+    broken = jobs._get_executor()
+    with pytest.raises(Exception):
+        broken.submit(os._exit, 1).result()
+    job = wait_for_job(pool_client, upload())
+    assert job['status'] == 'completed', job['messages']
+    assert jobs._executor is not broken
+    assert list(uploads.iterdir()) == []
+
+
+def test_import_job_cancel(client, tmp_path, monkeypatch):
+    from src import jobs
+    from src.models import ImportJob
+    path = str(tmp_path / 'rates.csv')
+    rate_sheet().to_csv(path, index=False)
+    monkeypatch.setitem(app.config, 'IMPORT_CHUNK_SIZE', 2)
+    job = ImportJob(kind='rates', filename='rates.csv', status='pending')
+    db.session.add(job)
+    db.session.commit()
+
+    # 第一塊處理完後收到取消請求
+    update_counts = jobs._update_counts
+    def cancel_after_first_chunk(job_id, result):
+        update_counts(job_id, result)
+        jobs.cancel_job(ImportJob.query.get(job_id))
+    monkeypatch.setattr(jobs, '_update_counts', cancel_after_first_chunk)
+    jobs._run_job(job.id, 'rates', path)
+
+    db.session.expire_all()
+    job = ImportJob.query.get(job.id)
+    assert job.status == 'cancelled'
+    assert job.rows_processed == 2
+    assert not os.path.exists(path)
+
+
+@pytest.mark.parametrize('extension', ['.csv', '.parquet', '.xlsx'])
+def test_run_file_streams_in_chunks(client, tmp_path, extension):
+    path = str(tmp_path / f'rates{extension}')
+    df = rate_sheet()
+    if extension == '.csv':
+        df.to_csv(path, index=False)
+    elif extension == '.parquet':
+        df.assign(基本運費=df['基本運費'].astype(str)).to_parquet(path, index=False)
+    else:
+        df.to_excel(path, index=False, engine='openpyxl')
+
+    chunks = []
+    result = RateImporter().run_file(path, chunk_size=2, progress=lambda r: chunks.append(r.rows_processed))
+
+    assert chunks == [2, 4, 6, 7]
+    assert (result.success_count, result.error_count) == (4, 3)
+    assert BaseRate.query.count() == 3
+
+
+def test_run_file_missing_column(client, tmp_path):
+    path = str(tmp_path / 'rates.csv')
+    rate_sheet().drop(columns='貨幣').to_csv(path, index=False)
+    with pytest.raises(MissingColumnError):
+        RateImporter().run_file(path)
+
+
+def test_schedule_import(client, tmp_path):
+    path = str(tmp_path / 'schedules.csv')
+    pd.DataFrame({
+        '起運港代碼': ['SHA', 'SHA', 'KHH', 'SHA'],
+        '目的港代碼': ['LAX', 'LAX', 'LAX', 'LAX'],
+        '船名': ['EVER', 'EVER', 'EVER', 'MAERSK'],
+        '航次': ['001E', '001E', '002E', '010W'],
+        '開航日期': ['2024-01-05', '2024-01-05', '2024-01-06', 'bad'],
+        '到達日期': ['2024-01-20', '2024-01-21', '2024-01-25', '2024-01-30'],
+    }).to_csv(path, index=False)
+    result = ScheduleImporter().run_file(path, chunk_size=3)
+
+    assert (result.success_count, result.error_count) == (2, 2)
+    assert ('找不到從KHH到LAX的航線', 'warning') in result.messages
+    schedule = VesselSchedule.query.one()
+    assert schedule.arrival_date == date(2024, 1, 21)
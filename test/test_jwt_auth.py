@@ -0,0 +1,95 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db, bcrypt
+from src.models import User, Port, ContainerType, Route, BaseRate, Booking
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['JWT_SECRET_KEY'] = 'test-jwt-secret-with-at-least-32-bytes'
+    app.config['GROUP_COMMIT_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        today = datetime.utcnow().date()
+        password = bcrypt.generate_password_hash('secret').decode('utf-8')
+        db.session.add_all([
+            User(username='customer', email='c@example.com', password=password, role='customer'),
+            User(username='admin', email='a@example.com', password=password, role='admin'),
+        ])
+        port_sha = Port(code='SHA', name='上海', country='CN', region='Asia')
+        port_lax = Port(code='LAX', name='洛杉磯', country='US', region='America')
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        db.session.add_all([port_sha, port_lax, ct_40hq])
+        db.session.flush()
+        route = Route(origin_port_id=port_sha.id, destination_port_id=port_lax.id, transit_time=15)
+        db.session.add(route)
+        db.session.flush()
+        db.session.add(BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=1000, currency='USD',
+                                effective_date=today - timedelta(days=10)))
+        db.session.commit()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+def api_login(client, username):
+    return client.post('/auth/api/login', json={'username': username, 'password': 'secret'}).get_json()
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_quote_and_booking_with_bearer_token(client):
+    tokens = api_login(client, 'customer')
+    headers = bearer(tokens['access_token'])
+    resp = client.post('/quote/get_rate', headers=headers,
+                       data={'origin_port': '1', 'destination_port': '2', 'container_type': '1'})
+    assert resp.get_json()['rate']['price'] == 1000
+    # 無狀態：不建立session
+    assert 'Set-Cookie' not in resp.headers
+
+    resp = client.post('/quote/book', headers=headers,
+                       json={'origin': 'SHA', 'destination': 'LAX', 'container_type': '40HQ'})
+    booking = db.session.get(Booking, resp.get_json()['booking_id'])
+    assert booking.user_id == 1
+
+    resp = client.post('/quote/process_ai_query', headers=headers, data={'query': '從上海到洛杉磯的40HQ'})
+    assert '1000' in resp.get_json()['response']
+
+
+def test_invalid_token_and_roles(client):
+    # 格式錯誤的令牌由 flask_jwt_extended 返回422
+    resp = client.post('/quote/get_rate', headers=bearer('not-a-token'), data={})
+    assert resp.status_code == 422
+    # 未帶令牌的瀏覽器請求仍跳轉登入頁
+    assert client.post('/quote/get_rate', data={}).status_code == 302
+
+    customer = api_login(client, 'customer')
+    assert client.get('/admin/api/rates', headers=bearer(customer['access_token'])).status_code == 403
+    admin = api_login(client, 'admin')
+    assert client.get('/admin/api/rates', headers=bearer(admin['access_token'])).status_code == 200
+    # 刷新令牌不能當作訪問令牌使用
+    assert client.get('/admin/api/rates', headers=bearer(admin['refresh_token'])).status_code == 422
+
+
+def test_refresh_flow(client):
+    tokens = api_login(client, 'customer')
+    resp = client.post('/auth/api/refresh', headers=bearer(tokens['refresh_token']))
+    access_token = resp.get_json()['access_token']
+    resp = client.post('/quote/get_rate', headers=bearer(access_token),
+                       data={'origin_port': '1', 'destination_port': '2', 'container_type': '1'})
+    assert resp.get_json()['success'] is True
+
+    # 角色變更在刷新後生效
+    User.query.filter_by(username='customer').update({'role': 'admin'})
+    db.session.commit()
+    access_token = client.post('/auth/api/refresh', headers=bearer(tokens['refresh_token'])).get_json()['access_token']
+    assert client.get('/admin/api/rates', headers=bearer(access_token)).status_code == 200
+
+    assert client.post('/auth/api/refresh', headers=bearer(tokens['access_token'])).status_code == 422
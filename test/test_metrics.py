@@ -0,0 +1,91 @@
+import io
+import logging
+import os
+import sys
+from datetime import datetime
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate
+from src import metrics
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['IMPORT_JOB_EXECUTOR'] = 'inline'
+    with app.app_context():
+        db.create_all()
+        port_sha = Port(code='SHA', name='上海', country='CN', region='Asia')
+        port_lax = Port(code='LAX', name='洛杉磯', country='US', region='America')
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        db.session.add_all([port_sha, port_lax, ct_40hq])
+        db.session.flush()
+        route = Route(origin_port_id=port_sha.id, destination_port_id=port_lax.id, transit_time=15)
+        db.session.add(route)
+        db.session.flush()
+        db.session.add(BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=1000, currency='USD',
+                                effective_date=datetime.utcnow().date()))
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['username'] = 'admin'
+            sess['role'] = 'admin'
+        yield client
+        db.session.remove()
+        db.drop_all()
+    app.config['SLOW_REQUEST_MS'] = 0
+
+
+def sample(text, name):
+    for line in text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0.0
+
+
+def test_request_and_sql_metrics(client):
+    before = sample(metrics.render(), 'sql_statements_total{endpoint="admin.api_rates"}')
+    count_name = 'http_request_duration_seconds_count{endpoint="admin.api_rates",method="GET"}'
+    requests_before = sample(metrics.render(), count_name)
+    for _ in range(3):
+        assert client.get('/admin/api/rates').status_code == 200
+
+    resp = client.get('/metrics')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain'
+    text = resp.get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in text
+    assert sample(text, count_name) == requests_before + 3
+    assert sample(text, 'http_requests_total{endpoint="admin.api_rates",method="GET",status="200"}') >= 3
+    assert sample(text, 'sql_statements_total{endpoint="admin.api_rates"}') >= before + 3
+    assert sample(text, 'sql_duration_seconds_total{endpoint="admin.api_rates"}') > 0
+    assert 'http_request_duration_seconds_bucket{endpoint="admin.api_rates",method="GET",le="+Inf"}' in text
+    assert 'quote_log_dropped_total' in text
+
+
+def test_import_rows_counted(client):
+    before = sample(metrics.render(), 'import_rows_total{kind="rates",outcome="success"}')
+    sheet = ('起運港代碼,目的港代碼,櫃型代碼,基本運費,貨幣,航程時間,生效日期\n'
+             'SHA,LAX,40HQ,1100,USD,15,2024-01-01\n'
+             'SHA,XXX,40HQ,1100,USD,15,2024-01-01\n').encode('utf-8')
+    resp = client.post('/admin/import/rates', data={'file': (io.BytesIO(sheet), 'rates.csv')},
+                       headers={'Accept': 'application/json'})
+    assert resp.status_code == 202
+    text = metrics.render()
+    assert sample(text, 'import_rows_total{kind="rates",outcome="success"}') == before + 1
+    assert sample(text, 'import_jobs_total{kind="rates",status="completed"}') >= 1
+
+
+def test_slow_request_logs_sql(client, caplog):
+    app.config['SLOW_REQUEST_MS'] = 0.001
+    with caplog.at_level(logging.WARNING, logger='src.metrics'):
+        client.get('/admin/api/rates')
+    messages = [record.getMessage() for record in caplog.records if record.name == 'src.metrics']
+    assert messages and 'admin.api_rates' in messages[0]
+    assert 'FROM base_rates' in messages[0]
@@ -0,0 +1,56 @@
+import os
+import sys
+import pytest
+from sqlalchemy import create_engine, inspect
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.migrations import upgrade, check_query_plans, MigrationError
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "legacy.db"}')
+    with app.app_context():
+        db.metadata.create_all(bind=engine)
+    # 模擬升級前沒有任何二級索引的數據庫
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.exec_driver_sql(f'DROP INDEX {index.name}')
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_creates_indexes(engine):
+    with app.app_context():
+        created = upgrade(engine)
+        assert 'uq_base_rates_route_container_effective' in created
+        assert upgrade(engine) == []
+    names = {index['name'] for index in inspect(engine).get_indexes('routes')}
+    assert 'uq_routes_origin_destination' in names
+
+
+def test_upgrade_refuses_duplicates(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO routes (origin_port_id, destination_port_id, transit_time) VALUES (1, 2, 10)")
+        conn.exec_driver_sql("INSERT INTO routes (origin_port_id, destination_port_id, transit_time) VALUES (1, 2, 12)")
+    with app.app_context():
+        with pytest.raises(MigrationError):
+            upgrade(engine)
+
+
+def test_quote_queries_use_indexes(engine):
+    with app.app_context():
+        upgrade(engine)
+        for name, index_name, plan, ok in check_query_plans(engine):
+            assert ok, f'{name} 未使用 {index_name}：{plan}'
+
+
+def test_upgrade_adds_missing_columns(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql('ALTER TABLE quote_queries DROP COLUMN latency_ms')
+    with app.app_context():
+        assert 'quote_queries.latency_ms' in upgrade(engine)
+    assert 'latency_ms' in {column['name'] for column in inspect(engine).get_columns('quote_queries')}
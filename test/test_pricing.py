@@ -0,0 +1,154 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate, Surcharge, RateSurcharge, ExchangeRate, Booking
+from src.pricing import surcharge_table, all_in_quote
+from src.fx import fx_table
+from src.documents import booking_document, render_pdf
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.app_context():
+        db.create_all()
+        today = datetime.utcnow().date()
+        port_sha = Port(code='SHA', name='上海', country='CN', region='Asia')
+        port_lax = Port(code='LAX', name='洛杉磯', country='US', region='America')
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        ct_20gp = ContainerType(code='20GP', name='20呎標準貨櫃', size='20GP', description='')
+        db.session.add_all([port_sha, port_lax, ct_40hq, ct_20gp])
+        db.session.flush()
+        route = Route(origin_port_id=port_sha.id, destination_port_id=port_lax.id, transit_time=15)
+        db.session.add(route)
+        db.session.flush()
+        rate = BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=1000, currency='USD',
+                        effective_date=today - timedelta(days=10))
+        plain_rate = BaseRate(route_id=route.id, container_type_id=ct_20gp.id, price=600, currency='USD',
+                              effective_date=today - timedelta(days=10))
+        baf = Surcharge(code='BAF', name='燃油附加費')
+        pss = Surcharge(code='PSS', name='旺季附加費')
+        thc = Surcharge(code='THC', name='碼頭操作費')
+        db.session.add_all([rate, plain_rate, baf, pss, thc])
+        db.session.flush()
+        db.session.add_all([
+            RateSurcharge(rate_id=rate.id, surcharge_id=baf.id, amount=100),
+            RateSurcharge(rate_id=rate.id, surcharge_id=pss.id, percentage=10),
+            RateSurcharge(rate_id=rate.id, surcharge_id=thc.id, amount=500, currency='CNY'),
+            ExchangeRate(currency='EUR', rate=1.1, effective_date=today - timedelta(days=30)),
+            ExchangeRate(currency='CNY', rate=0.14, effective_date=today - timedelta(days=30)),
+            # 未生效的匯率不應被使用
+            ExchangeRate(currency='CNY', rate=0.2, effective_date=today + timedelta(days=10)),
+        ])
+        db.session.commit()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+def login_session(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'tester'
+        sess['role'] = 'customer'
+
+
+def test_all_in_quote_breakdown(client):
+    quote = all_in_quote(1, 1000, 'USD')
+    assert quote['total'] == 1200
+    assert [item['code'] for item in quote['surcharges']] == ['BAF', 'PSS', 'THC']
+    assert quote['surcharges'][1] == {'code': 'PSS', 'name': '旺季附加費', 'amount': 100.0,
+                                      'currency': 'USD', 'percentage': 10.0}
+    # 外幣附加費單獨列出，不計入總額
+    assert quote['other_currency_charges'] == {'CNY': 500.0}
+    assert all_in_quote(2, 600, 'USD') == {'surcharges': [], 'total': 600.0, 'other_currency_charges': {}}
+
+
+def test_totals_vectorized_and_refreshed(client):
+    assert list(surcharge_table.totals([2, 1, 99], [600, 1000, 50])) == [600, 1200, 50]
+    db.session.add(RateSurcharge(rate_id=2, surcharge_id=1, amount=50))
+    db.session.commit()
+    assert list(surcharge_table.totals([2, 1], [600, 1000])) == [650, 1200]
+
+
+def test_quote_endpoints_include_all_in_total(client):
+    login_session(client)
+    resp = client.post('/quote/get_rate', data={'origin_port': '1', 'destination_port': '2', 'container_type': '1'})
+    rate = resp.get_json()['rate']
+    assert rate['price'] == 1000
+    # 外幣附加費換算後計入總額：1200 + 500 * 0.14
+    assert rate['total'] == 1270
+    assert rate['other_currency_charges'] == {}
+    assert len(rate['surcharges']) == 3
+
+    resp = client.post('/quote/get_rates', json={'items': [[1, 2, 1], [1, 2, 2]]})
+    results = resp.get_json()['results']
+    assert [result['rate']['total'] for result in results] == [1270, 600]
+
+    resp = client.post('/quote/process_ai_query', data={'query': '從上海到洛杉磯的40呎高櫃'})
+    html = resp.get_json()['response']
+    assert '燃油附加費' in html
+    # 外幣附加費換算為運費幣種後計入全包運費：1200 + 500 * 0.14
+    assert '全包運費：1270.0 USD' in html
+
+
+def test_ai_query_lists_unconvertible_surcharges(client):
+    login_session(client)
+    ExchangeRate.query.filter_by(currency='CNY').delete()
+    db.session.commit()
+    resp = client.post('/quote/process_ai_query', data={'query': '從上海到洛杉磯的40呎高櫃'})
+    assert '全包運費：1200.0 USD + 500.0 CNY' in resp.get_json()['response']
+    rate = client.post('/quote/get_rate', data={'origin_port': '1', 'destination_port': '2',
+                                                'container_type': '1'}).get_json()['rate']
+    assert (rate['total'], rate['other_currency_charges']) == (1200, {'CNY': 500})
+
+
+def test_booking_document_total_includes_other_currency_charges(client):
+    booking = Booking(user_id=1, origin_port='SHA', destination_port='LAX', container_type='40HQ')
+    db.session.add(booking)
+    db.session.commit()
+    rate = booking_document(booking)['rate']
+    assert (rate['total'], rate['other_currency_charges']) == (1270, [])
+
+    # 無匯率時總額不含外幣附加費，單獨列出而不標為全包
+    ExchangeRate.query.filter_by(currency='CNY').delete()
+    db.session.commit()
+    rate = booking_document(booking)['rate']
+    assert (rate['total'], rate['other_currency_charges']) == (1200, [('CNY', 500)])
+    assert render_pdf(booking_document(booking)).startswith(b'%PDF')
+
+
+def test_fx_convert_bulk(client):
+    today = datetime.utcnow().date()
+    converted = fx_table.convert([110, 100, 1000, 5], ['EUR', 'USD', 'CNY', 'JPY'], 'EUR', today)
+    assert [round(value, 2) for value in converted[:3]] == [110, 90.91, 127.27]
+    assert converted[3] != converted[3]  # 無匯率為 NaN
+    assert round(fx_table.convert([1000], ['CNY'], 'USD', today + timedelta(days=10))[0], 2) == 200
+
+
+def test_quotes_in_requested_currency(client):
+    login_session(client)
+    resp = client.post('/quote/get_rate', data={'origin_port': '1', 'destination_port': '2',
+                                               'container_type': '1', 'currency': 'eur'})
+    converted = resp.get_json()['rate']['converted']
+    # 外幣附加費換算後計入總額：(1200 + 500 * 0.14) / 1.1
+    assert converted == {'currency': 'EUR', 'price': 909.09, 'total': 1154.55}
+
+    resp = client.post('/quote/get_rate', data={'origin_port': '1', 'destination_port': '2',
+                                               'container_type': '1', 'currency': 'JPY'})
+    assert resp.get_json()['success'] is False
+
+    resp = client.post('/quote/get_rates', json={'items': [[1, 2, 1], [1, 2, 2], [2, 1, 1]],
+                                                 'currency': 'EUR', 'sort': 'total'})
+    results = resp.get_json()['results']
+    assert [result['container_type'] for result in results] == [2, 1, 1]
+    assert results[0]['rate']['converted']['total'] == 545.45
+    assert results[2]['success'] is False
+
+    resp = client.post('/quote/get_rates', json={'items': [[1, 2, 1]], 'sort': 'total'})
+    assert resp.status_code == 400
@@ -0,0 +1,122 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+from jinja2 import ChoiceLoader, DictLoader
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate, Surcharge, RateSurcharge, VesselSchedule
+
+# 代替頁面模板：按真實模板的方式遍歷關聯對象，觸發延遲加載時會超出語句預算
+TEMPLATES = {
+    'main/dashboard.html': (
+        '{{ port_count }} {{ route_count }} {{ rate_count }}'
+        '{% for rate in latest_rates %}{{ rate.route.origin_port.code }}-{{ rate.route.destination_port.code }}'
+        ' {{ rate.container_type.code }} {{ rate.price }}{% endfor %}'
+        '{% for schedule in latest_schedules %}{{ schedule.route.origin_port.name }} {{ schedule.vessel_name }}'
+        '{% endfor %}'
+    ),
+    'admin/rates.html': (
+        '{% for rate in rates %}{{ rate.route.origin_port.code }}-{{ rate.route.destination_port.code }}'
+        ' {{ rate.container_type.name }} {{ rate.price }} {{ rate.route.transit_time }}{% endfor %}{{ next_cursor }}'
+    ),
+    'admin/schedules.html': (
+        '{% for schedule in schedules %}{{ schedule.route.origin_port.name }}-{{ schedule.route.destination_port.name }}'
+        ' {{ schedule.vessel_name }} {{ schedule.voyage }}{% endfor %}{{ next_cursor }}'
+    ),
+}
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    loader = app.jinja_env.loader
+    app.jinja_env.loader = ChoiceLoader([DictLoader(TEMPLATES), loader])
+    with app.app_context():
+        db.create_all()
+        today = datetime.utcnow().date()
+        ports = [Port(code=code, name=name, country='XX', region='Asia')
+                 for code, name in [('SHA', '上海'), ('LAX', '洛杉磯'), ('KHH', '高雄'), ('RTM', '鹿特丹')]]
+        container_types = [ContainerType(code='20GP', name='20呎標準貨櫃', size='20', description=''),
+                           ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')]
+        surcharge = Surcharge(code='BAF', name='燃油附加費')
+        db.session.add_all(ports + container_types + [surcharge])
+        db.session.flush()
+        routes = [Route(origin_port_id=ports[0].id, destination_port_id=ports[i].id, transit_time=10 + i)
+                  for i in range(1, 4)]
+        db.session.add_all(routes)
+        db.session.flush()
+        for route in routes:
+            for container_type in container_types:
+                for days in (90, 30, 5):
+                    rate = BaseRate(route_id=route.id, container_type_id=container_type.id, price=1000 + days,
+                                    currency='USD', effective_date=today - timedelta(days=days))
+                    db.session.add(rate)
+                    db.session.flush()
+                    db.session.add(RateSurcharge(rate_id=rate.id, surcharge_id=surcharge.id, amount=50,
+                                                 currency='USD'))
+            for week in range(4):
+                departure = today + timedelta(days=7 * week + 1)
+                db.session.add(VesselSchedule(route_id=route.id, vessel_name='EVER', voyage=f'{route.id}{week}',
+                                              departure_date=departure,
+                                              arrival_date=departure + timedelta(days=route.transit_time)))
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['username'] = 'admin'
+            sess['role'] = 'admin'
+        yield client
+        db.session.remove()
+        db.drop_all()
+    app.jinja_env.loader = loader
+
+
+def test_get_rate_budget(client, query_budget):
+    lane = {'origin_port': 1, 'destination_port': 2, 'container_type': 2}
+    # 首次請求構建運費引擎（航線、運費）、附加費和船期索引
+    with query_budget(4, 'get_rate (cold)'):
+        assert client.post('/quote/get_rate', data=lane).get_json()['success']
+    with query_budget(0, 'get_rate'):
+        assert client.post('/quote/get_rate', data=dict(lane, destination_port=3)).get_json()['success']
+
+
+def test_process_ai_query_budget(client, query_budget):
+    # 另加港口比對器的港口和櫃型兩條語句
+    with query_budget(6, 'process_ai_query (cold)'):
+        assert '洛杉磯' in client.post('/quote/process_ai_query', data={'query': '上海到洛杉磯 40HQ'}).get_json()['response']
+    with query_budget(0, 'process_ai_query'):
+        assert '高雄' in client.post('/quote/process_ai_query', data={'query': '上海到高雄 20GP'}).get_json()['response']
+
+
+def test_dashboard_budget(client, query_budget):
+    with query_budget(3, 'dashboard (cold)'):
+        assert client.get('/dashboard').status_code == 200
+    with query_budget(0, 'dashboard'):
+        assert client.get('/dashboard').status_code == 200
+
+
+@pytest.mark.parametrize('path', ['/admin/rates', '/admin/schedules'])
+def test_admin_listing_budget(client, query_budget, path):
+    # 一頁的行及其航線、港口、櫃型在同一條語句中加載，與行數無關
+    with query_budget(1, path):
+        resp = client.get(path)
+    assert resp.status_code == 200
+    assert 'SHA' in resp.get_data(as_text=True) or '上海' in resp.get_data(as_text=True)
+    with query_budget(1, path + ' filtered'):
+        assert client.get(path, query_string={'destination_port': 2, 'limit': 2}).status_code == 200
+
+
+def test_budget_failure_lists_statements(client, query_budget):
+    budget = query_budget(0, 'lazy load')
+    with pytest.raises(pytest.fail.Exception) as excinfo:
+        with budget:
+            rate = BaseRate.query.first()
+            rate.route.origin_port.code
+    message = str(excinfo.value)
+    assert 'lazy load ran 3 SQL statements, budget is 0' in message
+    assert '1. SELECT' in message and 'FROM ports' in message
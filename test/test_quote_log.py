@@ -0,0 +1,97 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import User, Port, ContainerType, Route, BaseRate, QuoteQuery
+from src.quote_log import quote_log
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['QUOTE_LOG_ENABLED'] = True
+    # 測試中手動觸發寫入
+    app.config['QUOTE_LOG_FLUSH_INTERVAL'] = 3600
+    app.config['QUOTE_LOG_FLUSH_SIZE'] = 1000
+    with app.app_context():
+        db.create_all()
+        today = datetime.utcnow().date()
+        db.session.add(User(username='tester', email='t@example.com', password='x'))
+        port_sha = Port(code='SHA', name='上海', country='CN', region='Asia')
+        port_lax = Port(code='LAX', name='洛杉磯', country='US', region='America')
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        db.session.add_all([port_sha, port_lax, ct_40hq])
+        db.session.flush()
+        route = Route(origin_port_id=port_sha.id, destination_port_id=port_lax.id, transit_time=15)
+        db.session.add(route)
+        db.session.flush()
+        db.session.add(BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=1000, currency='USD',
+                                effective_date=today - timedelta(days=10)))
+        db.session.commit()
+        yield app.test_client()
+        quote_log.flush()
+        app.config['QUOTE_LOG_BUFFER_SIZE'] = 10000
+        db.session.remove()
+        db.drop_all()
+
+def login_session(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'tester'
+        sess['role'] = 'customer'
+
+
+def test_quotes_logged_in_bulk(client):
+    login_session(client)
+    client.post('/quote/get_rate', data={'origin_port': '1', 'destination_port': '2', 'container_type': '1'})
+    client.post('/quote/get_rate', data={'origin_port': '2', 'destination_port': '1', 'container_type': '1'})
+    client.post('/quote/process_ai_query', data={'query': '從上海到洛杉磯的40HQ'})
+    # 請求中不寫數據庫
+    assert QuoteQuery.query.count() == 0
+    assert quote_log.pending() == 3
+
+    assert quote_log.flush() == 3
+    rows = QuoteQuery.query.order_by(QuoteQuery.id).all()
+    assert [(row.origin_port_id, row.result_rate, row.result_currency) for row in rows] == [
+        (1, 1000, 'USD'), (2, None, None), (1, 1000, 'USD')]
+    assert all(row.latency_ms >= 0 for row in rows)
+
+
+def test_full_buffer_drops(client):
+    login_session(client)
+    app.config['QUOTE_LOG_BUFFER_SIZE'] = 2
+    dropped = quote_log.dropped
+    for _ in range(5):
+        client.post('/quote/get_rate', data={'origin_port': '1', 'destination_port': '2', 'container_type': '1'})
+    assert quote_log.pending() == 2
+    assert quote_log.dropped - dropped == 3
+
+
+@pytest.fixture
+def foreign_keys(client):
+    # 內存數據庫在測試間共用連接，結束後恢復 SQLite 默認設置
+    with db.engine.connect() as conn:
+        conn.execute(text('PRAGMA foreign_keys=ON'))
+    yield
+    with db.engine.connect() as conn:
+        conn.execute(text('PRAGMA foreign_keys=OFF'))
+
+
+def test_invalid_entry_does_not_discard_batch(client, foreign_keys):
+    login_session(client)
+    dropped = quote_log.dropped
+    for _ in range(5):
+        client.post('/quote/get_rate', data={'origin_port': '1', 'destination_port': '2', 'container_type': '1'})
+    # 不存在的目的港編號違反外鍵約束
+    client.post('/quote/get_rate', data={'origin_port': '1', 'destination_port': '99', 'container_type': '1'})
+    assert quote_log.pending() == 6
+
+    assert quote_log.flush() == 5
+    assert quote_log.dropped - dropped == 1
+    assert QuoteQuery.query.filter_by(result_rate=1000).count() == 5
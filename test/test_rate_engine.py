@@ -0,0 +1,102 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate, VesselSchedule
+from src.rate_engine import rate_engine
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.app_context():
+        db.create_all()
+        today = datetime.utcnow().date()
+        port_sha = Port(code='SHA', name='上海', country='CN', region='Asia')
+        port_lax = Port(code='LAX', name='洛杉磯', country='US', region='America')
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        db.session.add_all([port_sha, port_lax, ct_40hq])
+        db.session.flush()
+        route = Route(origin_port_id=port_sha.id, destination_port_id=port_lax.id, transit_time=15)
+        db.session.add(route)
+        db.session.flush()
+        db.session.add_all([
+            BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=900, currency='USD',
+                     effective_date=today - timedelta(days=60)),
+            BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=1000, currency='USD',
+                     effective_date=today - timedelta(days=10)),
+            # 已過期的較新運費不應被選中
+            BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=1100, currency='USD',
+                     effective_date=today - timedelta(days=5), expiry_date=today - timedelta(days=1)),
+            BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=1200, currency='USD',
+                     effective_date=today + timedelta(days=5)),
+        ])
+        db.session.commit()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+def login_session(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'tester'
+        sess['role'] = 'customer'
+
+
+def test_find_rate_skips_expired_and_future(client):
+    today = datetime.utcnow().date()
+    rate = rate_engine.find_rate(1, 2, 1, today)
+    assert rate.price == 1000
+    assert rate_engine.find_rate(1, 2, 1, today + timedelta(days=5)).price == 1200
+    assert rate_engine.find_rate(1, 2, 1, today - timedelta(days=61)) is None
+    assert rate_engine.find_rate(2, 1, 1, today) is None
+
+
+def test_engine_refreshes_after_commit(client):
+    today = datetime.utcnow().date()
+    assert rate_engine.find_rate(1, 2, 1, today).price == 1000
+    db.session.add(BaseRate(route_id=1, container_type_id=1, price=950, currency='USD',
+                            effective_date=today))
+    db.session.commit()
+    assert rate_engine.find_rate(1, 2, 1, today).price == 950
+
+
+def test_get_rate(client):
+    login_session(client)
+    resp = client.post('/quote/get_rate', data={'origin_port': '1', 'destination_port': '2', 'container_type': '1'})
+    data = resp.get_json()
+    assert data['success'] is True
+    assert data['rate']['price'] == 1000
+    assert data['rate']['transit_time'] == 15
+
+    resp = client.post('/quote/get_rate', data={'origin_port': '2', 'destination_port': '1', 'container_type': '1'})
+    assert resp.get_json()['message'] == '找不到匹配的航線'
+
+
+def test_get_rates_batch(client):
+    login_session(client)
+    today = datetime.utcnow().date()
+    db.session.add(VesselSchedule(route_id=1, vessel_name='EVER', voyage='001E',
+                                  departure_date=today + timedelta(days=3),
+                                  arrival_date=today + timedelta(days=18)))
+    db.session.commit()
+    resp = client.post('/quote/get_rates', json={'items': [
+        {'origin_port': 1, 'destination_port': 2, 'container_type': 1},
+        [2, 1, 1],
+        [1, 2, 99],
+        ['x', 2, 1],
+    ]})
+    data = resp.get_json()
+    assert data['success'] is True
+    first, reverse, no_rate, invalid = data['results']
+    assert first['success'] is True
+    assert first['rate']['price'] == 1000
+    assert first['schedules'][0]['voyage'] == '001E'
+    assert reverse['message'] == '找不到匹配的航線'
+    assert no_rate['message'] == '找不到有效的運費'
+    assert invalid['success'] is False
@@ -0,0 +1,197 @@
+import io
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate
+from src.rate_engine import rate_engine
+from src.rate_snapshot import RateSnapshot, SnapshotRoutes, publish, snapshot_file
+from src.data_version import data_version
+from src import jobs, metrics
+
+
+@pytest.fixture
+def client(tmp_path):
+    saved = {key: app.config[key] for key in ('DATA_VERSION_FILE', 'RATE_SNAPSHOT_FILE')}
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['IMPORT_JOB_EXECUTOR'] = 'inline'
+    app.config['DATA_VERSION_FILE'] = str(tmp_path / 'data_version')
+    app.config['RATE_SNAPSHOT_FILE'] = str(tmp_path / 'rates.snapshot')
+    with app.app_context():
+        db.create_all()
+        today = datetime.utcnow().date()
+        ports = [Port(code=code, name=code, country='XX', region='Asia') for code in ('SHA', 'LAX', 'KHH')]
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        db.session.add_all(ports + [ct_40hq])
+        db.session.flush()
+        db.session.add_all([Route(origin_port_id=1, destination_port_id=2, transit_time=15),
+                            Route(origin_port_id=3, destination_port_id=2, transit_time=18)])
+        db.session.flush()
+        db.session.add_all([
+            BaseRate(route_id=1, container_type_id=1, price=1000, currency='USD',
+                     effective_date=today - timedelta(days=10)),
+            BaseRate(route_id=1, container_type_id=1, price=1100, currency='USD',
+                     effective_date=today - timedelta(days=5), expiry_date=today - timedelta(days=1)),
+            BaseRate(route_id=1, container_type_id=1, price=1200, currency='USD',
+                     effective_date=today + timedelta(days=5)),
+            BaseRate(route_id=2, container_type_id=1, price=800, currency='EUR',
+                     effective_date=today - timedelta(days=1)),
+        ])
+        db.session.commit()
+        rate_engine.invalidate()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+    app.config.update(saved)
+    rate_engine.invalidate()
+
+
+def test_rate_engine_reads_published_snapshot_without_queries(client, query_budget):
+    today = datetime.utcnow().date()
+    expected = (rate_engine.find_rate(1, 2, 1, today), rate_engine.find_route(1, 2),
+                rate_engine.find_rate(1, 2, 1, today + timedelta(days=5)), rate_engine.find_rate(3, 2, 1, today))
+    assert not isinstance(rate_engine.current()[0], SnapshotRoutes)
+
+    publish()
+    # 發布後無需失效，下次讀取即切換到內存映射的快照
+    with query_budget(0):
+        routes, rates = rate_engine.current()
+        assert isinstance(routes, SnapshotRoutes)
+        assert (rate_engine.find_rate(1, 2, 1, today), rate_engine.find_route(1, 2),
+                rate_engine.find_rate(1, 2, 1, today + timedelta(days=5)),
+                rate_engine.find_rate(3, 2, 1, today)) == expected
+        assert rate_engine.find_route(1, 2).transit_time == 15
+        assert rate_engine.find_rate(1, 2, 1, today - timedelta(days=11)) is None
+        assert rate_engine.find_rate(2, 1, 1, today) is None
+        assert rate_engine.find_rate('abc', 2, 1, today) is None
+        assert sorted(routes) == [(1, 2), (3, 2)]
+        assert dict(rates.items()).keys() == {(1, 2, 1), (3, 2, 1)}
+
+
+def test_stale_snapshot_is_ignored(client):
+    today = datetime.utcnow().date()
+    publish()
+    BaseRate.query.filter_by(price=1000).update({'price': 950})
+    db.session.commit()
+
+    assert rate_engine.find_rate(1, 2, 1, today).price == 950
+    assert not isinstance(rate_engine.current()[0], SnapshotRoutes)
+
+
+def test_replaced_snapshot_keeps_old_mapping_readable(client):
+    path = app.config['RATE_SNAPSHOT_FILE']
+    publish()
+    old = RateSnapshot(path)
+    BaseRate.query.filter_by(route_id=2).delete()
+    Route.query.filter_by(id=2).delete()
+    db.session.commit()
+    publish()
+
+    assert (3, 2) in old.routes
+    assert (3, 2) not in snapshot_file.load().routes
+    assert old.columns['price'].tolist() == [1000.0, 1100.0, 1200.0, 800.0]
+
+
+def test_rate_import_publishes_snapshot(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    today = datetime.utcnow().date()
+    sheet = ('起運港代碼,目的港代碼,櫃型代碼,基本運費,貨幣,航程時間,生效日期\n'
+             f'KHH,SHA,40HQ,500,USD,3,{today:%Y-%m-%d}\n').encode('utf-8')
+    resp = client.post('/admin/import/rates', data={'file': (io.BytesIO(sheet), 'rates.csv')},
+                       content_type='multipart/form-data', headers={'Accept': 'application/json'})
+    assert resp.status_code == 202
+
+    assert isinstance(rate_engine.current()[0], SnapshotRoutes)
+    assert rate_engine.find_rate(3, 1, 1, today).price == 500
+
+
+@pytest.fixture
+def pool_client(tmp_path):
+    saved = {key: app.config[key] for key in ('DATA_VERSION_FILE', 'RATE_SNAPSHOT_FILE')}
+    app.config['TESTING'] = True
+    # 子進程無法訪問內存數據庫，使用臨時文件
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'pool.db'}"
+    app.config['IMPORT_JOB_EXECUTOR'] = 'process'
+    app.config['IMPORT_WORKERS'] = 1
+    app.config['DATA_VERSION_FILE'] = str(tmp_path / 'data_version')
+    app.config['RATE_SNAPSHOT_FILE'] = str(tmp_path / 'rates.snapshot')
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Port(code=code, name=code, country='XX', region='Asia') for code in ('SHA', 'LAX')]
+                           + [ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')])
+        db.session.commit()
+        rate_engine.invalidate()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['username'] = 'admin'
+            sess['role'] = 'admin'
+        yield client
+        if jobs._executor is not None:
+            jobs._executor.shutdown()
+            jobs._executor = None
+        db.session.remove()
+        db.drop_all()
+    app.config.update(saved)
+    app.config['IMPORT_JOB_EXECUTOR'] = 'inline'
+    rate_engine.invalidate()
+
+
+def test_pool_import_leaves_workers_on_snapshot(pool_client):
+    finished = metrics.IMPORT_JOBS._values.get(('rates', 'completed'), 0)
+    today = datetime.utcnow().date()
+    sheet = ('起運港代碼,目的港代碼,櫃型代碼,基本運費,貨幣,航程時間,生效日期\n'
+             f'SHA,LAX,40HQ,700,USD,15,{today:%Y-%m-%d}\n').encode('utf-8')
+    resp = pool_client.post('/admin/import/rates', data={'file': (io.BytesIO(sheet), 'rates.csv')},
+                            content_type='multipart/form-data', headers={'Accept': 'application/json'})
+    assert resp.status_code == 202
+
+    # 等待本進程的完成回調執行
+    deadline = time.monotonic() + 60
+    while metrics.IMPORT_JOBS._values.get(('rates', 'completed'), 0) == finished:
+        assert time.monotonic() < deadline, 'import job did not finish'
+        time.sleep(0.05)
+
+    assert snapshot_file.load().version() == tuple(data_version.current().tables[t] for t in ('routes', 'base_rates'))
+    assert isinstance(rate_engine.current()[0], SnapshotRoutes)
+    assert rate_engine.find_rate(1, 2, 1, today).price == 700
+
+
+def test_snapshot_from_recreated_data_version_is_ignored(client):
+    publish()
+    assert isinstance(rate_engine.current()[0], SnapshotRoutes)
+    # 數據版本文件被刪除重建：計數可能與舊快照相同，但 epoch 不同
+    os.unlink(app.config['DATA_VERSION_FILE'])
+    data_version.bump(['routes', 'base_rates'])
+    state = data_version.current()
+    assert snapshot_file.load().version() == (state.tables['routes'], state.tables['base_rates'])
+    assert snapshot_file.matching(state) is None
+    assert not isinstance(rate_engine.current()[0], SnapshotRoutes)
+
+
+def test_snapshot_trusted_for_at_most_ttl(client, monkeypatch):
+    from sqlalchemy import text
+    today = datetime.utcnow().date()
+    monkeypatch.setitem(app.config, 'RATE_ENGINE_TTL', 1)
+    publish()
+    assert rate_engine.find_rate(1, 2, 1, today).price == 1000
+    # 直接修改數據庫（如其他主機的導入）不會遞增本主機的數據版本
+    with db.engine.begin() as conn:
+        conn.execute(text('UPDATE base_rates SET price = 950 WHERE price = 1000'))
+    assert rate_engine.find_rate(1, 2, 1, today).price == 1000
+
+    # 超過 TTL 後從數據庫重新發布快照
+    time.sleep(1.1)
+    assert rate_engine.find_rate(1, 2, 1, today).price == 950
+    assert isinstance(rate_engine.current()[0], SnapshotRoutes)
+    assert snapshot_file.load().age() < 1
@@ -0,0 +1,96 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate
+from src.routing import route_graph, find_itineraries
+
+# (起運港, 目的港, 航程天數, 40HQ運費)
+LEGS = [
+    ('SHA', 'SIN', 5, 300),
+    ('SIN', 'RTM', 20, 1000),
+    ('SHA', 'HKG', 2, 200),
+    ('HKG', 'RTM', 25, 900),
+    ('HKG', 'SIN', 2, 50),
+    ('SHA', 'LAX', 15, 1000),
+]
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.app_context():
+        db.create_all()
+        today = datetime.utcnow().date()
+        ports = {code: Port(code=code, name=code, country='XX', region='Asia')
+                 for code in ('SHA', 'SIN', 'HKG', 'RTM', 'LAX')}
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        db.session.add_all(list(ports.values()) + [ct_40hq])
+        db.session.flush()
+        for origin, destination, transit_time, price in LEGS:
+            route = Route(origin_port_id=ports[origin].id, destination_port_id=ports[destination].id,
+                          transit_time=transit_time)
+            db.session.add(route)
+            db.session.flush()
+            db.session.add(BaseRate(route_id=route.id, container_type_id=ct_40hq.id, price=price,
+                                    currency='USD', effective_date=today - timedelta(days=1)))
+        db.session.commit()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+def login_session(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'tester'
+        sess['role'] = 'customer'
+
+def port_id(code):
+    return Port.query.filter_by(code=code).one().id
+
+def path(itinerary):
+    codes = {port.id: port.code for port in Port.query}
+    return [codes[itinerary['legs'][0]['origin_port']]] + [codes[leg['destination_port']] for leg in itinerary['legs']]
+
+
+def test_cheapest_and_fastest(client):
+    result = find_itineraries(port_id('SHA'), port_id('RTM'), 1, k=3)
+    assert [path(it) for it in result['cheapest']] == [
+        ['SHA', 'HKG', 'RTM'], ['SHA', 'HKG', 'SIN', 'RTM'], ['SHA', 'SIN', 'RTM']]
+    assert [it['total'] for it in result['cheapest']] == [1100, 1250, 1300]
+    assert [path(it) for it in result['fastest']][0] == ['SHA', 'HKG', 'SIN', 'RTM']
+    assert result['fastest'][0]['transit_time'] == 24
+
+    result = find_itineraries(port_id('SHA'), port_id('RTM'), 1, k=3, max_legs=2)
+    assert [path(it) for it in result['cheapest']] == [['SHA', 'HKG', 'RTM'], ['SHA', 'SIN', 'RTM']]
+    assert find_itineraries(port_id('RTM'), port_id('SHA'), 1) == {'cheapest': [], 'fastest': []}
+
+
+def test_graph_reprices_only_changed_legs(client):
+    legs = route_graph.current().legs
+    BaseRate.query.filter_by(price=900).update({'price': 2000})
+    db.session.commit()
+    updated = route_graph.current().legs
+    changed = [key for key in legs if updated[key] is not legs[key]]
+    assert len(changed) == 1 and updated[changed[0]].price == 2000
+    result = find_itineraries(port_id('SHA'), port_id('RTM'), 1, k=1)
+    assert path(result['cheapest'][0]) == ['SHA', 'HKG', 'SIN', 'RTM']
+
+
+def test_get_rate_offers_transshipment(client):
+    login_session(client)
+    resp = client.post('/quote/get_rate', data={'origin_port': port_id('SHA'), 'destination_port': port_id('RTM'),
+                                               'container_type': '1'})
+    data = resp.get_json()
+    assert data['success'] is False
+    assert data['itineraries'][0]['total'] == 1100
+
+    resp = client.post('/quote/itineraries', json={'origin_port': port_id('SHA'), 'destination_port': port_id('RTM'),
+                                                   'container_type': 1, 'k': 1})
+    data = resp.get_json()
+    assert len(data['cheapest']) == 1 and len(data['fastest']) == 1
@@ -0,0 +1,100 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from src.app import app, db
+from src.models import Port, ContainerType, Route, BaseRate, VesselSchedule, Booking
+from src.sailing_index import sailing_index
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.app_context():
+        db.create_all()
+        today = datetime.utcnow().date()
+        port_sha = Port(code='SHA', name='上海', country='CN', region='Asia')
+        port_lax = Port(code='LAX', name='洛杉磯', country='US', region='America')
+        port_rtm = Port(code='RTM', name='鹿特丹', country='NL', region='Europe')
+        ct_40hq = ContainerType(code='40HQ', name='40呎高櫃', size='40HQ', description='')
+        db.session.add_all([port_sha, port_lax, port_rtm, ct_40hq])
+        db.session.flush()
+        lax = Route(origin_port_id=port_sha.id, destination_port_id=port_lax.id, transit_time=15)
+        rtm = Route(origin_port_id=port_sha.id, destination_port_id=port_rtm.id, transit_time=30)
+        db.session.add_all([lax, rtm])
+        db.session.flush()
+        db.session.add(BaseRate(route_id=lax.id, container_type_id=ct_40hq.id, price=1000, currency='USD',
+                                effective_date=today - timedelta(days=10)))
+        # 洛杉磯每5天一班，第二班航程較長；鹿特丹每7天一班
+        for i in range(-2, 10):
+            db.session.add(VesselSchedule(route_id=lax.id, vessel_name='EVER', voyage=f'L{i:02d}',
+                                          departure_date=today + timedelta(days=5 * i),
+                                          arrival_date=today + timedelta(days=5 * i + (25 if i == 1 else 15))))
+        for i in range(5):
+            db.session.add(VesselSchedule(route_id=rtm.id, vessel_name='MSC', voyage=f'R{i:02d}',
+                                          departure_date=today + timedelta(days=7 * i + 1),
+                                          arrival_date=today + timedelta(days=7 * i + 31)))
+        db.session.commit()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+def login_session(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'tester'
+        sess['role'] = 'customer'
+
+
+def test_index_queries(client):
+    today = datetime.utcnow().date()
+    assert [s.voyage for s in sailing_index.next_departures(1, today, 3)] == ['L00', 'L01', 'L02']
+    assert [s.voyage for s in sailing_index.next_departures(1, today, 3, until=today + timedelta(days=5))] == \
+        ['L00', 'L01']
+    assert [s.voyage for s in sailing_index.window(1, today - timedelta(days=5), today + timedelta(days=4))] == \
+        ['L-1', 'L00']
+    # L01 開航較早但到達晚於 L02
+    assert [s.voyage for s in sailing_index.arriving_before(1, today + timedelta(days=25), departing_after=today)] == \
+        ['L00', 'L02']
+    assert sailing_index.next_departures(99, today, 3) == []
+
+
+def test_index_refreshes_after_commit(client):
+    today = datetime.utcnow().date()
+    db.session.add(VesselSchedule(route_id=1, vessel_name='ONE', voyage='X01', departure_date=today + timedelta(days=1),
+                                  arrival_date=today + timedelta(days=16)))
+    db.session.commit()
+    assert [s.voyage for s in sailing_index.next_departures(1, today, 2)] == ['L00', 'X01']
+
+
+def test_schedule_search_spans_routes(client):
+    login_session(client)
+    today = datetime.utcnow().date()
+    resp = client.get('/quote/schedules', query_string={
+        'origin_port': 1, 'date_to': (today + timedelta(days=8)).strftime('%Y-%m-%d')})
+    schedules = resp.get_json()['schedules']
+    assert [s['voyage'] for s in schedules] == ['L00', 'R00', 'L01', 'R01']
+    assert schedules[1]['destination_port'] == 3
+
+    resp = client.get('/quote/schedules', query_string={
+        'origin_port': 1, 'arrive_by': (today + timedelta(days=29)).strftime('%Y-%m-%d'), 'limit': 2})
+    assert [s['voyage'] for s in resp.get_json()['schedules']] == ['L00', 'L02']
+    assert client.get('/quote/schedules').status_code == 400
+    assert client.get('/quote/schedules', query_string={'origin_port': 1, 'limit': -1}).status_code == 400
+
+
+def test_quotes_use_sailing_index(client):
+    login_session(client)
+    resp = client.post('/quote/get_rate', data={'origin_port': '1', 'destination_port': '2', 'container_type': '1'})
+    assert [s['voyage'] for s in resp.get_json()['schedules']] == ['L00', 'L01', 'L02']
+
+    booking = Booking(user_id=1, origin_port='SHA', destination_port='LAX', container_type='40HQ')
+    db.session.add(booking)
+    db.session.commit()
+    resp = client.get(f'/quote/{booking.id}/pdf')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/pdf'
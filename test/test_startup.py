@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def test_app_import_does_not_load_import_or_pdf_libraries():
+    # 在新的解釋器中檢查，避免受其他測試已載入模塊的影響
+    probe = ('import sys, src.app\n'
+             'print(",".join(name for name in ("pandas", "reportlab") if name in sys.modules))')
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR, SECRET_KEY='x')
+    output = subprocess.run([sys.executable, '-c', probe], cwd=ROOT_DIR, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    assert output.strip().splitlines()[-1:] in ([], [''])